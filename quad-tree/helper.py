@@ -3,6 +3,7 @@ from quad_tree import Point
 import random
 from collections import namedtuple
 from matplotlib import pyplot
+from matplotlib.collections import LineCollection
 import geopandas as gpd
 import contextily as ctx
 from shapely.geometry import Point as MapPoint, box
@@ -55,40 +56,37 @@ def generate_random_points(x, x_range=(0, 100), y_range=(0, 100)):
         all_points.append(Point(x_coord, y_coord))
     return all_points
 
-def visualize(tree, xsize = 10, ysize = 10, title = "Quad Tree Visualization", save_plot = False, file_name = "plot.png"):
+def visualize(tree, xsize = 10, ysize = 10, title = "Quad Tree Visualization", save_plot = False, file_name = "plot.png", max_depth = None):
     """
     Can be used to Visulize the Quad Tree
-    """
-    def draw_all_nodes(node):
-        # Draw the points in the current node
-        for pnt in node.points:
-            pyplot.plot(pnt.x, pnt.y, ".", color = "black")
-
-        # Draw subdivision lines if node is divided
-        if any([node.ul, node.ur, node.ll, node.lr]):
-            draw_lines(node)
 
-        # Recursively draw children
-        if node.ul:
-            draw_all_nodes(node.ul)
-        if node.ur:
-            draw_all_nodes(node.ur)
-        if node.ll:
-            draw_all_nodes(node.ll)
-        if node.lr:
-            draw_all_nodes(node.lr)
+    All the points are drawn as one scatter & all the subdivision lines as one
+    LineCollection, so large trees render in seconds. `max_depth` (levels
+    below the root) stops drawing the subdivision lines of deeper nodes,
+    their points are still drawn.
+    """
+    xs, ys, segments = [], [], []
+    root_depth = tree._root.depth
 
-    def draw_lines(node):
-        bb = node.bounding_box
+    # Walk the tree once, gathering what to draw
+    stack = [tree._root]
+    while stack:
+        node = stack.pop()
+        for pnt in node.points:
+            xs.append(pnt.x)
+            ys.append(pnt.y)
 
-        # Draw horizontal line at center.y from min_x to max_x
-        pyplot.plot([bb.min_x, bb.max_x], [node.center.y, node.center.y], color="black", linewidth=0.5)
+        # Subdivision lines: horizontal at center.y, vertical at center.x
+        if node.divided and (max_depth is None or node.depth - root_depth <= max_depth):
+            bb = node.bounding_box
+            segments.append([(bb.min_x, node.center.y), (bb.max_x, node.center.y)])
+            segments.append([(node.center.x, bb.min_y), (node.center.x, bb.max_y)])
 
-        # Draw vertical line at center.x from min_y to max_y
-        pyplot.plot([node.center.x, node.center.x], [bb.min_y, bb.max_y], color="black", linewidth=0.5)
+        stack.extend(child for child in (node.ul, node.ur, node.ll, node.lr) if child)
 
     # Set up plot canvas
     pyplot.figure(figsize=(xsize, ysize))
+    ax = pyplot.gca()
 
     # Draw axis bounds from tree dimensions
     half_width = tree.width / 2
@@ -99,10 +97,10 @@ def visualize(tree, xsize = 10, ysize = 10, title = "Quad Tree Visualization", s
     max_y = tree.center.y + half_height
     pyplot.axis([min_x, max_x, min_y, max_y])
 
-    # Draw all nodes starting from root
-    draw_all_nodes(tree._root)
+    ax.add_collection(LineCollection(segments, colors="black", linewidths=0.5))
+    ax.scatter(xs, ys, s=36, marker=".", color="black", linewidths=0)
 
-    pyplot.gca().set_aspect('equal', adjustable='box')
+    ax.set_aspect('equal', adjustable='box')
     pyplot.subplots_adjust(left=0, right=1, top=1, bottom=0)  # Full use of plot area
     pyplot.margins(0, 0)
     pyplot.title(title)
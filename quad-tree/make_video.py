@@ -1,6 +1,8 @@
 # Re-import necessary modules and re-execute the hybrid approach code after reset
 import os
 import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 from datetime import datetime
@@ -26,55 +28,175 @@ def calculate_boundary(points, buffer_ratio=0.05):
     height = (max_y - min_y) * (1 + buffer_ratio)
     return Boundary(center=Point(x_center, y_center), width=width, height=height)
 
-# Re-define visualize and hybrid insertion
-import numpy as np
-from matplotlib import pyplot
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+# A frame is drawn from a snapshot of the tree: its points' coordinates & the
+# lines of its divided nodes, as `(x1, y1, x2, y2)` rows. The tree only grows,
+# so the snapshot of frame `i` is just how many of each existed by then.
 
-def visualize(tree, xsize=10, ysize=10, title="Quad Tree Visualization"):
+def split_lines(node):
+    bb = node.bounding_box
+    return [
+        (bb.min_x, node.center.y, bb.max_x, node.center.y),
+        (node.center.x, bb.min_y, node.center.x, bb.max_y),
+    ]
+
+def tree_snapshot(tree):
+    points = []
+    lines = []
+    stack = [tree._root]
+    while stack:
+        node = stack.pop()
+        points.extend((pnt.x, pnt.y) for pnt in node.points)
+        if node.divided:
+            lines.extend(split_lines(node))
+        stack.extend(child for child in (node.ul, node.ur, node.ll, node.lr) if child)
+    return np.array(points, dtype=np.float64).reshape(-1, 2), np.array(lines, dtype=np.float64).reshape(-1, 4)
+
+def new_split_lines(tree, point, seen):
+    # Only nodes on the inserted point's path can have just divided.
+    lines = []
+    node = tree._root
+    while node is not None and node.divided:
+        if id(node) not in seen:
+            seen.add(id(node))
+            lines.extend(split_lines(node))
+        node = getattr(node, node._quadrant(point))
+    return lines
+
+def tree_bounds(tree):
+    half_width = tree.width / 2
+    half_height = tree.height / 2
+    return (tree.center.x - half_width, tree.center.x + half_width,
+            tree.center.y - half_height, tree.center.y + half_height)
+
+def render_frame(points, lines, bounds, title, xsize=10, ysize=10):
     fig = pyplot.figure(figsize=(xsize, ysize))
     canvas = FigureCanvas(fig)
     ax = fig.add_subplot(111)
 
-    def draw_all_nodes(node):
-        for pnt in node.points:
-            ax.plot(pnt.x, pnt.y, ".", color="black")
-        if any([node.ul, node.ur, node.ll, node.lr]):
-            draw_lines(node)
-        for child in [node.ul, node.ur, node.ll, node.lr]:
-            if child:
-                draw_all_nodes(child)
-
-    def draw_lines(node):
-        bb = node.bounding_box
-        ax.plot([bb.min_x, bb.max_x], [node.center.y, node.center.y], color="black", linewidth=1.5)
-        ax.plot([node.center.x, node.center.x], [bb.min_y, bb.max_y], color="black", linewidth=1.5)
+    # One call for all the points & one for all the lines (NaN-separated)
+    ax.plot(points[:, 0], points[:, 1], ".", color="black")
+    if len(lines):
+        segments = np.full((len(lines), 3, 2), np.nan)
+        segments[:, 0] = lines[:, 0:2]
+        segments[:, 1] = lines[:, 2:4]
+        ax.plot(segments[:, :, 0].ravel(), segments[:, :, 1].ravel(), color="black", linewidth=1.5)
 
     # Set bounds and layout
-    half_width = tree.width / 2
-    half_height = tree.height / 2
-    min_x = tree.center.x - half_width
-    max_x = tree.center.x + half_width
-    min_y = tree.center.y - half_height
-    max_y = tree.center.y + half_height
-    ax.set_xlim(min_x, max_x)
-    ax.set_ylim(min_y, max_y)
+    ax.set_xlim(bounds[0], bounds[1])
+    ax.set_ylim(bounds[2], bounds[3])
     ax.set_aspect('equal', adjustable='box')
 
     ax.set_title(title, fontsize=12, pad=10)
     ax.tick_params(left=True, bottom=True, labelleft=True, labelbottom=True)  # Show frame, but no ticks
 
-    draw_all_nodes(tree._root)
-
     fig.tight_layout(pad=2.0)  # Ensure title isn't clipped
     canvas.draw()
 
-    image = np.frombuffer(canvas.tostring_rgb(), dtype='uint8')
-    image = image.reshape(canvas.get_width_height()[::-1] + (3,))
+    image = np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
     pyplot.close(fig)
     return image
 
-def visualize_insertion(points, capacity=4, fps=15, max_frames_in_memory=200):
+def visualize(tree, xsize=10, ysize=10, title="Quad Tree Visualization"):
+    points, lines = tree_snapshot(tree)
+    return render_frame(points, lines, tree_bounds(tree), title, xsize, ysize)
+
+class IncrementalRenderer:
+    """
+    Draws insertion frames on a persistent canvas, with matplotlib blitting.
+
+    The axes are drawn once; each frame then only draws its new points &
+    subdivision lines on top of the last one, and redraws the title, so a
+    frame costs the same however many points came before it. Frames look
+    like `render_frame`'s.
+    """
+
+    def __init__(self, bounds, xsize=10, ysize=10):
+        self.fig = pyplot.figure(figsize=(xsize, ysize))
+        self.canvas = FigureCanvas(self.fig)
+        self.ax = self.fig.add_subplot(111)
+        ax = self.ax
+
+        ax.set_xlim(bounds[0], bounds[1])
+        ax.set_ylim(bounds[2], bounds[3])
+        ax.set_aspect('equal', adjustable='box')
+        # Lay out with a title, so there's room for the real ones
+        ax.set_title("Title", fontsize=12, pad=10)
+        ax.tick_params(left=True, bottom=True, labelleft=True, labelbottom=True)
+        self.fig.tight_layout(pad=2.0)
+
+        # Animated artists are skipped by canvas.draw(), & drawn on demand
+        self.title = ax.title
+        self.title.set_animated(True)
+        self.points = ax.plot([], [], ".", color="black", animated=True)[0]
+        self.lines = ax.plot([], [], color="black", linewidth=1.5, animated=True)[0]
+
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        # Everything above the axes, where the title goes
+        top = self.fig.bbox.frozen()
+        top.y0 = ax.bbox.y1
+        self.title_background = self.canvas.copy_from_bbox(top)
+
+    def reset(self):
+        self.canvas.restore_region(self.background)
+
+    def add(self, points, lines):
+        if len(lines):
+            segments = np.full((len(lines), 3, 2), np.nan)
+            segments[:, 0] = lines[:, 0:2]
+            segments[:, 1] = lines[:, 2:4]
+            self.lines.set_data(segments[:, :, 0].ravel(), segments[:, :, 1].ravel())
+            self.ax.draw_artist(self.lines)
+        if len(points):
+            self.points.set_data(points[:, 0], points[:, 1])
+            self.ax.draw_artist(self.points)
+
+    def frame(self, title):
+        self.canvas.restore_region(self.title_background)
+        self.title.set_text(title)
+        self.ax.draw_artist(self.title)
+        return np.asarray(self.canvas.buffer_rgba())[:, :, :3].copy()
+
+    def close(self):
+        pyplot.close(self.fig)
+
+# Worker processes get the whole insertion once, then only frame ranges,
+# each rendered incrementally from the state before its first frame
+_insertion = None
+_renderer = None
+
+def _init_worker(insertion):
+    global _insertion
+    _insertion = insertion
+
+def _render_chunk(job):
+    global _renderer
+    start, stop = job
+    points, lines, bounds, point_counts, line_counts, titles = _insertion
+    if _renderer is None:
+        _renderer = IncrementalRenderer(bounds)
+
+    _renderer.reset()
+    point_count = point_counts[start - 1] if start else 0
+    line_count = line_counts[start - 1] if start else 0
+    _renderer.add(points[:point_count], lines[:line_count])
+
+    frames = []
+    for index in range(start, stop):
+        _renderer.add(points[point_count:point_counts[index]], lines[line_count:line_counts[index]])
+        point_count, line_count = point_counts[index], line_counts[index]
+        frames.append(_renderer.frame(titles[index]))
+    return frames
+
+def visualize_insertion(points, capacity=4, fps=15, max_frames_in_memory=200, processes=None):
+    """
+    Renders a video of the points being inserted one by one.
+
+    The tree is built first, recording a snapshot per frame. Runs of frames
+    are then rendered incrementally (see `IncrementalRenderer`) in a process
+    pool & written in order to a single video, with at most about
+    `max_frames_in_memory` frames rendering or waiting to be written.
+    """
     now = datetime.now()
     save_dir = now.strftime("%m%d%Y_%H%M%S") + "_" + (uuid.uuid4().hex[:5])
     save_path = os.path.join(os.getcwd(), save_dir)
@@ -83,48 +205,56 @@ def visualize_insertion(points, capacity=4, fps=15, max_frames_in_memory=200):
     boundary = calculate_boundary(points=points)
     qt = QuadTree(center=boundary.center, width=boundary.width, height=boundary.height, capacity=capacity)
 
-    frame_buffer = []
-    part_index = 0
-    video_parts = []
     title_template = "Inserting ({:.3f}, {:.3f}) in Quad Tree with Capacity {}. Total Points: {}"
-
-    for index, point in enumerate(tqdm(points, desc="Processing")):
+    coords = []
+    lines = []
+    seen = set()
+    line_counts = []
+    titles = []
+    for index, point in enumerate(points):
         qt.insert(point)
-        frame = visualize(tree=qt, title=title_template.format(point.x, point.y, capacity, index + 1))
-        frame_buffer.append(frame)
-
-        if len(frame_buffer) >= max_frames_in_memory:
-            height, width, _ = frame_buffer[0].shape
-            part_path = os.path.join(save_path, f"part_{part_index}.avi")
-            writer = cv2.VideoWriter(part_path, cv2.VideoWriter_fourcc(*'XVID'), fps, (width, height))
-            for frame in frame_buffer:
-                writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
-            writer.release()
-            video_parts.append(part_path)
-            frame_buffer.clear()
-            part_index += 1
-
-    if frame_buffer:
-        height, width, _ = frame_buffer[0].shape
-        part_path = os.path.join(save_path, f"part_{part_index}.avi")
-        writer = cv2.VideoWriter(part_path, cv2.VideoWriter_fourcc(*'XVID'), fps, (width, height))
-        for frame in frame_buffer:
-            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
-        writer.release()
-        video_parts.append(part_path)
+        coords.append((point.x, point.y))
+        lines.extend(new_split_lines(qt, qt.convert_to_point(point), seen))
+        line_counts.append(len(lines))
+        titles.append(title_template.format(point.x, point.y, capacity, index + 1))
+
+    insertion = (
+        np.array(coords, dtype=np.float64).reshape(-1, 2),
+        np.array(lines, dtype=np.float64).reshape(-1, 4),
+        tree_bounds(qt),
+        np.arange(1, len(points) + 1),
+        np.array(line_counts, dtype=np.int64),
+        titles,
+    )
+
+    # Enough runs in flight to keep every worker busy, within the frame budget
+    workers = processes or os.cpu_count() or 1
+    chunk = max(1, min(100, max_frames_in_memory // (2 * workers)))
+    max_chunks = max(1, max_frames_in_memory // chunk)
+    jobs = iter([(start, min(start + chunk, len(points))) for start in range(0, len(points), chunk)])
 
     final_video_path = os.path.join(save_path, "quadtree_insertion.avi")
-    final_writer = cv2.VideoWriter(final_video_path, cv2.VideoWriter_fourcc(*'XVID'), fps, (width, height))
-
-    for part in video_parts:
-        cap = cv2.VideoCapture(part)
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            final_writer.write(frame)
-        cap.release()
-
-    final_writer.release()
+    writer = None
+    pending = deque()
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(insertion,)) as pool:
+        with tqdm(total=len(points), desc="Rendering") as progress:
+            while True:
+                # Keep the queue full, then write the oldest run of frames
+                for job in jobs:
+                    pending.append(pool.submit(_render_chunk, job))
+                    if len(pending) >= max_chunks:
+                        break
+                if not pending:
+                    break
+
+                for frame in pending.popleft().result():
+                    if writer is None:
+                        height, width, _ = frame.shape
+                        writer = cv2.VideoWriter(final_video_path, cv2.VideoWriter_fourcc(*'XVID'), fps, (width, height))
+                    writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+                    progress.update()
+
+    if writer is not None:
+        writer.release()
 
     return final_video_path
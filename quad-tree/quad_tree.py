@@ -1,4 +1,20 @@
 import math
+import os
+import random
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+
+# Code shared with the R-tree lives in a sibling directory.
+_SHARED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared")
+if _SHARED not in sys.path:
+    sys.path.append(_SHARED)
+
+from knn_batch import all_nearest, best_first, morton_order  # noqa: E402,F401
 
 def euclidean_compare(ref_point, check_point):
     dx = max(ref_point.x, check_point.x) - min(ref_point.x, check_point.x)
@@ -8,6 +24,313 @@ def euclidean_compare(ref_point, check_point):
 def euclidean_distance(ref_point, check_point):
     return math.sqrt(euclidean_compare(ref_point, check_point))
 
+def euclidean_compare_bb(ref_point, bb):
+    dx = max(bb.min_x - ref_point.x, 0, ref_point.x - bb.max_x)
+    dy = max(bb.min_y - ref_point.y, 0, ref_point.y - bb.max_y)
+    return dx ** 2 + dy ** 2
+
+def euclidean_compare_bb_far(ref_point, bb):
+    dx = max(ref_point.x - bb.min_x, bb.max_x - ref_point.x)
+    dy = max(ref_point.y - bb.min_y, bb.max_y - ref_point.y)
+    return dx ** 2 + dy ** 2
+
+EARTH_RADIUS = 6371008.8
+
+# Below this many points, `QuadTree.build_parallel` lays the tree out in this
+# process: starting workers & shipping them the coordinates costs tens of
+# milliseconds, more than the build of a small tree.
+PARALLEL_MIN_POINTS = 100_000
+
+def haversine(theta):
+    return math.sin(theta / 2) ** 2
+
+def haversine_distance(ref_point, check_point):
+    """
+    Great-circle distance in metres between two lon/lat (X/Y) points.
+    """
+    lat1 = math.radians(ref_point.y)
+    lat2 = math.radians(check_point.y)
+    hav = haversine(lat2 - lat1) + math.cos(lat1) * math.cos(lat2) * haversine(
+        math.radians(check_point.x - ref_point.x)
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(1.0, hav)))
+
+def longitude_gap(lon, min_x, max_x):
+    """
+    Smallest longitude difference in degrees from `lon` to the longitudes
+    `min_x` to `max_x`, going either way around (across the antimeridian).
+    """
+    if (lon - min_x) % 360 <= max_x - min_x:
+        return 0.0
+    return min((min_x - lon) % 360, (lon - max_x) % 360)
+
+def longitude_gap_far(lon, min_x, max_x):
+    """
+    Largest longitude difference in degrees from `lon` to any longitude from
+    `min_x` to `max_x`, going the short way around. At most `180`, reached
+    when the opposite meridian is in range.
+    """
+    if (lon + 180 - min_x) % 360 <= max_x - min_x:
+        return 180.0
+    return max(min(gap % 360, -gap % 360) for gap in (min_x - lon, max_x - lon))
+
+def haversine_distance_bb(ref_point, bb):
+    """
+    Lower bound of the great-circle distance from a lon/lat point to a box.
+
+    The longitude gap wraps across the antimeridian, & is scaled by the
+    cosine of the box latitude furthest from the equator, where a degree of
+    longitude is shortest.
+    """
+    dlon = longitude_gap(ref_point.x, bb.min_x, bb.max_x)
+    dlat = max(bb.min_y - ref_point.y, 0, ref_point.y - bb.max_y)
+    cos_box = max(0.0, min(math.cos(math.radians(bb.min_y)), math.cos(math.radians(bb.max_y))))
+    hav = haversine(math.radians(dlat)) + math.cos(math.radians(ref_point.y)) * cos_box * haversine(
+        math.radians(dlon)
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(1.0, hav)))
+
+def haversine_distance_bb_far(ref_point, bb):
+    """
+    Upper bound of the great-circle distance from a lon/lat point to any
+    point of a box.
+    """
+    dlon = longitude_gap_far(ref_point.x, bb.min_x, bb.max_x)
+    dlat = min(180, max(ref_point.y - bb.min_y, bb.max_y - ref_point.y))
+    if bb.min_y <= 0 <= bb.max_y:
+        cos_box = 1.0
+    else:
+        cos_box = max(math.cos(math.radians(bb.min_y)), math.cos(math.radians(bb.max_y)))
+    hav = haversine(math.radians(dlat)) + math.cos(math.radians(ref_point.y)) * cos_box * haversine(
+        math.radians(dlon)
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(1.0, hav)))
+
+# `compare` ranks points, `compare_bb` / `compare_bb_far` bound a node from
+# below / above, all in the same units. `to_compare` turns a distance into
+# those units.
+Metric = namedtuple("Metric", ["compare", "compare_bb", "compare_bb_far", "to_compare"])
+
+METRICS = {
+    "euclidean": Metric(
+        euclidean_compare, euclidean_compare_bb, euclidean_compare_bb_far, lambda dist: dist ** 2
+    ),
+    "haversine": Metric(
+        haversine_distance, haversine_distance_bb, haversine_distance_bb_far, lambda dist: dist
+    ),
+}
+
+def get_metric(name):
+    if name not in METRICS:
+        raise ValueError(
+            "Unknown metric {!r}. Please use one of: {}".format(
+                name, " | ".join(METRICS)
+            )
+        )
+    return METRICS[name]
+
+def choose_capacity(capacities, times):
+    """
+    Picks the elbow of a capacity vs. time curve.
+
+    Past the elbow, bigger nodes stop paying for themselves. Only the
+    decreasing part of the curve (up to the fastest capacity) is considered,
+    as too-large nodes get slow again. The elbow is found as in `kneed`'s
+    Kneedle (convex, decreasing): with both axes scaled to `[0, 1]`, it's the
+    point furthest below the line joining the ends of the curve.
+
+    Args:
+        capacities (list): The capacities tried, in increasing order.
+        times (list): The time taken at each capacity.
+
+    Returns:
+        tuple: The chosen capacity & a short reason for choosing it.
+    """
+    fastest = int(np.argmin(times))
+    xs = np.asarray(capacities[:fastest + 1], dtype=np.float64)
+    ys = np.asarray(times[:fastest + 1], dtype=np.float64)
+
+    if len(xs) >= 3 and ys[0] > ys[-1]:
+        xs = (xs - xs[0]) / (xs[-1] - xs[0])
+        ys = (ys - ys[-1]) / (ys[0] - ys[-1])
+        below = (1 - xs) - ys
+        knee = int(np.argmax(below))
+
+        if below[knee] > 0:
+            return capacities[knee], (
+                "elbow of the timings ({:.4f}s, fastest was {} at {:.4f}s)".format(
+                    times[knee], capacities[fastest], times[fastest],
+                )
+            )
+
+    return capacities[fastest], "fastest capacity (the timings have no elbow)"
+
+def _partition_levels(xs, ys, order, starts, cx, cy, width, height, depth,
+                      capacity, max_depth, stop_depth=None, grown=None):
+    # Splits points into quadtree cells one level at a time, the way
+    # `QuadNode.insert` would (a cell divides once it holds more than
+    # `capacity` points, unless they all coincide or it is at `max_depth`).
+    # The cells of a level are numbered breadth-first; `order` holds the
+    # indices of their points, grouped by cell (in insertion order) from the
+    # offsets in `starts`.
+    #
+    # Returns flat arrays over the cells in breadth-first order: the bit mask
+    # of the quadrants each cell divides into (`0` for leaves), the number of
+    # points in each leaf & the leaves' point indices. Cells reached at
+    # `stop_depth` are left undecided & returned as `pending` instead.
+    #
+    # `grown` maps depths to the centers of the nodes `QuadNode.grow` added
+    # above a tree's first root, down to that root. They are divided whatever
+    # they hold, & their centers are taken as is, since growing up & dividing
+    # down don't round the same way.
+    masks, counts, leaf_orders = [], [], []
+
+    while len(cx) and (stop_depth is None or depth < stop_depth):
+        sizes = np.diff(np.append(starts, len(order)))
+        px = xs[order]
+        py = ys[order]
+
+        split = sizes > capacity
+        if depth >= max_depth:
+            split[:] = False
+        elif split.any():
+            # Cells of coincident points can't be separated by dividing.
+            full = starts[sizes > 0]
+            coincident = np.zeros(len(sizes), dtype=bool)
+            coincident[sizes > 0] = (
+                (np.minimum.reduceat(px, full) == np.maximum.reduceat(px, full))
+                & (np.minimum.reduceat(py, full) == np.maximum.reduceat(py, full))
+            )
+            split &= ~coincident
+
+        if grown and depth in grown:
+            x, y = grown[depth]
+            cell = int(np.argmin(np.abs(cx - x) + np.abs(cy - y)))
+            cx[cell] = x
+            cy[cell] = y
+            if depth < max(grown):
+                split[cell] = True
+
+        in_split = np.repeat(split, sizes)
+        leaf_orders.append(order[~in_split])
+        counts.append(np.where(split, 0, sizes))
+
+        cells = np.repeat(np.arange(len(sizes)), sizes)[in_split]
+        order = order[in_split]
+        px = px[in_split]
+        py = py[in_split]
+        # Quadrants are numbered in `QuadNode.QUADRANTS` order.
+        quadrants = (px >= cx[cells]).astype(np.int64) + 2 * (py < cy[cells])
+        keys = cells * 4 + quadrants
+        by_key = np.argsort(keys, kind="stable")
+        order = order[by_key]
+        keys, starts = np.unique(keys[by_key], return_index=True)
+
+        mask = np.zeros(len(sizes), dtype=np.uint8)
+        np.bitwise_or.at(mask, keys // 4, (1 << (keys % 4)).astype(np.uint8))
+        masks.append(mask)
+
+        parents = keys // 4
+        quadrants = keys % 4
+        cx = cx[parents] + np.where(quadrants % 2 == 0, -1, 1) * (width / 4)
+        cy = cy[parents] + np.where(quadrants < 2, 1, -1) * (height / 4)
+        width = width / 2
+        height = height / 2
+        depth += 1
+
+    pending = None
+    if len(cx):
+        pending = (order, starts, cx, cy, width, height, depth)
+
+    return (
+        np.concatenate(masks) if masks else np.zeros(0, dtype=np.uint8),
+        np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64),
+        np.concatenate(leaf_orders) if leaf_orders else np.zeros(0, dtype=np.int64),
+        pending,
+    )
+
+def _build_partition(task):
+    # Runs in a worker process: lays out the subtree of one cell from its
+    # points' coordinates. Only flat arrays go back to the parent.
+    xs, ys, center_x, center_y, width, height, depth, capacity, max_depth = task
+    masks, counts, order, _ = _partition_levels(
+        xs, ys, np.arange(len(xs)), np.zeros(1, dtype=np.int64),
+        np.array([center_x], dtype=np.float64), np.array([center_y], dtype=np.float64),
+        width, height, depth, capacity, max_depth,
+    )
+    index_type = np.int32 if len(xs) < 2 ** 31 else np.int64
+    return masks, counts.astype(index_type), order.astype(index_type)
+
+def _unpack_levels(node, masks, counts, order, points):
+    # Rebuilds the nodes laid out by `_partition_levels` under `node`, & returns
+    # the nodes left pending, in order.
+    queue = deque([node])
+    offset = 0
+
+    for mask, count in zip(masks.tolist(), counts.tolist()):
+        current = queue.popleft()
+        if mask:
+            current.divided = True
+            for bit, quadrant in enumerate(current.QUADRANTS):
+                if mask & (1 << bit):
+                    queue.append(current.get_child(quadrant))
+        elif count:
+            current.points = [points[i] for i in order[offset:offset + count].tolist()]
+            offset += count
+
+    return list(queue)
+
+
+class QueryStats(object):
+    """
+    Counts the work a query does, for `explain=True`.
+
+    Attributes:
+        nodes_visited (int): Nodes whose points or children were looked at.
+        nodes_pruned (int): Nodes skipped, as they can't hold a result.
+        points_tested (int): Points checked one by one against the query.
+        results (int): The number of results returned.
+        heap_pushes (int): Items pushed onto a priority queue (for kNN).
+        depth (int): The deepest level visited, relative to the root.
+    """
+
+    FIELDS = (
+        "nodes_visited", "nodes_pruned", "points_tested", "results",
+        "heap_pushes", "depth",
+    )
+
+    def __init__(self, root_depth=0):
+        """
+        Args:
+            root_depth (int): Optional. The `depth` of the node the query
+                starts at. Default is `0`.
+        """
+        self.root_depth = root_depth
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def __repr__(self):
+        return "<QueryStats: {}>".format(
+            ", ".join("{}={}".format(field, getattr(self, field)) for field in self.FIELDS)
+        )
+
+    def visit(self, node):
+        self.nodes_visited += 1
+        self.depth = max(self.depth, node.depth - self.root_depth)
+
+    @property
+    def pruning_ratio(self):
+        """
+        The share of the nodes looked at that were pruned.
+        """
+        seen = self.nodes_visited + self.nodes_pruned
+        return self.nodes_pruned / seen if seen else 0.0
+
+    def as_dict(self):
+        stats = {field: getattr(self, field) for field in self.FIELDS}
+        stats["pruning_ratio"] = self.pruning_ratio
+        return stats
+
 
 class Point(object):
     """
@@ -93,18 +416,61 @@ class BoundingBox(object):
             or other_bb.min_y > self.max_y
         )
 
+    def covers(self, other_bb):
+        return (
+            self.min_x <= other_bb.min_x
+            and other_bb.max_x <= self.max_x
+            and self.min_y <= other_bb.min_y
+            and other_bb.max_y <= self.max_y
+        )
+
+
+class Extent(BoundingBox):
+    """
+    An object with extent (like the envelope of a polygon or a line), for
+    storing in a `LooseQuadTree`.
+    """
+
+    def __init__(self, min_x, min_y, max_x, max_y, data=None):
+        """
+        Constructs an `Extent` object.
+
+        Args:
+            min_x (int|float): The minimum X coordinate.
+            min_y (int|float): The minimum Y coordinate.
+            max_x (int|float): The maximum X coordinate.
+            max_y (int|float): The maximum Y coordinate.
+            data (any): Optional. Corresponding data for the object. Default
+                is `None`.
+        """
+        super().__init__(min_x, min_y, max_x, max_y)
+        self.data = data
+
+        # The middle of the extent, which picks its quadrant in a node.
+        self.x = (min_x + max_x) / 2
+        self.y = (min_y + max_y) / 2
+
+    def __repr__(self):
+        return "<Extent: ({}, {}) to ({}, {})>".format(
+            self.min_x, self.min_y, self.max_x, self.max_y
+        )
+
 
 class QuadNode(object):
     POINT_CAPACITY = 4
+    MAX_DEPTH = 32
+    QUADRANTS = ("ul", "ur", "ll", "lr")
     point_class = Point
     bb_class = BoundingBox
 
-    def __init__(self, center, width, height, capacity=None):
+    def __init__(self, center, width, height, capacity=None, depth=0, max_depth=None):
         self.center = center
         self.width = width
         self.height = height
         self.points = []
 
+        # Children are created lazily, so a divided node may be missing some.
+        self.divided = False
         self.ul = None
         self.ur = None
         self.ll = None
@@ -113,7 +479,12 @@ class QuadNode(object):
         if capacity is None:
             capacity = self.POINT_CAPACITY
 
+        if max_depth is None:
+            max_depth = self.MAX_DEPTH
+
         self.capacity = capacity
+        self.depth = depth
+        self.max_depth = max_depth
         self.bounding_box = self._calc_bounding_box()
 
     def __repr__(self):
@@ -218,54 +589,113 @@ class QuadNode(object):
     def is_lr(self, point):
         return point.x >= self.center.x and point.y < self.center.y
 
-    def subdivide(self):
-        half_width = self.width / 2
-        half_height = self.height / 2
-        quarter_width = half_width / 2
-        quarter_height = half_height / 2
+    def can_subdivide(self, point):
+        """
+        Checks if a full node may subdivide to make room for a point.
 
-        ul_center = self.point_class(
-            self.center.x - quarter_width, self.center.y + quarter_height
-        )
-        self.ul = self.__class__(
-            ul_center, half_width, half_height, capacity=self.capacity
-        )
+        Nodes at `max_depth`, and nodes whose points (the new one included)
+        all share one coordinate, become overflow leaves instead & hold any
+        number of points, as subdividing would never separate them.
 
-        ur_center = self.point_class(
-            self.center.x + quarter_width, self.center.y + quarter_height
-        )
-        self.ur = self.__class__(
-            ur_center, half_width, half_height, capacity=self.capacity
-        )
+        Args:
+            point (Point): The point being inserted.
 
-        ll_center = self.point_class(
-            self.center.x - quarter_width, self.center.y - quarter_height
-        )
-        self.ll = self.__class__(
-            ll_center, half_width, half_height, capacity=self.capacity
+        Returns:
+            bool: `True` if the node should subdivide, otherwise `False`.
+        """
+        if self.depth >= self.max_depth:
+            return False
+
+        first = self.points[0]
+        if point.x != first.x or point.y != first.y:
+            return True
+
+        if len(self.points) > self.capacity:
+            # Already an overflow leaf of coincident points.
+            return False
+
+        return any(pnt.x != first.x or pnt.y != first.y for pnt in self.points)
+
+    def _quadrant(self, point):
+        if self.is_ul(point):
+            return "ul"
+        elif self.is_ur(point):
+            return "ur"
+        elif self.is_ll(point):
+            return "ll"
+        return "lr"
+
+    def _quadrant_center(self, quadrant):
+        quarter_width = self.width / 4
+        quarter_height = self.height / 4
+        x_sign = -1 if quadrant in ("ul", "ll") else 1
+        y_sign = 1 if quadrant in ("ul", "ur") else -1
+        return self.point_class(
+            self.center.x + x_sign * quarter_width,
+            self.center.y + y_sign * quarter_height,
         )
 
-        lr_center = self.point_class(
-            self.center.x + quarter_width, self.center.y - quarter_height
+    def get_child(self, quadrant):
+        """
+        Returns the child node of a quadrant, creating it on first use.
+
+        Args:
+            quadrant (str): One of `"ul"`, `"ur"`, `"ll"` or `"lr"`.
+
+        Returns:
+            QuadNode: The child node.
+        """
+        child = getattr(self, quadrant)
+
+        if child is None:
+            child = self.__class__(
+                self._quadrant_center(quadrant), self.width / 2, self.height / 2,
+                capacity=self.capacity, depth=self.depth + 1,
+                max_depth=self.max_depth,
+            )
+            setattr(self, quadrant, child)
+
+        return child
+
+    def grow(self, point):
+        """
+        Returns a new parent, twice the size of this node & extended toward a
+        point, with this node as one of its children.
+
+        No points are moved, so growing is cheap whatever the node holds.
+
+        Args:
+            point (Point): The point to grow toward.
+
+        Returns:
+            QuadNode: The new parent node.
+        """
+        x_sign = -1 if point.x < self.center.x else 1
+        y_sign = -1 if point.y < self.center.y else 1
+        center = self.point_class(
+            self.center.x + x_sign * self.width / 2,
+            self.center.y + y_sign * self.height / 2,
         )
-        self.lr = self.__class__(
-            lr_center, half_width, half_height, capacity=self.capacity
+        # Depths are kept relative to the original root, so `max_depth` still
+        # bounds the size of the smallest cells.
+        parent = self.__class__(
+            center, self.width * 2, self.height * 2, capacity=self.capacity,
+            depth=self.depth - 1, max_depth=self.max_depth,
         )
+        parent.divided = True
+        setattr(parent, parent._quadrant(self.center), self)
+        return parent
 
-        # Redistribute the points.
+    def subdivide(self):
+        # Redistribute the points. Children are only created for the
+        # quadrants that actually receive points.
         # Manually call `append` here, as calling `.insert()` creates an
         # infinite recursion situation.
         for pnt in self.points:
-            if self.is_ul(pnt):
-                self.ul.points.append(pnt)
-            elif self.is_ur(pnt):
-                self.ur.points.append(pnt)
-            elif self.is_ll(pnt):
-                self.ll.points.append(pnt)
-            else:
-                self.lr.points.append(pnt)
+            self.get_child(self._quadrant(pnt)).points.append(pnt)
 
         self.points = []
+        self.divided = True
 
     def insert(self, point):
         if not self.contains_point(point):
@@ -276,19 +706,12 @@ class QuadNode(object):
             )
 
         # Check to ensure we're not going to go over capacity.
-        if (len(self.points) + 1) > self.capacity:
+        if (len(self.points) + 1) > self.capacity and self.can_subdivide(point):
             # We're over capacity. Subdivide, then insert into the new child.
             self.subdivide()
 
-        if self.ul is not None:
-            if self.is_ul(point):
-                return self.ul.insert(point)
-            elif self.is_ur(point):
-                return self.ur.insert(point)
-            elif self.is_ll(point):
-                return self.ll.insert(point)
-            elif self.is_lr(point):
-                return self.lr.insert(point)
+        if self.divided:
+            return self.get_child(self._quadrant(point)).insert(point)
 
         # There are no child nodes & we're under capacity. Add it to `points`.
         self.points.append(point)
@@ -336,53 +759,445 @@ class QuadNode(object):
     def all_points(self):
         return list(iter(self))
 
-    def within_bb(self, bb):
+    def count(self, point):
+        found_node, _ = self.find_node(point)
+
+        if found_node is None:
+            return 0
+
+        return sum(
+            1 for pnt in found_node.points
+            if pnt.x == point.x and pnt.y == point.y
+        )
+
+    def within_bb(self, bb, stats=None):
+        # `stats` is an optional `QueryStats` to count the work into.
         points = []
 
         # If we don't intersect with the bounding box, return an empty list.
         if not self.bounding_box.intersects(bb):
+            if stats is not None:
+                stats.nodes_pruned += 1
             return points
 
+        if stats is not None:
+            stats.visit(self)
+            stats.points_tested += len(self.points)
+
         # Check if any of the points on this instance are within the BB.
         for pnt in self.points:
             if bb.contains(pnt):
                 points.append(pnt)
 
         if self.ul is not None:
-            points += self.ul.within_bb(bb)
+            points += self.ul.within_bb(bb, stats)
 
         if self.ur is not None:
-            points += self.ur.within_bb(bb)
+            points += self.ur.within_bb(bb, stats)
 
         if self.ll is not None:
-            points += self.ll.within_bb(bb)
+            points += self.ll.within_bb(bb, stats)
 
         if self.lr is not None:
-            points += self.lr.within_bb(bb)
+            points += self.lr.within_bb(bb, stats)
+
+        return points
+
+    def within_polygon(self, polygon):
+        # `polygon` must already be prepared (`shapely.prepare`).
+        bb = self.bounding_box
+        min_x, min_y, max_x, max_y = polygon.bounds
+        if bb.min_x > max_x or bb.max_x < min_x or bb.min_y > max_y or bb.max_y < min_y:
+            return []
+
+        node_box = shapely.box(bb.min_x, bb.min_y, bb.max_x, bb.max_y)
+        if not polygon.intersects(node_box):
+            return []
+
+        # The whole node is in the polygon's interior, so skip the per-point
+        # checks.
+        if polygon.contains_properly(node_box):
+            return self.all_points()
+
+        points = []
+        if self.points:
+            xs = np.fromiter((pnt.x for pnt in self.points), dtype=np.float64)
+            ys = np.fromiter((pnt.y for pnt in self.points), dtype=np.float64)
+            inside = shapely.contains_xy(polygon, xs, ys)
+            points = [pnt for pnt, keep in zip(self.points, inside) if keep]
+
+        for child in (self.ul, self.ur, self.ll, self.lr):
+            if child is not None:
+                points += child.within_polygon(polygon)
 
         return points
 
+    def within_radius(self, point, limit, metric=METRICS["euclidean"], stats=None):
+        # `limit` is in the metric's compare units (squared for euclidean).
+        # Prune on the true distance to the circle, not its bounding square.
+        if metric.compare_bb(point, self.bounding_box) > limit:
+            if stats is not None:
+                stats.nodes_pruned += 1
+            return []
+
+        if stats is not None:
+            stats.visit(self)
+
+        # The whole node is inside the circle, so skip the per-point checks.
+        if metric.compare_bb_far(point, self.bounding_box) <= limit:
+            return self.all_points()
+
+        if stats is not None:
+            stats.points_tested += len(self.points)
+
+        points = [
+            pnt for pnt in self.points
+            if metric.compare(point, pnt) <= limit
+        ]
+
+        for child in (self.ul, self.ur, self.ll, self.lr):
+            if child is not None:
+                points += child.within_radius(point, limit, metric, stats)
+
+        return points
+
+
+class LooseQuadNode(QuadNode):
+    """
+    A quadtree node for objects with extent (`Extent`).
+
+    Each node's bounds are enlarged by `LOOSENESS` around its cell, and an
+    object is stored on the deepest node whose loose bounds fully contain
+    it, so it's never duplicated across quadrants. Objects too big for any
+    child stay on the node, so `points` may be non-empty on divided nodes.
+    """
+    LOOSENESS = 2
+
+    def __init__(self, center, width, height, capacity=None, depth=0, max_depth=None):
+        super().__init__(
+            center, width, height, capacity=capacity, depth=depth, max_depth=max_depth
+        )
+        loose_width = self.width * self.LOOSENESS / 2
+        loose_height = self.height * self.LOOSENESS / 2
+        self.loose_bounding_box = self.bb_class(
+            min_x=self.center.x - loose_width,
+            min_y=self.center.y - loose_height,
+            max_x=self.center.x + loose_width,
+            max_y=self.center.y + loose_height,
+        )
+
+    def fits(self, extent):
+        """
+        Checks if an extent is within the loose bounds of the node, with its
+        middle inside the node's cell.
+
+        Args:
+            extent (Extent): The extent to check.
+
+        Returns:
+            bool: `True` if the node can store it, otherwise `False`.
+        """
+        return self.contains_point(extent) and self.loose_bounding_box.covers(extent)
+
+    def grow(self, point):
+        parent = super().grow(point)
+
+        # A root keeps anything with its middle inside it. Items too big for
+        # this node's loose bounds move up to the new parent.
+        kept = []
+        for extent in self.points:
+            if self.fits(extent):
+                kept.append(extent)
+            else:
+                parent.points.append(extent)
+
+        self.points = kept
+        return parent
+
+    def fits_quadrant(self, quadrant, extent):
+        """
+        Checks if a child would fit an extent, without creating the child.
+
+        Args:
+            quadrant (str): The quadrant of the extent's middle.
+            extent (Extent): The extent to check.
+
+        Returns:
+            bool: `True` if the child's loose bounds cover it.
+        """
+        center = self._quadrant_center(quadrant)
+        loose_width = self.width * self.LOOSENESS / 4
+        loose_height = self.height * self.LOOSENESS / 4
+        return (
+            center.x - loose_width <= extent.min_x
+            and extent.max_x <= center.x + loose_width
+            and center.y - loose_height <= extent.min_y
+            and extent.max_y <= center.y + loose_height
+        )
+
+    def subdivide(self):
+        # Items too big for their child's loose bounds stay here.
+        kept = []
+        for extent in self.points:
+            quadrant = self._quadrant(extent)
+            if self.fits_quadrant(quadrant, extent):
+                self.get_child(quadrant).points.append(extent)
+            else:
+                kept.append(extent)
+
+        self.points = kept
+        self.divided = True
+
+    def insert(self, extent):
+        if not self.fits(extent):
+            raise ValueError(
+                "Extent {} is not within this node ({} - {}).".format(
+                    extent, self.center, self.loose_bounding_box
+                )
+            )
+
+        # Unlike points, items may stay here after subdividing, so only
+        # subdivide once.
+        if (
+            not self.divided
+            and (len(self.points) + 1) > self.capacity
+            and self.can_subdivide(extent)
+        ):
+            self.subdivide()
+
+        if self.divided:
+            quadrant = self._quadrant(extent)
+            if self.fits_quadrant(quadrant, extent):
+                return self.get_child(quadrant).insert(extent)
+
+        self.points.append(extent)
+        return True
+
+    def _search(self, bb, matches):
+        if not self.loose_bounding_box.intersects(bb):
+            return []
+
+        extents = [extent for extent in self.points if matches(bb, extent)]
+
+        for child in (self.ul, self.ur, self.ll, self.lr):
+            if child is not None:
+                extents += child._search(bb, matches)
+
+        return extents
+
+    def within_bb(self, bb):
+        return self._search(bb, BoundingBox.covers)
+
+    def intersecting_bb(self, bb):
+        return self._search(bb, BoundingBox.intersects)
+
+
+class CompressedQuadNode(QuadNode):
+    """
+    A path-compressed quadtree node, for highly clustered data.
+
+    When the points of a quadrant would all keep falling into one
+    sub-quadrant (as with tight clusters in a huge extent), the chain of
+    single-child nodes is skipped: the quadrant links straight to the
+    smallest grid cell still enclosing its points. Cells stay aligned to the
+    regular quadtree grid, so `depth` is still the cell's level, but a child
+    may be much smaller than its quadrant.
+    """
+
+    def _sub_cell(self, center, width, height, point):
+        # The center of the quadrant of a cell containing `point`, split the
+        # same way as `is_ul` & friends.
+        quarter_width = width / 4
+        quarter_height = height / 4
+        if point.x < center.x:
+            x = center.x - quarter_width
+        else:
+            x = center.x + quarter_width
+        if point.y >= center.y:
+            y = center.y + quarter_height
+        else:
+            y = center.y - quarter_height
+        return self.point_class(x, y)
+
+    def _enclosing_cell(self, center, width, height, depth, points, max_depth):
+        # Walks down from a cell while all the points share a sub-cell. The
+        # points' bounding corners share one exactly when every point does.
+        low = self.point_class(min(p.x for p in points), min(p.y for p in points))
+        high = self.point_class(max(p.x for p in points), max(p.y for p in points))
+
+        while depth < max_depth:
+            low_cell = self._sub_cell(center, width, height, low)
+            high_cell = self._sub_cell(center, width, height, high)
+            if low_cell.x != high_cell.x or low_cell.y != high_cell.y:
+                break
+            center, width, height, depth = low_cell, width / 2, height / 2, depth + 1
+
+        return center, width, height, depth
+
+    def _make_child(self, center, width, height, depth, points):
+        if len(points) > self.capacity:
+            center, width, height, depth = self._enclosing_cell(
+                center, width, height, depth, points, self.max_depth
+            )
+
+        child = self.__class__(
+            center, width, height, capacity=self.capacity,
+            depth=depth, max_depth=self.max_depth,
+        )
+        child.points = points
+
+        # The points now span several quadrants of the child (unless capped).
+        if len(points) > self.capacity and depth < self.max_depth:
+            child.subdivide()
+
+        return child
+
+    def subdivide(self):
+        groups = {}
+
+        for pnt in self.points:
+            groups.setdefault(self._quadrant(pnt), []).append(pnt)
+
+        for quadrant, pnts in groups.items():
+            child = self._make_child(
+                self._quadrant_center(quadrant), self.width / 2, self.height / 2,
+                self.depth + 1, pnts,
+            )
+            setattr(self, quadrant, child)
+
+        self.points = []
+        self.divided = True
+
+    def _split_link(self, quadrant, point):
+        """
+        Inserts a node between this one & a compressed child that doesn't
+        contain `point`, at the smallest cell enclosing both.
+        """
+        child = getattr(self, quadrant)
+        center, width, height, depth = self._enclosing_cell(
+            self._quadrant_center(quadrant), self.width / 2, self.height / 2,
+            self.depth + 1, [point, child.center], child.depth - 1,
+        )
+
+        middle = self.__class__(
+            center, width, height, capacity=self.capacity,
+            depth=depth, max_depth=self.max_depth,
+        )
+        middle.divided = True
+        setattr(middle, middle._quadrant(child.center), child)
+
+        setattr(self, quadrant, middle)
+        return middle
+
+    def insert(self, point):
+        if not self.contains_point(point):
+            raise ValueError(
+                "Point {} is not within this node ({} - {}).".format(
+                    point, self.center, self.bounding_box
+                )
+            )
+
+        if not self.divided:
+            subdivide = (len(self.points) + 1) > self.capacity and self.can_subdivide(point)
+
+            # Subdividing with the new point included lets a whole
+            # overflowing group drop straight to its enclosing cell.
+            self.points.append(point)
+            if subdivide:
+                self.subdivide()
+
+            return True
+
+        quadrant = self._quadrant(point)
+        child = getattr(self, quadrant)
+        if child is None:
+            child = self.get_child(quadrant)
+        elif not child.contains_point(point):
+            child = self._split_link(quadrant, point)
+
+        return child.insert(point)
+
+    def find_node(self, point, searched=None):
+        if searched is None:
+            searched = []
+
+        if not self.contains_point(point):
+            return None, searched
+
+        # Walk down iteratively. A compressed child may not cover the whole
+        # quadrant, in which case this node is the deepest one containing it.
+        node = self
+        while True:
+            searched.append(node)
+            child = getattr(node, node._quadrant(point))
+            if child is None or not child.contains_point(point):
+                return node, searched
+
+            node = child
+
 
 class QuadTree(object):
     node_class = QuadNode
     point_class = Point
+    bb_class = BoundingBox
 
-    def __init__(self, center, width, height, capacity=None):
+    # Used by `capacity="auto"`.
+    AUTO_SAMPLE_SIZE = 2000
+    AUTO_CAPACITIES = (2, 4, 8, 16, 32, 64, 128, 256)
+    AUTO_QUERIES = 50
+    AUTO_REPEATS = 3
+
+    def __init__(
+        self, center=None, width=None, height=None, capacity=None,
+        max_depth=None, growable=False,
+    ):
         """
         Constructs a `QuadTree` object.
 
         Args:
-            center (tuple|Point): The center point of the quadtree.
-            width (int|float): The width of the point space.
-            height (int|float): The height of the point space.
-            capacity (int): Optional. The number of points per quad before
-                subdivision occurs. Default is `None`.
+            center (tuple|Point): Optional. The center point of the quadtree.
+                Default is `None` (the origin, or the first point inserted if
+                no size is given).
+            width (int|float): Optional. The width of the point space. Default
+                is `None` (a growable tree, starting `1` wide).
+            height (int|float): Optional. The height of the point space.
+                Default is `None` (a growable tree, starting `1` high).
+            capacity (int|str): Optional. The number of points per quad before
+                subdivision occurs, or `"auto"` to pick one from the first
+                `AUTO_SAMPLE_SIZE` points inserted (see `tune_capacity`).
+                Default is `None`.
+            max_depth (int): Optional. The deepest level that may subdivide.
+                Nodes at this depth (and nodes of coincident points) hold any
+                number of points. Default is `None` (`QuadNode.MAX_DEPTH`).
+            growable (bool): Optional. If `True`, inserting a point outside
+                the tree grows it, by adding roots twice the size above the
+                old one (see `grow_to`), so data can be streamed in without
+                knowing its extent. Default is `False`.
         """
+        # Without a size, there's no extent to fix, so grow to fit the data.
+        if width is None or height is None:
+            growable = True
+            width = width or 1
+            height = height or 1
+
         self.width = width
         self.height = height
         self.center = self.convert_to_point(center)
+        self.growable = growable
+        # A growable tree moves its first root onto the first point inserted.
+        self._placed = center is not None
+        # The outcome of `tune_capacity`, if it has run.
+        self.capacity_choice = None
+        # Points seen while waiting to tune an `"auto"` capacity.
+        self._sample = None
+
+        if capacity == "auto":
+            self._sample = []
+            capacity = None
+
         self._root = self.node_class(
-            self.center, self.width, self.height, capacity=capacity
+            self.center, self.width, self.height, capacity=capacity,
+            max_depth=max_depth,
         )
 
     def __repr__(self):
@@ -462,7 +1277,287 @@ class QuadTree(object):
         """
         pnt = self.convert_to_point(point)
         # pnt.data = data
-        return self._root.insert(pnt)
+        if self.growable:
+            self.grow_to(pnt)
+        inserted = self._root.insert(pnt)
+        self._collect_sample(pnt)
+        return inserted
+
+    def grow_to(self, point):
+        """
+        Grows the tree until a point is inside it.
+
+        Each step adds a root twice the size above the old one, extended
+        toward the point, with the old root as one of its children. No points
+        are moved or reinserted.
+
+        The grown-toward edges are kept open (points are only stored below
+        the root's maximum X & Y), so the points of an old root never sit on
+        the split lines of the roots above it.
+
+        Args:
+            point (Point): The point the tree needs to hold.
+        """
+        if not self._placed:
+            # Nothing has been stored yet, so just center the root on it.
+            self._placed = True
+            self.center = self.point_class(point.x, point.y)
+            self._root = self.node_class(
+                self.center, self.width, self.height,
+                capacity=self._root.capacity, max_depth=self._root.max_depth,
+            )
+
+        while not self._can_hold(point):
+            self._root = self._root.grow(point)
+
+        self.center = self._root.center
+        self.width = self._root.width
+        self.height = self._root.height
+
+    def _can_hold(self, point):
+        bb = self._root.bounding_box
+        return bb.min_x <= point.x < bb.max_x and bb.min_y <= point.y < bb.max_y
+
+    def _collect_sample(self, point):
+        if self._sample is None:
+            return
+
+        self._sample.append(point)
+
+        if len(self._sample) >= self.AUTO_SAMPLE_SIZE:
+            sample, self._sample = self._sample, None
+            self.tune_capacity(sample)
+
+    def tune_capacity(self, sample, capacities=None):
+        """
+        Picks a node capacity by timing a query mix on a sample, then
+        rebuilds the tree with it.
+
+        For each capacity, a tree is built from the sample & then queried
+        with `AUTO_QUERIES` bounding box searches (each a hundredth of the
+        tree's area) and as many 10-nearest-neighbor searches, all around
+        sample points. Each capacity keeps its best time of `AUTO_REPEATS`
+        runs, and the one at the elbow of those times is chosen (see
+        `choose_capacity`).
+
+        With `capacity="auto"`, this runs by itself once `AUTO_SAMPLE_SIZE`
+        points have been inserted. Until then, the default capacity is used.
+
+        Args:
+            sample (list): Points representative of the data.
+            capacities (list): Optional. The capacities to try, in increasing
+                order. Default is `None` (`AUTO_CAPACITIES`).
+
+        Returns:
+            dict: The chosen `capacity` & the `reason` for it, along with the
+                `capacities` tried & their `times`. Also kept as
+                `capacity_choice`.
+        """
+        capacities = list(capacities or self.AUTO_CAPACITIES)
+        max_depth = self._root.max_depth
+        rng = random.Random(0)
+        centers = [
+            self.point_class(pnt.x, pnt.y)
+            for pnt in rng.choices(sample, k=self.AUTO_QUERIES)
+        ]
+        half_width = self.width / 20
+        half_height = self.height / 20
+        boxes = [
+            self.bb_class(
+                pnt.x - half_width, pnt.y - half_height,
+                pnt.x + half_width, pnt.y + half_height,
+            )
+            for pnt in centers
+        ]
+
+        times = []
+        for capacity in capacities:
+            best = None
+            for _ in range(self.AUTO_REPEATS):
+                start = time.perf_counter()
+                trial = self.__class__(
+                    self.center, self.width, self.height, capacity=capacity,
+                    max_depth=max_depth,
+                )
+                for pnt in sample:
+                    trial.insert(pnt)
+                for bb in boxes:
+                    trial.within_bb(bb)
+                for pnt in centers:
+                    trial.nearest_neighbors(pnt, count=10)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            times.append(best)
+
+        capacity, reason = choose_capacity(capacities, times)
+
+        # Rebuild with the chosen capacity. The points were already inserted
+        # once, so they're known to fit.
+        points = list(self._root)
+        self._root = self.node_class(
+            self.center, self.width, self.height, capacity=capacity,
+            max_depth=max_depth,
+        )
+        for pnt in points:
+            self._root.insert(pnt)
+
+        self.capacity_choice = {
+            "capacity": capacity,
+            "reason": reason,
+            "capacities": capacities,
+            "times": times,
+        }
+        return self.capacity_choice
+
+    def build_parallel(self, points, processes=None, split_depth=None):
+        """
+        Builds the (empty) tree from many points at once, across processes.
+
+        The root is split into its quadrants `split_depth` levels deep in this
+        process. Each of those cells then gets its subtree laid out in a
+        worker process from its points' coordinates alone, & sent back as
+        flat arrays (the quadrants of each node & the points of each leaf).
+        Meanwhile, the `Point` objects are made here, & the nodes are then
+        made from the arrays. The resulting tree is the same as inserting the
+        points one at a time, in order.
+
+        Below `PARALLEL_MIN_POINTS` points, no workers are started & the
+        cells are laid out in this process.
+
+        Args:
+            points (list|numpy.ndarray): `Point` objects, `(x, y)` tuples, or
+                an `(n, 2)` array of coordinates.
+            processes (int): Optional. The number of worker processes, `1` to
+                build in this process. Default is `None` (`os.cpu_count()`).
+                Ignored for fewer than `PARALLEL_MIN_POINTS` points.
+            split_depth (int): Optional. How many levels to split before
+                handing cells to workers. Default is `None` (enough for about
+                four cells per process, to even out skewed data).
+
+        Returns:
+            int: The number of points inserted.
+        """
+        if self._root.points or self._root.divided:
+            raise ValueError("build_parallel() needs an empty tree.")
+
+        if isinstance(points, np.ndarray):
+            coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+            points = None
+        else:
+            points = [self.convert_to_point(pnt) for pnt in points]
+            coords = np.array([(pnt.x, pnt.y) for pnt in points], dtype=np.float64).reshape(-1, 2)
+
+        if len(coords) == 0:
+            return 0
+
+        xs = np.ascontiguousarray(coords[:, 0])
+        ys = np.ascontiguousarray(coords[:, 1])
+
+        def point_at(i):
+            if points is not None:
+                return points[i]
+            return self.point_class(float(xs[i]), float(ys[i]))
+
+        if self.growable:
+            # Grow toward each point that falls outside, in order, as
+            # inserting them would.
+            first = 0
+            while first < len(xs):
+                self.grow_to(point_at(first))
+                bb = self._root.bounding_box
+                outside = (
+                    (xs[first:] < bb.min_x) | (xs[first:] >= bb.max_x)
+                    | (ys[first:] < bb.min_y) | (ys[first:] >= bb.max_y)
+                )
+                first = first + int(np.argmax(outside)) if outside.any() else len(xs)
+        else:
+            bb = self._root.bounding_box
+            outside = (xs < bb.min_x) | (xs > bb.max_x) | (ys < bb.min_y) | (ys > bb.max_y)
+            if outside.any():
+                raise ValueError(
+                    "Point {} is not within this node ({} - {}).".format(
+                        point_at(int(np.argmax(outside))), self._root.center, bb
+                    )
+                )
+
+        if self._sample is not None:
+            sample = [point_at(i) for i in range(min(len(xs), self.AUTO_SAMPLE_SIZE))]
+            if len(sample) >= self.AUTO_SAMPLE_SIZE:
+                self._sample = None
+                self.tune_capacity(sample)
+            else:
+                self._sample.extend(sample)
+
+        if processes is None:
+            processes = os.cpu_count() or 1
+
+        if split_depth is None:
+            split_depth = 1
+            while 4 ** split_depth < 4 * processes:
+                split_depth += 1
+
+        root = self._root
+        # Roots added by growing sit above the first one, & are divided
+        # around it whatever they hold.
+        first_root = root
+        grown = {root.depth: (root.center.x, root.center.y)}
+        while first_root.divided:
+            first_root = next(
+                child for child in (first_root.ul, first_root.ur, first_root.ll, first_root.lr)
+                if child is not None
+            )
+            grown[first_root.depth] = (first_root.center.x, first_root.center.y)
+
+        masks, counts, order, pending = _partition_levels(
+            xs, ys, np.arange(len(xs)), np.zeros(1, dtype=np.int64),
+            np.array([root.center.x], dtype=np.float64),
+            np.array([root.center.y], dtype=np.float64),
+            root.width, root.height, root.depth, root.capacity,
+            root.max_depth, stop_depth=first_root.depth + split_depth,
+            grown=grown,
+        )
+
+        groups = []
+        tasks = []
+        if pending is not None:
+            cell_order, starts, cx, cy, width, height, depth = pending
+            groups = np.split(cell_order, starts[1:])
+            tasks = [
+                (xs[group], ys[group], cx[i], cy[i], width, height, depth,
+                 root.capacity, root.max_depth)
+                for i, group in enumerate(groups)
+            ]
+
+        executor = None
+        if processes > 1 and len(tasks) > 1 and len(xs) >= PARALLEL_MIN_POINTS:
+            executor = ProcessPoolExecutor(processes)
+            subtrees = executor.map(_build_partition, tasks)
+        else:
+            subtrees = map(_build_partition, tasks)
+
+        try:
+            # The workers run while the points are made.
+            if points is None:
+                points = [
+                    self.point_class(x, y) for x, y in zip(xs.tolist(), ys.tolist())
+                ]
+            cells = _unpack_levels(root, masks, counts, order, points)
+            for cell, group, (masks, counts, order) in zip(cells, groups, subtrees):
+                # Worker indices are local to the cell's points.
+                _unpack_levels(cell, masks, counts, group[order], points)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return len(points)
+
+    def _build_serial(self, points):
+        # `build_parallel()` for trees it can't lay out: one insert at a time.
+        if self._root.points or self._root.divided:
+            raise ValueError("build_parallel() needs an empty tree.")
+        if isinstance(points, np.ndarray):
+            points = points.tolist()
+        return sum(1 for pnt in points if self.insert(pnt))
 
     def find(self, point):
         """
@@ -478,21 +1573,88 @@ class QuadTree(object):
         pnt = self.convert_to_point(point)
         return self._root.find(pnt)
 
-    def within_bb(self, bb):
+    def count(self, point):
+        """
+        Counts the points stored at a coordinate.
+
+        Coincident points are all kept (in an overflow leaf), so this is
+        their multiplicity.
+
+        Args:
+            point (Point|tuple|None): The coordinate to count.
+
+        Returns:
+            int: The number of points at exactly that coordinate.
+        """
+        pnt = self.convert_to_point(point)
+        return self._root.count(pnt)
+
+    def within_bb(self, bb, explain=False):
         """
-        Checks if a bounding box is within the quadtree's bounding box.
+        Returns all the points inside a bounding box.
 
         Primarily for internal use, but stable API if you need it.
 
         Args:
-            bb (BoundingBox): The bounding box to check.
+            bb (BoundingBox): The bounding box to search.
+            explain (bool): Optional. If `True`, also count the work done.
+                Default is `False`.
 
         Returns:
-            bool: `True` if the bounding boxes intersect, otherwise `False`.
+            list|tuple: The `Point` objects inside the box. With `explain`,
+                a `(points, QueryStats)` pair.
         """
-        return self._root.within_bb(bb)
+        if not explain:
+            return self._root.within_bb(bb)
 
-    def nearest_neighbors(self, point, count=10):
+        stats = QueryStats(self._root.depth)
+        points = self._root.within_bb(bb, stats)
+        stats.results = len(points)
+        return points, stats
+
+    def within_polygon(self, polygon):
+        """
+        Returns all the points inside a polygon.
+
+        Nodes are classified against a prepared copy of the polygon: nodes
+        outside it are pruned, nodes inside its interior are returned without
+        checking each point, and only the points of nodes straddling its
+        boundary are tested (vectorized, with `shapely.contains_xy`).
+
+        Args:
+            polygon (shapely.Geometry): The (multi)polygon to search, in the
+                tree's coordinates.
+
+        Returns:
+            list: The `Point` objects inside the polygon (unsorted).
+        """
+        # Preparing is done in place & kept, so repeated queries with the
+        # same polygon reuse it.
+        shapely.prepare(polygon)
+        return self._root.within_polygon(polygon)
+
+    def within_radius(self, point, radius, metric="euclidean"):
+        """
+        Returns all the points within a distance of a given point.
+
+        Nodes are pruned by their true distance to the point, and nodes lying
+        entirely inside the circle are returned without checking each point.
+
+        Args:
+            point (Point|tuple|None): The center of the circle.
+            radius (int|float): The radius of the circle, in metres for the
+                `"haversine"` metric.
+            metric (str): Optional. `"euclidean"` (planar coordinates) or
+                `"haversine"` (lon/lat in degrees). Default is `"euclidean"`.
+
+        Returns:
+            list: The `Point` objects within the radius (unsorted).
+        """
+        pnt = self.convert_to_point(point)
+        metric = get_metric(metric)
+        return self._root.within_radius(pnt, metric.to_compare(radius), metric)
+
+    def nearest_neighbors(self, point, count=10, metric="euclidean", explain=False):
         """
         Returns the nearest points of a given point, sorted by distance
         (closest first).
@@ -504,13 +1666,27 @@ class QuadTree(object):
             point (Point): The desired location to search around.
             count (int): Optional. The number of neighbors to return. Default
                 is `10`.
+            metric (str): Optional. `"euclidean"` (planar coordinates) or
+                `"haversine"` (lon/lat in degrees, ranked in metres). Default
+                is `"euclidean"`.
+            explain (bool): Optional. If `True`, also count the work done.
+                Default is `False`.
 
         Returns:
-            list: The nearest `Point` neighbors.
+            list|tuple: The nearest `Point` neighbors. With `explain`, a
+                `(points, QueryStats)` pair.
         """
-       
+        if explain:
+            stats = QueryStats(self._root.depth)
+            nearest_results = self._nearest_neighbors(point, count, metric, stats)
+            stats.results = len(nearest_results)
+            return nearest_results, stats
 
+        return self._nearest_neighbors(point, count, metric)
+
+    def _nearest_neighbors(self, point, count, metric, stats=None):
         point = self.convert_to_point(point)
+        metric = get_metric(metric)
         nearest_results = []
 
         # Check to see if it's within our bounds first.
@@ -524,6 +1700,8 @@ class QuadTree(object):
         # is the opposite of nearby points.
         searched_nodes.reverse()
         seen_nodes = set()
+        # Track points by identity, as `Point` hashes by coordinate & would
+        # drop coincident points.
         seen_points = set()
 
         # From here, we'll work our way backwards out through the nodes.
@@ -532,38 +1710,351 @@ class QuadTree(object):
             seen_nodes.add(node)
             local_points = []
 
+            if stats is not None:
+                stats.visit(node)
+
             for pnt in node.all_points():
-                if pnt in seen_points:
+                if id(pnt) in seen_points:
                     continue
 
-                seen_points.add(pnt)
+                seen_points.add(id(pnt))
                 local_points.append(pnt)
 
+            if stats is not None:
+                stats.points_tested += len(local_points)
+
             local_points = sorted(
-                local_points, key=lambda lpnt: euclidean_compare(point, lpnt)
+                local_points, key=lambda lpnt: metric.compare(point, lpnt)
             )
             nearest_results.extend(local_points)
 
             if len(nearest_results) >= count:
                 break
 
-        # Slice off any extras.
-        nearest_results = nearest_results[:count]
-
         if len(seen_nodes) == len(searched_nodes):
-            # We've exhausted everything. Return what we've got.
+            # We've exhausted everything. Return what we've got, in order
+            # across all the nodes.
+            nearest_results = sorted(
+                nearest_results, key=lambda lpnt: metric.compare(point, lpnt)
+            )
             return nearest_results[:count]
 
-        search_radius = euclidean_distance(point, nearest_results[-1])
-        search_bb = BoundingBox(
-            point.x - search_radius,
-            point.y - search_radius,
-            point.x + search_radius,
-            point.y + search_radius,
-        )
-        bb_results = self._root.within_bb(search_bb)
+        # Slice off any extras. Each node's points are only sorted locally, so
+        # the search radius is the furthest of the ones we kept.
+        nearest_results = nearest_results[:count]
+        search_limit = max(metric.compare(point, pnt) for pnt in nearest_results)
+        radius_results = self._root.within_radius(point, search_limit, metric, stats)
         nearest_results = sorted(
-            bb_results, key=lambda lpnt: euclidean_compare(point, lpnt)
+            radius_results, key=lambda lpnt: metric.compare(point, lpnt)
+        )
+
+        return nearest_results[:count]
+
+    def _best_first_neighbors(self, query, count, bound=math.inf, stats=None, rank=None):
+        """
+        Finds the `count` nearest points of `query` with a best-first search,
+        pruning anything further than the squared distance `bound`.
+
+        Unlike `nearest_neighbors`, the query may lie outside the tree's
+        boundaries. Ties are ranked as in `knn_batch.best_first`.
+
+        Returns:
+            list: `(squared_distance, Point)` pairs, closest first.
+        """
+        def expand(node, query):
+            children = [child for child in (node.ul, node.ur, node.ll, node.lr) if child is not None]
+            if stats is not None:
+                stats.visit(node)
+                stats.points_tested += len(node.points)
+                stats.heap_pushes += len(children)
+            distances = [euclidean_compare(query, pnt) for pnt in node.points]
+            return distances, node.points, children
+
+        return best_first(
+            self._root, query, count,
+            lambda node, query: euclidean_compare_bb(query, node.bounding_box),
+            expand, bound, rank,
+        )
+
+    def all_nearest_neighbors(self, points, count=10, batch_size=None, rank=None):
+        """
+        Returns the nearest points of every point in a set of query points.
+
+        Queries are sorted in Morton (Z-order) & answered in batches of
+        spatially close queries, one tree traversal per batch (see
+        `knn_batch.all_nearest`).
+
+        Unlike `nearest_neighbors`, the query points may lie outside the
+        tree's boundaries.
+
+        Args:
+            points (iterable): The query points (`Point`, tuple or list).
+            count (int): Optional. The number of neighbors per query. Default
+                is `10`.
+            batch_size (int): Optional. The number of queries answered per
+                tree traversal. Default is `None`, which sizes batches from
+                the ratio of queries to tree points (dense queries share
+                candidates, sparse queries are searched one by one).
+            rank (callable): Optional. `Point` -> a number ordering points
+                at the same spot. Default is `None`. Ties in distance are
+                broken by x, then y, then `rank`.
+
+        Returns:
+            tuple: `(neighbors, distances)`, two NumPy arrays of shape
+                `(len(points), count)`, closest first. `neighbors` holds the
+                `Point` objects (`None` if the tree has fewer than `count`
+                points) & `distances` the euclidean distances (`inf` where
+                missing).
+        """
+        queries = [self.convert_to_point(pnt) for pnt in points]
+        query_xy = np.array([(q.x, q.y) for q in queries], dtype=np.float64)
+
+        return all_nearest(
+            query_xy, count, len(self),
+            lambda x, y, found, bound: self._best_first_neighbors(Point(x, y), found, bound, rank=rank),
+            lambda min_x, min_y, max_x, max_y: self._root.within_bb(
+                self.bb_class(min_x, min_y, max_x, max_y)
+            ),
+            batch_size, rank,
         )
 
-        return nearest_results[:count]
\ No newline at end of file
+    def _node_bounds(self, node):
+        # The region a node's items may occupy.
+        return node.bounding_box
+
+    def tree_stats(self):
+        """
+        Reports on the shape & health of the tree, in one iterative pass.
+
+        Fill factors are the points held over the capacity, averaged over the
+        leaves at each depth (overflow leaves go above `1`). Overlap is the
+        area shared by sibling nodes' regions, summed over every pair. Dead
+        space is the area of divided nodes not covered by any of their
+        children (quadrants never created). Bytes are the shallow sizes of the
+        nodes, their bounds & the points, not of the points' `data`.
+
+        Returns:
+            dict: `nodes`, `leaves`, `empty_nodes`, `points`, `height`,
+                `depth_histogram` & `fill_factor` (both by depth),
+                `overlap` (`total_area`, `pairs` & `by_depth`),
+                `dead_space`, `dead_space_ratio` & `bytes`.
+        """
+        root = self._root
+        depth_histogram = {}
+        fill_totals = {}
+        overlap_by_depth = {}
+        overlap_pairs = 0
+        empty_nodes = 0
+        leaves = 0
+        points = 0
+        dead_space = 0.0
+        used = 0
+
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            depth = node.depth - root.depth
+            depth_histogram[depth] = depth_histogram.get(depth, 0) + 1
+            points += len(node.points)
+
+            used += _shallow_size(node) + sys.getsizeof(node.points)
+            used += _shallow_size(node.center) + _shallow_size(node.bounding_box)
+            if node.bounding_box is not self._node_bounds(node):
+                used += _shallow_size(self._node_bounds(node))
+            for pnt in node.points:
+                used += _shallow_size(pnt)
+
+            children = [
+                child for child in (node.ul, node.ur, node.ll, node.lr)
+                if child is not None
+            ]
+            if not node.divided:
+                leaves += 1
+                if not node.points:
+                    empty_nodes += 1
+                fill, count = fill_totals.get(depth, (0.0, 0))
+                fill_totals[depth] = (fill + len(node.points) / node.capacity, count + 1)
+                continue
+
+            bounds = [self._node_bounds(child) for child in children]
+            for i in range(len(bounds)):
+                for j in range(i + 1, len(bounds)):
+                    shared = _bb_overlap(bounds[i], bounds[j])
+                    if shared > 0:
+                        overlap_pairs += 1
+                        overlap_by_depth[depth + 1] = overlap_by_depth.get(depth + 1, 0.0) + shared
+            # The quadrants tile their parent, so what they miss is dead.
+            covered = sum(_bb_area(child.bounding_box) for child in children)
+            dead_space += max(_bb_area(node.bounding_box) - covered, 0.0)
+            stack.extend(children)
+
+        root_area = _bb_area(root.bounding_box)
+        return {
+            "nodes": sum(depth_histogram.values()),
+            "leaves": leaves,
+            "empty_nodes": empty_nodes,
+            "points": points,
+            "height": max(depth_histogram),
+            "depth_histogram": dict(sorted(depth_histogram.items())),
+            "fill_factor": {
+                depth: fill / count for depth, (fill, count) in sorted(fill_totals.items())
+            },
+            "overlap": {
+                "total_area": sum(overlap_by_depth.values()),
+                "pairs": overlap_pairs,
+                "by_depth": dict(sorted(overlap_by_depth.items())),
+            },
+            "dead_space": dead_space,
+            "dead_space_ratio": dead_space / root_area if root_area else 0.0,
+            "bytes": used,
+        }
+
+
+def _shallow_size(obj):
+    # An object & its attribute dict, without following what they point to.
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+def _bb_area(bb):
+    return (bb.max_x - bb.min_x) * (bb.max_y - bb.min_y)
+
+def _bb_overlap(bb1, bb2):
+    dx = min(bb1.max_x, bb2.max_x) - max(bb1.min_x, bb2.min_x)
+    dy = min(bb1.max_y, bb2.max_y) - max(bb1.min_y, bb2.min_y)
+    return dx * dy if dx > 0 and dy > 0 else 0.0
+
+
+class LooseQuadTree(QuadTree):
+    """
+    A quadtree of objects with extent, built on `LooseQuadNode`.
+
+    Point-only queries (`within_radius`, `within_polygon`, nearest
+    neighbors) treat each extent as its middle point.
+    """
+    node_class = LooseQuadNode
+
+    def convert_to_extent(self, val, data=None):
+        """
+        Converts a value to an `Extent` object.
+
+        Args:
+            val (Extent|BoundingBox|tuple|list): The value to convert. Tuples
+                & lists are `(min_x, min_y, max_x, max_y)`.
+            data (any): Optional. Corresponding data for the object. Default
+                is `None`.
+
+        Returns:
+            Extent: An extent object.
+        """
+        if isinstance(val, Extent):
+            return val
+        elif isinstance(val, BoundingBox):
+            return Extent(val.min_x, val.min_y, val.max_x, val.max_y, data=data)
+        elif isinstance(val, (tuple, list)):
+            return Extent(*val, data=data)
+        else:
+            raise ValueError(
+                "Unknown data provided for extent. Please use one of: "
+                "quads.Extent | quads.BoundingBox | tuple | list"
+            )
+
+    def insert(self, extent, data=None):
+        """
+        Inserts an object with extent into the quadtree.
+
+        Args:
+            extent (Extent|BoundingBox|tuple|list): The object's bounds.
+            data (any): Optional. Corresponding data for the object, used when
+                `extent` isn't already an `Extent`. Default is `None`.
+
+        Returns:
+            bool: `True` if insertion succeeded, otherwise `False`.
+        """
+        extent = self.convert_to_extent(extent, data)
+        if self.growable:
+            self.grow_to(extent)
+        inserted = self._root.insert(extent)
+        self._collect_sample(extent)
+        return inserted
+
+    def _node_bounds(self, node):
+        return node.loose_bounding_box
+
+    def build_parallel(self, points, processes=None, split_depth=None):
+        """
+        Builds the (empty) tree from many objects at once.
+
+        Objects live at the depth their size fits, not where points would
+        split, so they're inserted one at a time, in this process.
+
+        Args:
+            points (list|numpy.ndarray): `Extent` objects, `BoundingBox`
+                objects, `(min_x, min_y, max_x, max_y)` tuples, or an `(n, 4)`
+                array of bounds.
+            processes (int): Unused, for compatibility with `QuadTree`.
+            split_depth (int): Unused, for compatibility with `QuadTree`.
+
+        Returns:
+            int: The number of objects inserted.
+        """
+        return self._build_serial(points)
+
+    def _can_hold(self, extent):
+        # The root's loose bounds must cover the whole object too.
+        return super()._can_hold(extent) and self._root.fits(extent)
+
+    def within_bb(self, bb):
+        """
+        Returns the objects lying entirely inside a bounding box.
+
+        Args:
+            bb (BoundingBox): The bounding box to search.
+
+        Returns:
+            list: The `Extent` objects, each returned once.
+        """
+        return self._root.within_bb(bb)
+
+    def intersecting_bb(self, bb):
+        """
+        Returns the objects overlapping a bounding box.
+
+        Args:
+            bb (BoundingBox): The bounding box to search.
+
+        Returns:
+            list: The `Extent` objects, each returned once.
+        """
+        return self._root.intersecting_bb(bb)
+
+
+class CompressedQuadTree(QuadTree):
+    """
+    A path-compressed quadtree, built on `CompressedQuadNode`.
+
+    Chains of nodes with a single occupied child are skipped, so lookups &
+    range searches cost in proportion to the occupied cells rather than the
+    precision of the coordinates. Useful for very skewed data, like dense
+    city clusters inside a large, mostly empty extent.
+    """
+    node_class = CompressedQuadNode
+
+    def build_parallel(self, points, processes=None, split_depth=None):
+        """
+        Builds the (empty) tree from many points at once.
+
+        Compressed links skip levels the parallel layout doesn't, so the
+        points are inserted one at a time, in this process.
+
+        Args:
+            points (list|numpy.ndarray): `Point` objects, `(x, y)` tuples, or
+                an `(n, 2)` array of coordinates.
+            processes (int): Unused, for compatibility with `QuadTree`.
+            split_depth (int): Unused, for compatibility with `QuadTree`.
+
+        Returns:
+            int: The number of points inserted.
+        """
+        return self._build_serial(points)
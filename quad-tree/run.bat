@@ -1,4 +1,6 @@
 python "quad-tree/test2.py"
 python "quad-tree/test3.py"
 python "quad-tree/test4.py"
-python "quad-tree/test5.py"
\ No newline at end of file
+python "quad-tree/test5.py"
+python "quad-tree/test6.py"
+python "quad-tree/test7.py"
\ No newline at end of file
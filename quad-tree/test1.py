@@ -3,16 +3,18 @@
 import make_video
 from helper import generate_random_points
 
-all_points = generate_random_points(
-    x = 100,
-    x_range = (-100, 100), 
-    y_range = (-100, 100)
-)
-save_path = make_video.visualize_insertion(
-    points = all_points, 
-    capacity = 4, 
-    fps = 5, 
-    max_frames_in_memory = 100
-)
+# Frames are rendered in worker processes, which import this file again
+if __name__ == "__main__":
+    all_points = generate_random_points(
+        x = 100,
+        x_range = (-100, 100), 
+        y_range = (-100, 100)
+    )
+    save_path = make_video.visualize_insertion(
+        points = all_points, 
+        capacity = 4, 
+        fps = 5, 
+        max_frames_in_memory = 100
+    )
 
-print("Saved at", save_path)
+    print("Saved at", save_path)
@@ -6,7 +6,7 @@
 import time
 import os
 import matplotlib.pyplot as plt
-from helper import generate_random_points
+from helper import generate_random_points, calculate_boundary
 from quad_tree import QuadTree, BoundingBox, Point
 
 def test_qt_insertion(sizes):
@@ -98,6 +98,76 @@ def test_qt_bounding_box(sizes, bb_half_size=15):
     plt.tight_layout()
     plt.savefig(os.path.join("plots", "qt_bounding_box_performance.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
 
+def test_qt_all_nearest_neighbors(sizes, query_count=50_000, neighbors_to_find=5):
+    loop_times = []
+    join_times = []
+    query_points = generate_random_points(query_count, (-100, 100), (-100, 100))
+
+    for size in sizes:
+        points = generate_random_points(size, (-100, 100), (-100, 100))
+        qt = QuadTree(center=(0, 0), width=200, height=200, capacity=4)
+        for pt in points:
+            qt.insert(pt)
+
+        start = time.perf_counter()
+        for q in query_points:
+            _ = qt.nearest_neighbors(q, neighbors_to_find)
+        loop_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        _ = qt.all_nearest_neighbors(query_points, neighbors_to_find)
+        join_times.append(time.perf_counter() - start)
+
+    plt.figure()
+    plt.plot(sizes, loop_times, label="Per-Query nearest_neighbors")
+    plt.plot(sizes, join_times, label="all_nearest_neighbors")
+    plt.xlabel("Number of Points")
+    plt.ylabel("Total Time (seconds)")
+    plt.title(f"QuadTree All-kNN Join Performance ({query_count} Queries)")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(os.path.join("plots", "qt_all_nearest_neighbors_performance.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
+
+def test_qt_all_nearest_neighbors_repeated_queries(runs=200, neighbors_to_find=5):
+    # Repeated & coincident queries (& data points) against a brute force scan
+    import numpy as np
+    for seed in range(runs):
+        rng = np.random.default_rng(seed)
+        points = generate_random_points(int(rng.integers(20, 300)), (-100, 100), (-100, 100))
+        points += points[:int(rng.integers(0, 10))]
+        queries = [points[i] for i in rng.integers(0, len(points), int(rng.integers(1, 200)))]
+        queries += queries[:20] + [Point(0, 0)] * 5
+        qt = QuadTree(center=(0, 0), width=200, height=200, capacity=4)
+        for pt in points:
+            qt.insert(pt)
+
+        _, distances = qt.all_nearest_neighbors(queries, neighbors_to_find)
+        xy = np.array([(pt.x, pt.y) for pt in points])
+        query_xy = np.array([(q.x, q.y) for q in queries])
+        expected = np.sort(np.sqrt(((query_xy[:, None] - xy[None]) ** 2).sum(axis=2)), axis=1)
+        assert np.allclose(distances, expected[:, :neighbors_to_find]), f"seed {seed}"
+
+def test_qt_haversine_antimeridian(size=3000, neighbors_to_find=5):
+    # Lon/lat queries near +-180 degrees, whose neighbors lie across the antimeridian
+    import random
+    from quad_tree import haversine_distance
+    rng = random.Random(0)
+    points = [Point(rng.uniform(-180, 180), rng.uniform(-80, 80)) for _ in range(size)]
+    qt = QuadTree(center=(0, 0), width=360, height=180, capacity=8)
+    for pt in points:
+        qt.insert(pt)
+
+    queries = [Point(177.1, 60.9), Point(-179.9, 0), Point(179.99, -45), Point(180, 10)]
+    queries += [Point(rng.choice((-1, 1)) * rng.uniform(170, 180), rng.uniform(-80, 80)) for _ in range(100)]
+    for query in queries:
+        expected = sorted(haversine_distance(query, pt) for pt in points)
+        found = qt.nearest_neighbors(query, neighbors_to_find, metric="haversine")
+        found = [haversine_distance(query, pt) for pt in found]
+        assert found == expected[:neighbors_to_find], f"query {query}"
+        radius = (expected[20] + expected[21]) / 2
+        assert len(qt.within_radius(query, radius, metric="haversine")) == 21, f"query {query}"
+
 from kneed import KneeLocator
 
 def test_qt_varying_capacity_with_elbow(fixed_size=100000, capacities=range(1, 1001, 50)):
@@ -130,6 +200,37 @@ def test_qt_varying_capacity_with_elbow(fixed_size=100000, capacities=range(1, 1
     plt.tight_layout()
     plt.savefig(os.path.join("plots", "qt_varying_capacity_with_elbow.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
 
+def test_qt_streaming_insertion(sizes):
+    # Boundary scan + fixed tree vs a growable tree fed in one pass
+    fixed_times = []
+    growable_times = []
+    for size in sizes:
+        points = generate_random_points(size, (-100, 100), (-100, 100))
+
+        start = time.perf_counter()
+        boundary = calculate_boundary(points)
+        qt = QuadTree(center=boundary.center, width=boundary.width, height=boundary.height, capacity=51)
+        for pt in points:
+            qt.insert(pt)
+        fixed_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        qt = QuadTree(capacity=51)
+        for pt in points:
+            qt.insert(pt)
+        growable_times.append(time.perf_counter() - start)
+
+    plt.figure()
+    plt.plot(sizes, fixed_times, label="Boundary Scan + Fixed Root")
+    plt.plot(sizes, growable_times, label="Growable Root")
+    plt.xlabel("Number of Points")
+    plt.ylabel("Total Time (seconds)")
+    plt.title("QuadTree Streaming Insertion Performance")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(os.path.join("plots", "qt_streaming_insertion_performance.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
+
 
 # Run All
 sizes = list(range(20, 500))  # You can adjust
@@ -137,4 +238,8 @@ test_qt_insertion(sizes)
 test_qt_point_search(sizes)
 test_qt_nearest_neighbors(sizes)
 test_qt_bounding_box(sizes)
+test_qt_all_nearest_neighbors_repeated_queries()
+test_qt_haversine_antimeridian()
+test_qt_all_nearest_neighbors([500, 1000, 2000, 5000, 10000])
+test_qt_streaming_insertion([1000, 5000, 10000, 50000])
 test_qt_varying_capacity_with_elbow()
@@ -0,0 +1,70 @@
+# QT Node Count and Memory, lazy vs eager child allocation
+# Parks in San Antonio and a clustered synthetic dataset
+
+import os
+import random
+import tracemalloc
+from helper import load_points_from_geojson, calculate_boundary
+from quad_tree import QuadTree, QuadNode, Point
+
+class EagerQuadNode(QuadNode):
+    # Creates all four children on every split, as subdivide used to.
+    def subdivide(self):
+        for quadrant in self.QUADRANTS:
+            self.get_child(quadrant)
+        super().subdivide()
+
+class EagerQuadTree(QuadTree):
+    node_class = EagerQuadNode
+
+def generate_clustered_points(size, clusters=20, spread=0.5, seed=0):
+    rng = random.Random(seed)
+    centers = [(rng.uniform(-100, 100), rng.uniform(-100, 100)) for _ in range(clusters)]
+    points = []
+    for _ in range(size):
+        cx, cy = rng.choice(centers)
+        x = min(max(rng.gauss(cx, spread), -100), 100)
+        y = min(max(rng.gauss(cy, spread), -100), 100)
+        points.append(Point(x, y))
+    return points
+
+def count_nodes(node):
+    total = 0
+    empty = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        total += 1
+        children = [child for child in (node.ul, node.ur, node.ll, node.lr) if child is not None]
+        if not children and not node.points:
+            empty += 1
+        stack.extend(children)
+    return total, empty
+
+def measure(tree_class, points, center, width, height, capacity):
+    tracemalloc.start()
+    qt = tree_class(center=center, width=width, height=height, capacity=capacity)
+    for pt in points:
+        qt.insert(pt)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nodes, empty = count_nodes(qt._root)
+    return nodes, empty, memory
+
+def compare(name, points, center, width, height, capacity=4):
+    print(f"{name}: {len(points)} points, capacity {capacity}")
+    for tree_class in (EagerQuadTree, QuadTree):
+        nodes, empty, memory = measure(tree_class, points, center, width, height, capacity)
+        print(f"  {tree_class.__name__:14} nodes {nodes:7} empty {empty:7} memory {memory / 1024:10.1f} KiB")
+
+def main():
+    geojson_file = os.path.join("..", "gis_data", "parks_sanantonio.geojson")
+    parks = load_points_from_geojson(geojson_file)
+    boundary = calculate_boundary(parks)
+    compare("Parks", parks, boundary.center, boundary.width, boundary.height)
+
+    clustered = generate_clustered_points(50000)
+    compare("Clustered", clustered, (0, 0), 200, 200)
+
+if __name__ == '__main__':
+    main()
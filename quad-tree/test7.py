@@ -0,0 +1,49 @@
+# QT Parallel Build
+# Point-by-point insertion vs build_parallel with 1, 2, 4, ... worker processes
+
+import os
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from quad_tree import QuadTree, Point
+
+def time_insert(coords, capacity):
+    points = [Point(x, y) for x, y in coords.tolist()]
+    start = time.perf_counter()
+    qt = QuadTree(center=(0, 0), width=200, height=200, capacity=capacity)
+    for pt in points:
+        qt.insert(pt)
+    return time.perf_counter() - start
+
+def time_parallel(coords, capacity, processes):
+    start = time.perf_counter()
+    qt = QuadTree(center=(0, 0), width=200, height=200, capacity=capacity)
+    qt.build_parallel(coords, processes=processes)
+    return time.perf_counter() - start
+
+def test_qt_parallel_build(size=1_000_000, capacity=4):
+    coords = np.random.default_rng(0).uniform(-100, 100, (size, 2))
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+
+    serial = time_insert(coords, capacity)
+    print(f"insert(): {serial:.2f}s")
+    times = []
+    for processes in counts:
+        times.append(time_parallel(coords, capacity, processes))
+        print(f"build_parallel({processes} processes): {times[-1]:.2f}s ({serial / times[-1]:.1f}x)")
+
+    plt.figure()
+    plt.plot(counts, times, marker="o", label="build_parallel")
+    plt.axhline(serial, color="gray", linestyle="--", label="insert()")
+    plt.xlabel("Processes")
+    plt.ylabel("Build Time (seconds)")
+    plt.title(f"QuadTree Parallel Build, {size} Points")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(os.path.join("plots", "qt_parallel_build.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
+
+if __name__ == '__main__':
+    test_qt_parallel_build()
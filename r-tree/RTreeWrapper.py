@@ -1,28 +1,174 @@
+import numpy as np
+import shapely
+import time
+
 import Rtree
 import rtreeBuilder
 import rtreeRange
 import rtreeNN
+import rtreeJoin
+import rtreeGeo
+import rtreeTune
+import rtreeStats
+import rtreeBulk
+
+# (node lower bound, distances to a leaf's children) for each metric; euclidean distances are squared
+METRICS = {
+    "euclidean": (rtreeNN.nDis, rtreeNN.leafDis),
+    "haversine": (lambda node, q: rtreeGeo.nearDis(node.range, q), rtreeGeo.leafDis),
+}
+
+def get_metric(metric):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {list(METRICS)}")
+    return METRICS[metric]
+
+# query results: (ident, x, y) for points, (ident, geometry) for entries with extent
+def as_result(p):
+    if isinstance(p, Rtree.Entry):
+        return (p.ident, p.geometry)
+    return (p.ident, p.x, p.y)
 
 class RTree:
     def __init__(self, B=25):
+        """B="auto" picks B from a sample of the first build (see tune_capacity)"""
         self.Bvalue = B
         self.root = None
+        self.size = 0
+        # the outcome of tune_capacity, if it has run
+        self.capacity_choice = None
+
+    def tune_capacity(self, items, capacities=None):
+        """Pick B by building a sample of items (Rtree.Point / Rtree.Entry) for each candidate
+        and timing a query mix of range searches and 10-nearest-neighbor searches on it
+        Each B keeps its best time of rtreeTune.REPEATS runs and the one at the elbow is chosen;
+        returns {capacity, reason, capacities, times}, also kept as capacity_choice"""
+        capacities = list(capacities or rtreeTune.CAPACITIES)
+        sample, boxes, centres = rtreeTune.queryMix(items)
+
+        times = []
+        for B in capacities:
+            best = float('inf')
+            for _ in range(rtreeTune.REPEATS):
+                start = time.perf_counter()
+                trial = RTree(B)
+                root = Rtree.Leaf(B, 1, sample[0])
+                for item in sample[1:]:
+                    root = rtreeBuilder.insert(root, item, B)
+                trial.root = root
+                for box in boxes:
+                    trial.range_search(box)
+                for centre in centres:
+                    trial.nearest_neighbors(centre, k=10)
+                best = min(best, time.perf_counter() - start)
+            times.append(best)
+
+        B, reason = rtreeTune.chooseB(capacities, times)
+        self.Bvalue = B
+        self.capacity_choice = {"capacity": B, "reason": reason, "capacities": capacities, "times": times}
+        return self.capacity_choice
 
     def build_from_points(self, points):
         if not points:
             raise ValueError("Cannot build from empty point list")
-            
-        for _, point in enumerate(points):
-            point = Rtree.Point(point)
+
+        points = [point if isinstance(point, Rtree.Point) else Rtree.Point(point) for point in points]
+        if self.Bvalue == "auto":
+            self.tune_capacity(points)
+
+        for point in points:
+            self.size += 1
             if self.root is None:
                 self.root = Rtree.Leaf(self.Bvalue, 1, point)
                 continue
             self.root = rtreeBuilder.insert(self.root, point, self.Bvalue)
 
-    def range_search(self, mbr):
-        return [(p.ident, p.x, p.y) for p in rtreeRange.rangeQuery(self.root, mbr)]
+    def bulk_load(self, points, processes=None):
+        """Build an empty tree from points in one go, by STR packing (see rtreeBulk) instead of inserting
+        them one by one: leaves are full and barely overlap, so the tree is smaller and faster to query
+        From rtreeBulk.PARALLEL_MIN_POINTS points, the vertical slices are sorted by processes workers
+        (None for all cores, 1 for none); the nodes are always made in this process, so a pool speeds up
+        the sort only. The tree is the same whatever processes is"""
+        if not points:
+            raise ValueError("Cannot build from empty point list")
+        if self.root is not None:
+            raise ValueError("bulk_load needs an empty tree")
+
+        points = [Rtree.Point(point) for point in points]
+        if self.Bvalue == "auto":
+            self.tune_capacity(points)
+
+        self.root = rtreeBulk.strPack(points, self.Bvalue, processes)
+        self.size = len(points)
+
+    def build_from_geometries(self, entries):
+        """Index (ident, shapely geometry) pairs by their MBRs, next to any points already indexed"""
+        if not entries:
+            raise ValueError("Cannot build from empty geometry list")
+
+        entries = [entry if isinstance(entry, Rtree.Entry) else Rtree.Entry(*entry) for entry in entries]
+        if self.Bvalue == "auto":
+            self.tune_capacity(entries)
+
+        for entry in entries:
+            self.size += 1
+            if self.root is None:
+                self.root = Rtree.Leaf(self.Bvalue, 1, entry)
+                continue
+            self.root = rtreeBuilder.insert(self.root, entry, self.Bvalue)
+
+    def range_search(self, mbr, explain=False):
+        """Points inside mbr [minx, maxx, miny, maxy], and entries whose geometry touches it
+        With explain=True, returns (results, rtreeStats.QueryStats) counting the work done"""
+        if not explain:
+            return [as_result(p) for p in rtreeRange.rangeQuery(self.root, mbr)]
+
+        stats = rtreeStats.QueryStats()
+        results = [as_result(p) for p in rtreeRange.rangeQuery(self.root, mbr, stats)]
+        stats.results = len(results)
+        return results, stats
+
+    def geometry_search(self, geometry):
+        """Points and entries intersecting a shapely geometry: MBR filter first, then an exact prepared test"""
+        if self.root is None:
+            return []
+        shapely.prepare(geometry)
+        minx, miny, maxx, maxy = geometry.bounds
+        return [as_result(p) for p in rtreeRange.geometryQuery(self.root, geometry, [minx, maxx, miny, maxy])]
+
+    def within_polygon(self, polygon):
+        """All points inside a shapely (multi)polygon, and entries whose whole geometry lies inside it
+        The polygon is prepared in place; nodes inside or outside it are classified at once
+        and only the children of boundary leaves are tested"""
+        if self.root is None:
+            return []
+        shapely.prepare(polygon)
+        return [as_result(p) for p in rtreeRange.polygonQuery(self.root, polygon)]
+
+    def within_radius(self, point, r, metric="euclidean"):
+        """All points within distance r of (x, y), pruning nodes by their true distance
+        With metric="haversine", (x, y) is (lon, lat) in degrees and r is in metres
+        Entries with extent match by their exact geometry distance (by their MBR centre for haversine)"""
+        get_metric(metric)
+        if self.root is None:
+            return []
+        if metric == "haversine":
+            points = rtreeGeo.radiusQuery(self.root, point, r)
+        elif rtreeRange.nearDis(self.root.range, point) > r**2:
+            points = []
+        else:
+            points = rtreeRange.radiusQuery(self.root, point, r**2)
+        return [as_result(p) for p in points]
+
+    def nearest_neighbors(self, query, k=1, metric="euclidean", explain=False):
+        """k nearest points of (x, y), closest first
+        With metric="haversine", (x, y) is (lon, lat) in degrees and points are ranked in metres
+        Entries with extent are ranked by their exact geometry distance (by their MBR centre for haversine)
+        Ties in distance are broken by x, then y, as in all_nearest_neighbors
+        With explain=True, returns (results, rtreeStats.QueryStats) counting the work done"""
+        node_dist, leaf_dist = get_metric(metric)
+        stats = rtreeStats.QueryStats() if explain else None
 
-    def nearest_neighbors(self, query, k=1):
         class SearchState:
             def __init__(self):
                 self.best = []
@@ -32,24 +178,52 @@ class RTree:
         
         def search(nodes):
             while nodes:
-                dist, node = nodes.pop(0)
+                dist, node, depth = nodes.pop(0)
                 if dist > state.max_dist:
+                    if stats is not None:
+                        stats.nodes_pruned += 1
                     continue
-                    
+
+                if stats is not None:
+                    stats.visit(depth)
                 if isinstance(node, Rtree.Leaf):
-                    for point in node.childList:
-                        point_dist = (point.x - query[0])**2 + (point.y - query[1])**2
-                        if point_dist < state.max_dist or len(state.best) < k:
-                            state.best.append((point_dist, point))
-                            state.best.sort()
-                            state.best = state.best[:k]
-                            state.max_dist = state.best[-1][0] if len(state.best) >= k else float('inf')
+                    if stats is not None:
+                        stats.points_tested += len(node.childList)
+                    dists = leaf_dist(node, query)
+                    closer = np.flatnonzero(dists <= state.max_dist)
+                    if len(closer):
+                        state.best.extend((dists[i], node.childList[i]) for i in closer)
+                        state.best.sort(key=lambda t: (t[0], t[1].x, t[1].y))
+                        state.best = state.best[:k]
+                        state.max_dist = state.best[-1][0] if len(state.best) >= k else float('inf')
                 else:
-                    nodes.extend((rtreeNN.nDis(child, query), child) for child in node.childList)
+                    if stats is not None:
+                        stats.heap_pushes += len(node.childList)
+                    nodes.extend((node_dist(child, query), child, depth + 1) for child in node.childList)
                     nodes.sort(key=lambda x: x[0])
         
-        search([(0, self.root)])
-        return [(p.ident, p.x, p.y) for _, p in state.best[:k]]
+        search([(0, self.root, 0)])
+        results = [as_result(p) for _, p in state.best[:k]]
+        if stats is None:
+            return results
+        stats.results = len(results)
+        return results, stats
+
+    def tree_stats(self):
+        """Depth histogram, fill factor per depth, empty nodes, sibling MBR overlap, dead space and bytes used,
+        in one pass over the tree (see rtreeStats.treeStats)"""
+        return rtreeStats.treeStats(self.root, self.Bvalue)
+
+    def all_nearest_neighbors(self, queries, k=1, batch_size=None):
+        """k nearest neighbors of every (x, y) query, as (idents, distances) arrays of shape (n, k)"""
+        return rtreeNN.allKNN(self.root, queries, k, self.size, batch_size)
+
+    def nearest_neighbors_batch(self, queries, k=1, batch_size=None, rank=None):
+        """k nearest points of every (x, y) query, each as nearest_neighbors would return them
+        (see all_nearest_neighbors); entries are ranked by their MBR centre here
+        rank(point) orders points at the same spot (by default, the order they are found in)"""
+        points, _ = rtreeNN.allKNNPoints(self.root, queries, k, self.size, batch_size, rank)
+        return [[as_result(p) for p in row if p is not None] for row in points]
 
     def point_query(self, point, epsilon=1e-6):
         """Find exact point using tiny range"""
@@ -58,4 +232,10 @@ class RTree:
             point[0] + epsilon,
             point[1] - epsilon,
             point[1] + epsilon
-        ])  
\ No newline at end of file
+        ])
+
+def spatial_join(tree_a, tree_b, distance):
+    """Stream all (a, b) pairs from two R-trees lying within distance of each other
+    Entries with extent are paired by the exact distance between geometries"""
+    for a, b in rtreeJoin.spatialJoin(tree_a.root, tree_b.root, distance):
+        yield as_result(a), as_result(b)
@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 def euclidean_compare(ref_point, check_point):
     dx = max(ref_point.x, check_point.x) - min(ref_point.x, check_point.x)
     dy = max(ref_point.y, check_point.y) - min(ref_point.y, check_point.y)
@@ -25,6 +27,26 @@ class Point:
     def position(self, index):
         return self.x if index == 1 else self.y
 
+class Entry:
+    """An entry with extent (polygon, line, ...), indexed by its MBR and backed by its shapely geometry"""
+    def __init__(self, ident, geometry):
+        self.ident = ident
+        self.geometry = geometry
+        minx, miny, maxx, maxy = geometry.bounds
+        self.range = [minx, maxx, miny, maxy]
+        # the MBR centre, used to order entries when splitting
+        self.x = (minx + maxx) / 2
+        self.y = (miny + maxy) / 2
+
+    def position(self, index):
+        return self.x if index == 1 else self.y
+
+# the [minx, maxx, miny, maxy] range covered by a point, an entry or a node
+def childRange(child):
+    if isinstance(child, Point):
+        return [child.x, child.x, child.y, child.y]
+    return child.range
+
 class Node:
     def __init__(self, Bvalue, level):
         self.childList = []
@@ -41,11 +63,7 @@ class Node:
             child.paren = self
 
     def update(self, child):
-        if isinstance(child, Point):
-            self.updateRange([child.x, child.x, child.y, child.y])
-        elif isinstance(child, Node):
-            self.updateRange(child.range)
-        
+        self.updateRange(childRange(child))
         self._calculate_mbr()
 
     def updateRange(self, newRange):
@@ -84,15 +102,17 @@ class Node:
         return len(self.childList) > self.Bvalue
 
     def getIncrease(self, point):
+        # perimeter enlargement needed to cover a point or an entry's MBR
+        newRange = childRange(point)
         increase = 0
-        if point.x < self.range[0]:
-            increase += self.range[0] - point.x
-        elif point.x > self.range[1]:
-            increase += point.x - self.range[1]
-        if point.y < self.range[2]:
-            increase += self.range[2] - point.y
-        elif point.y > self.range[3]:
-            increase += point.y - self.range[3]
+        if newRange[0] < self.range[0]:
+            increase += self.range[0] - newRange[0]
+        if newRange[1] > self.range[1]:
+            increase += newRange[1] - self.range[1]
+        if newRange[2] < self.range[2]:
+            increase += self.range[2] - newRange[2]
+        if newRange[3] > self.range[3]:
+            increase += newRange[3] - self.range[3]
         return increase
 
     def getPerimeter(self):
@@ -103,30 +123,57 @@ class Leaf(Node):
         super().__init__(Bvalue, level)
         self.addChild(point)
 
+    def _calculate_mbr(self):
+        # every change to childList ends here, so drop the packed copy
+        self._packed = None
+        self._hasEntries = None
+        super()._calculate_mbr()
+
+    def packed(self):
+        """[minx, maxx, miny, maxy] of every child as an (n, 4) float64 array, in childList order"""
+        if self._packed is None:
+            self._packed = np.array([childRange(c) for c in self.childList], dtype=np.float64).reshape(-1, 4)
+        return self._packed
+
+    def centres(self):
+        """x and y of every child (MBR centre for entries) as two float64 arrays"""
+        packed = self.packed()
+        return (packed[:, 0] + packed[:, 1]) / 2, (packed[:, 2] + packed[:, 3]) / 2
+
+    def hasEntries(self):
+        if self._hasEntries is None:
+            self._hasEntries = any(isinstance(c, Entry) for c in self.childList)
+        return self._hasEntries
+
+    def children(self, indices):
+        return [self.childList[i] for i in indices]
+
     def split(self):
         min_entries = max(1, math.floor(0.4 * self.Bvalue))
         best_split = None
         min_perimeter = float('inf')
         
-        # Try all possible splits that respect B-value
-        for split_idx in range(min_entries, len(self.childList) - min_entries + 1):
-            left = Leaf(self.Bvalue, self.level, self.childList[0])
-            right = Leaf(self.Bvalue, self.level, self.childList[0])
-            
-            # Use slicing to avoid cascading inserts
-            left.childList = self.childList[:split_idx]
-            right.childList = self.childList[split_idx:]
-            left._calculate_mbr()
-            right._calculate_mbr()
-            
-            # Enforce B-value constraint
-            if len(left.childList) > self.Bvalue or len(right.childList) > self.Bvalue:
-                continue  # Skip invalid splits
+        # Try all possible splits along both axes that respect B-value
+        for index in [1, 2]:
+            self.sortChildren(index)
+            for split_idx in range(min_entries, len(self.childList) - min_entries + 1):
+                left = Leaf(self.Bvalue, self.level, self.childList[0])
+                right = Leaf(self.Bvalue, self.level, self.childList[0])
+                
+                # Use slicing to avoid cascading inserts
+                left.childList = self.childList[:split_idx]
+                right.childList = self.childList[split_idx:]
+                left._calculate_mbr()
+                right._calculate_mbr()
                 
-            current_perim = left.getPerimeter() + right.getPerimeter()
-            if current_perim < min_perimeter:
-                min_perimeter = current_perim
-                best_split = [left, right]
+                # Enforce B-value constraint
+                if len(left.childList) > self.Bvalue or len(right.childList) > self.Bvalue:
+                    continue  # Skip invalid splits
+                    
+                current_perim = left.getPerimeter() + right.getPerimeter()
+                if current_perim < min_perimeter:
+                    min_perimeter = current_perim
+                    best_split = [left, right]
         
         # Fallback split with forced B-value compliance
         if not best_split:
@@ -4,9 +4,10 @@ import random
 from collections import namedtuple
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
+from matplotlib.collections import PatchCollection
 import geopandas as gpd
 import contextily as ctx
-from shapely.geometry import Point as MapPoint
+from shapely.geometry import Point as MapPoint, shape
 from shapely import affinity
 
 Boundary = namedtuple("Boundary", ["center", "width", "height"])
@@ -24,6 +25,19 @@ def load_points_from_geojson(file_path):
                 points.append(Rtree.Point((feature["properties"], lon, lat)))
     return points
 
+def load_geometries_from_geojson(file_path):
+    """
+    This function is used to load every feature from GeoJSON as an entry with its real geometry
+    """
+    entries = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+        for feature in data["features"]:
+            if feature["geometry"] is None:
+                continue
+            entries.append(Rtree.Entry(feature["properties"], shape(feature["geometry"])))
+    return entries
+
 def calculate_boundary(points, buffer_ratio=0.05):
     """
     Used to Calculate the bounding box based on the points
@@ -116,7 +130,10 @@ def visualize_rtree(root_node, ax=None, schema = {}):
         "save_plot"
         "plot_name"
         "file_dpi"
+        "max_depth": Deepest level (root = 0) whose MBRs are drawn, default all
+        "max_labels": No point labels beyond this many points, default 1000
     }
+    Node MBRs are drawn as one PatchCollection per node type and points as one scatter
     """
     if ax is None:
         fig, ax = plt.subplots(figsize = schema.get("figure_size", (10, 10)))
@@ -125,49 +142,52 @@ def visualize_rtree(root_node, ax=None, schema = {}):
         'leaf': schema.get("leaf_node_color", "blue"),
         'branch': schema.get("branch_node_color", "red")
     }
+    max_depth = schema.get("max_depth")
 
-    def draw_node(node):
-        # Determine node type and style
-        if isinstance(node, Rtree.Leaf):
-            color = node_colors['leaf']
-            linestyle = schema.get("leaf_node_linestyle", "-")
-            linewidth = schema.get("leaf_node_linewidth", 1.2)
-        elif isinstance(node, Rtree.Branch):
-            color = node_colors['branch']
-            linestyle = schema.get("branch_node_linestyle", "--")
-            linewidth = linewidth = schema.get("branch_node_linewidth", 0.8)
-        else:
-            return
-
-        # Draw MBR rectangle
-        x0, x1, y0, y1 = node.range
-        ax.add_patch(Rectangle(
-            (x0, y0), x1-x0, y1-y0,
-            fill=False, edgecolor=color,
-            linestyle=linestyle, linewidth=linewidth,
-            alpha=0.7 if isinstance(node, Rtree.Branch) else 1.0
-        ))
+    # Walk the tree once, gathering MBRs per node type and the points
+    rectangles = {'leaf': [], 'branch': []}
+    points = []
+    stack = [(root_node, 0)] if root_node is not None else []
+    while stack:
+        node, depth = stack.pop()
+        kind = 'leaf' if isinstance(node, Rtree.Leaf) else 'branch'
+        if max_depth is None or depth <= max_depth:
+            x0, x1, y0, y1 = node.range
+            rectangles[kind].append(Rectangle((x0, y0), x1-x0, y1-y0))
 
-        # Process children
         for child in node.childList:
             if isinstance(child, (Rtree.Leaf, Rtree.Branch)):
-                draw_node(child)
+                stack.append((child, depth + 1))
             elif isinstance(child, Rtree.Point):
-                ax.plot(
-                    child.x, child.y, 
-                    schema.get("marker", "o"), 
-                    color = schema.get("marker_color", "green"), 
-                    markersize = schema.get("marker_size", 4))
-                ax.annotate(
-                    child.ident, 
-                    (child.x, child.y), 
-                    fontsize = schema.get("marker_fontsize", 6), 
-                    ha = schema.get("horizontal_alignment", "center"), 
-                    va = schema.get("vertical_alignment", "bottom")
-                )
-
-    draw_node(root_node)
-    
+                points.append(child)
+
+    for kind, alpha in (('branch', 0.7), ('leaf', 1.0)):
+        ax.add_collection(PatchCollection(
+            rectangles[kind],
+            facecolor='none', edgecolor=node_colors[kind],
+            linestyle=schema.get(f"{kind}_node_linestyle", "-" if kind == 'leaf' else "--"),
+            linewidth=schema.get(f"{kind}_node_linewidth", 1.2 if kind == 'leaf' else 0.8),
+            alpha=alpha
+        ))
+
+    ax.scatter(
+        [p.x for p in points], [p.y for p in points],
+        marker = schema.get("marker", "o"),
+        color = schema.get("marker_color", "green"),
+        s = schema.get("marker_size", 4) ** 2)
+
+    # Labels cost a text artist each, so large trees go without
+    if len(points) <= schema.get("max_labels", 1000):
+        for child in points:
+            ax.annotate(
+                child.ident, 
+                (child.x, child.y), 
+                fontsize = schema.get("marker_fontsize", 6), 
+                ha = schema.get("horizontal_alignment", "center"), 
+                va = schema.get("vertical_alignment", "bottom")
+            )
+    ax.autoscale_view()
+
     # Configure plot aesthetics
     ax.set_title(schema.get("title", "r-tree"))
     ax.set_xlabel("X-axis")
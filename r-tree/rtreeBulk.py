@@ -0,0 +1,112 @@
+# standard libraries
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# third-party libraries
+import numpy as np
+
+# private libraries
+import Rtree
+
+# Sort-Tile-Recursive (STR) bulk loading: with P = ceil(n / B) nodes to make, sort the items by x,
+# cut them into ceil(sqrt(P)) vertical slices of equal count, sort each slice by y and pack runs of B
+# items into nodes; the nodes are packed the same way, level by level, until they fit in one root
+
+# below this many points a process pool costs more than it saves: workers only sort the slices,
+# which is about a third of a serial build, while starting them and shipping the slices out is
+# tens of milliseconds
+PARALLEL_MIN_POINTS = 500_000
+
+# the number of vertical slices STR cuts n items into
+def sliceCount(n, Bvalue):
+    return max(1, math.ceil(math.sqrt(math.ceil(n / Bvalue))))
+
+# cut item indices into vertical slices of equal count, by x
+# argpartition only orders the slices among themselves, leaving the sorting within them to packSlice
+def verticalSlices(xs, Bvalue):
+    n = len(xs)
+    size = math.ceil(n / sliceCount(n, Bvalue))
+    bounds = list(range(size, n, size))
+    order = np.argpartition(xs, bounds) if bounds else np.arange(n)
+    return np.split(order, bounds)
+
+# sort one slice by y (then x) and cut it into runs of B; runs in a worker process for parallel builds
+# returns the slice's item order (indices into xs / ys) and the start of every run in it
+def packSlice(task):
+    xs, ys, Bvalue = task
+    order = np.lexsort((xs, ys))
+    indexType = np.int32 if len(xs) < 2**31 else np.int64
+    return order.astype(indexType), np.arange(0, len(xs), Bvalue, dtype=indexType)
+
+# [minx, maxx, miny, maxy] of every run of rows in an (n, 4) ranges array
+def runRanges(ranges, starts):
+    return np.column_stack([
+        np.minimum.reduceat(ranges[:, 0], starts), np.maximum.reduceat(ranges[:, 1], starts),
+        np.minimum.reduceat(ranges[:, 2], starts), np.maximum.reduceat(ranges[:, 3], starts),
+    ])
+
+# a node over children already in STR order, without recomputing its MBR child by child
+# paren is left unset, as in the trees rtreeBuilder makes: its overflow handling expects that,
+# so packed trees can still take inserts
+def makeNode(nodeClass, Bvalue, level, children, nodeRange, packed=None):
+    if nodeClass is Rtree.Leaf:
+        node = Rtree.Leaf(Bvalue, level, children[0])
+        node._packed = packed
+    else:
+        node = Rtree.Branch(Bvalue, level, None)
+    node.childList = children
+    node.range = nodeRange
+    node.centre = [(nodeRange[0] + nodeRange[1]) / 2, (nodeRange[2] + nodeRange[3]) / 2]
+    return node
+
+# pack nodes into the levels above them until a single root is left
+def packUpperLevels(nodes, ranges, Bvalue):
+    level = 2
+    while len(nodes) > 1:
+        xs = (ranges[:, 0] + ranges[:, 1]) / 2
+        ys = (ranges[:, 2] + ranges[:, 3]) / 2
+        parents, parentRanges = [], []
+        for group in verticalSlices(xs, Bvalue):
+            order, starts = packSlice((xs[group], ys[group], Bvalue))
+            order = group[order]
+            groupRanges = runRanges(ranges[order], starts)
+            for start, end, nodeRange in zip(starts, np.append(starts[1:], len(order)), groupRanges.tolist()):
+                children = [nodes[i] for i in order[start:end].tolist()]
+                parents.append(makeNode(Rtree.Branch, Bvalue, level, children, nodeRange))
+                parentRanges.append(nodeRange)
+        nodes = parents
+        ranges = np.array(parentRanges, dtype=np.float64)
+        level += 1
+    return nodes[0]
+
+# STR-pack Rtree.Point items into a tree and return its root
+# only the sorting of the vertical slices runs in processes workers (None for os.cpu_count()), and
+# only from PARALLEL_MIN_POINTS points; the leaf and branch objects are all made here, in one process,
+# so the tree is the same for any processes
+def strPack(points, Bvalue, processes=None):
+    xs = np.fromiter((p.x for p in points), dtype=np.float64, count=len(points))
+    ys = np.fromiter((p.y for p in points), dtype=np.float64, count=len(points))
+    slices = verticalSlices(xs, Bvalue)
+    tasks = [(xs[group], ys[group], Bvalue) for group in slices]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes > 1 and len(tasks) > 1 and len(points) >= PARALLEL_MIN_POINTS:
+        with ProcessPoolExecutor(processes) as executor:
+            packedSlices = list(executor.map(packSlice, tasks, chunksize=max(1, len(tasks) // (4 * processes))))
+    else:
+        packedSlices = [packSlice(task) for task in tasks]
+
+    leaves, leafRanges = [], []
+    for group, (order, starts) in zip(slices, packedSlices):
+        order = group[order]
+        pointRanges = np.column_stack([xs[order], xs[order], ys[order], ys[order]])
+        ranges = runRanges(pointRanges, starts)
+        ends = np.append(starts[1:], len(order))
+        for start, end, nodeRange in zip(starts.tolist(), ends.tolist(), ranges.tolist()):
+            children = [points[i] for i in order[start:end].tolist()]
+            leaves.append(makeNode(Rtree.Leaf, Bvalue, 1, children, nodeRange, pointRanges[start:end]))
+            leafRanges.append(nodeRange)
+
+    return packUpperLevels(leaves, np.array(leafRanges, dtype=np.float64), Bvalue)
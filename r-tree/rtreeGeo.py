@@ -0,0 +1,77 @@
+# standard libraries
+import math
+
+# third-party libraries
+import numpy as np
+
+# private libraries
+import Rtree
+import rtreeNN
+import rtreeRange
+
+# mean earth radius in metres
+EARTH_RADIUS = 6371008.8
+
+def hav(theta):
+    return math.sin(theta / 2)**2
+
+def havToMetres(h):
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(1.0, h)))
+
+# great-circle distance in metres between two (lon, lat) positions in degrees
+def haversine(x1, y1, x2, y2):
+    lat1 = math.radians(y1)
+    lat2 = math.radians(y2)
+    return havToMetres(hav(lat2 - lat1) + math.cos(lat1) * math.cos(lat2) * hav(math.radians(x2 - x1)))
+
+# great-circle distances in metres from a query to every child of a leaf (MBR centre for entries)
+def leafDis(leaf, query):
+    xs, ys = leaf.centres()
+    lat1 = math.radians(query[1])
+    lat2 = np.radians(ys)
+    h = np.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * np.cos(lat2) * np.sin(np.radians(xs - query[0]) / 2)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(1.0, h)))
+
+# smallest longitude difference in degrees from lon to the longitudes minx..maxx, going either way
+# around the globe, so across the antimeridian too
+def lonGap(lon, minx, maxx):
+    if (lon - minx) % 360 <= maxx - minx:
+        return 0.0
+    return min((minx - lon) % 360, (lon - maxx) % 360)
+
+# largest longitude difference in degrees from lon to any longitude of minx..maxx, the short way
+# around; 180 when the opposite meridian is in range
+def lonGapFar(lon, minx, maxx):
+    if (lon + 180 - minx) % 360 <= maxx - minx:
+        return 180.0
+    return max(min(gap % 360, -gap % 360) for gap in (minx - lon, maxx - lon))
+
+# lower bound of the distance in metres from a query to a node range [minx, maxx, miny, maxy]
+# the longitude gap is scaled by the cosine of the range latitude furthest from the equator
+def nearDis(range1, query):
+    dlon = lonGap(query[0], range1[0], range1[1])
+    dlat = max(range1[2] - query[1], 0, query[1] - range1[3])
+    cosRange = max(0.0, min(math.cos(math.radians(range1[2])), math.cos(math.radians(range1[3]))))
+    return havToMetres(hav(math.radians(dlat)) + math.cos(math.radians(query[1])) * cosRange * hav(math.radians(dlon)))
+
+# upper bound of the distance in metres from a query to any position of a node range
+def farDis(range1, query):
+    dlon = lonGapFar(query[0], range1[0], range1[1])
+    dlat = min(180, max(query[1] - range1[2], range1[3] - query[1]))
+    if range1[2] <= 0 <= range1[3]:
+        cosRange = 1.0
+    else:
+        cosRange = max(math.cos(math.radians(range1[2])), math.cos(math.radians(range1[3])))
+    return havToMetres(hav(math.radians(dlat)) + math.cos(math.radians(query[1])) * cosRange * hav(math.radians(dlon)))
+
+def radiusQuery(node, centre, radius):
+    # nodes entirely inside the circle need no per-point checks
+    if farDis(node.range, centre) <= radius:
+        return rtreeRange.allPoints(node)
+    if isinstance(node, Rtree.Leaf):
+        return node.children(np.flatnonzero(leafDis(node, centre) <= radius))
+    results = []
+    for child in node.childList:
+        if nearDis(child.range, centre) <= radius:
+            results.extend(radiusQuery(child, centre, radius))
+    return results
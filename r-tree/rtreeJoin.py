@@ -0,0 +1,81 @@
+# third-party libraries
+import numpy as np
+import shapely
+
+# private libraries
+import Rtree
+
+# the nearest squared distance between two ranges [minx, maxx, miny, maxy]
+def rangeDis(range1, range2):
+    dx = max(range1[0] - range2[1], range2[0] - range1[1], 0)
+    dy = max(range1[2] - range2[3], range2[2] - range1[3], 0)
+    return dx**2 + dy**2
+
+# the exact shape of a point or an entry
+def childShape(child):
+    if isinstance(child, Rtree.Entry):
+        return child.geometry
+    return shapely.Point(child.x, child.y)
+
+# compare the children of two leaves with one NumPy distance matrix
+def joinLeaves(leaf1, leaf2, sqDistance):
+    if leaf1.hasEntries() or leaf2.hasEntries():
+        close = joinEntries(leaf1, leaf2, sqDistance)
+    else:
+        xs1, ys1 = leaf1.centres()
+        xs2, ys2 = leaf2.centres()
+        close = (xs1[:, None] - xs2[None, :])**2 + (ys1[:, None] - ys2[None, :])**2 <= sqDistance
+    for i, j in zip(*np.nonzero(close)):
+        yield leaf1.childList[i], leaf2.childList[j]
+
+# with entries, the distance matrix is between MBRs, which is exact for two points
+# pairs with an entry that are close enough are then checked on their geometries
+def joinEntries(leaf1, leaf2, sqDistance):
+    ranges1 = leaf1.packed()
+    ranges2 = leaf2.packed()
+    dx = np.maximum(np.maximum(ranges1[:, None, 0] - ranges2[None, :, 1], ranges2[None, :, 0] - ranges1[:, None, 1]), 0)
+    dy = np.maximum(np.maximum(ranges1[:, None, 2] - ranges2[None, :, 3], ranges2[None, :, 2] - ranges1[:, None, 3]), 0)
+    close = dx**2 + dy**2 <= sqDistance
+    isEntry1 = np.array([isinstance(c, Rtree.Entry) for c in leaf1.childList])
+    isEntry2 = np.array([isinstance(c, Rtree.Entry) for c in leaf2.childList])
+    rows, cols = np.nonzero(close & (isEntry1[:, None] | isEntry2[None, :]))
+    if len(rows):
+        shapes1 = [childShape(leaf1.childList[i]) for i in rows]
+        shapes2 = [childShape(leaf2.childList[j]) for j in cols]
+        close[rows, cols] = shapely.distance(shapes1, shapes2)**2 <= sqDistance
+    return close
+
+# stream all (child1, child2) pairs within distance of each other, traversing both trees at once
+def spatialJoin(root1, root2, distance):
+    if root1 is None or root2 is None:
+        return
+    sqDistance = distance**2
+    if rangeDis(root1.range, root2.range) > sqDistance:
+        return
+
+    # every node pair on the stack is already known to be within distance
+    stack = [(root1, root2)]
+    while stack:
+        node1, node2 = stack.pop()
+        isLeaf1 = isinstance(node1, Rtree.Leaf)
+        isLeaf2 = isinstance(node2, Rtree.Leaf)
+
+        if isLeaf1 and isLeaf2:
+            yield from joinLeaves(node1, node2, sqDistance)
+        elif isLeaf1:
+            for child in node2.childList:
+                if rangeDis(node1.range, child.range) <= sqDistance:
+                    stack.append((node1, child))
+        elif isLeaf2:
+            for child in node1.childList:
+                if rangeDis(child.range, node2.range) <= sqDistance:
+                    stack.append((child, node2))
+        else:
+            # prune the children of each side against the other node before pairing them
+            children2 = [c for c in node2.childList if rangeDis(node1.range, c.range) <= sqDistance]
+            for child1 in node1.childList:
+                if rangeDis(child1.range, node2.range) > sqDistance:
+                    continue
+                for child2 in children2:
+                    if rangeDis(child1.range, child2.range) <= sqDistance:
+                        stack.append((child1, child2))
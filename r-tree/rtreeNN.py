@@ -1,8 +1,21 @@
 # standard libraries
+import math
+import os
+import sys
 
+# third-party libraries
+import numpy as np
+import shapely
 
 # private libraries
 import Rtree
+import rtreeRange
+
+# the batched kNN search is shared with the quadtree, from a sibling directory
+sharedPath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared")
+if sharedPath not in sys.path:
+    sys.path.append(sharedPath)
+import knn_batch
 
 # the nearest distance
 global distance
@@ -22,19 +35,34 @@ def nDis(node, query):
         distance += (query[1] - node.range[3])**2
     return distance
 
+# the squared distance from a query point to a point, or to the geometry of an entry
+def pointDis(point, query):
+    if isinstance(point, Rtree.Entry):
+        return shapely.distance(point.geometry, shapely.Point(query[0], query[1]))**2
+    return (point.x-query[0])**2 + (point.y-query[1])**2
+
+# the squared distances from a query point to every child of a leaf, in one NumPy call
+def leafDis(leaf, query):
+    xs, ys = leaf.centres()
+    dists = (xs - query[0])**2 + (ys - query[1])**2
+    if leaf.hasEntries():
+        for i, child in enumerate(leaf.childList):
+            if isinstance(child, Rtree.Entry):
+                dists[i] = pointDis(child, query)
+    return dists
+
 # in a leaf, find all points which have the least distance from the query point
 def getNN(leaf, query):
     global distance
     global results
     
-    for point in leaf.childList:
-        newDis = (point.x-query[0])**2 + (point.y-query[1])**2
-        if newDis < distance:
-            distance = newDis
-            results.clear()
-            results.append(point)
-        elif newDis == distance:
-            results.append(point)
+    dists = leafDis(leaf, query)
+    newDis = dists.min()
+    if newDis < distance:
+        distance = newDis
+        results.clear()
+    if newDis <= distance:
+        results.extend(leaf.children(np.flatnonzero(dists == newDis)))
 
 # answer a NN query using "Best First" algorithm
 def bestFirst(tupleList, query):
@@ -61,4 +89,30 @@ def bestFirst(tupleList, query):
     # implement Best First algorithm resursively
     bestFirst(tupleList, query)
 
+# the k nearest points of a query using "Best First" search, pruning anything beyond bound
+# returns (squared distance, point) pairs, closest first; ties are broken by x, y, then rank(point)
+def bestFirstKNN(root, query, k, bound=math.inf, rank=None):
+    def expand(node, query):
+        if isinstance(node, Rtree.Leaf):
+            return leafDis(node, query), node.childList, []
+        return [], [], node.childList
+    return knn_batch.best_first(root, query, k, nDis, expand, bound, rank)
+
+# answer a kNN query for every query point, in Morton-ordered batches of nearby queries
+# (see knn_batch.all_nearest); returns (points, distances) arrays of shape (n, k)
+def allKNNPoints(root, queries, k, size, batchSize=None, rank=None):
+    queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+    if root is None:
+        return np.full((len(queries), k), None, dtype=object), np.full((len(queries), k), np.inf)
+    return knn_batch.all_nearest(
+        queries, k, size,
+        lambda x, y, found, bound: bestFirstKNN(root, (x, y), found, bound, rank),
+        lambda minx, miny, maxx, maxy: rtreeRange.rangeQuery(root, [minx, maxx, miny, maxy]),
+        batchSize, rank
+    )
 
+# as allKNNPoints, with the idents of the points
+def allKNN(root, queries, k, size, batchSize=None):
+    points, distances = allKNNPoints(root, queries, k, size, batchSize)
+    idents = np.frompyfunc(lambda p: None if p is None else p.ident, 1, 1)(points)
+    return idents.astype(object), distances
@@ -1,3 +1,6 @@
+import numpy as np
+import shapely
+
 import Rtree
 def isIntersect(range1, range2):
     return not (range1[0] > range2[1] or 
@@ -5,17 +8,122 @@ def isIntersect(range1, range2):
                range1[2] > range2[3] or 
                range1[3] < range2[2])
 
+def isInside(range1, range2):
+    return (range1[0] >= range2[0] and range1[1] <= range2[1] and
+            range1[2] >= range2[2] and range1[3] <= range2[3])
+
 def searchLeaf(leaf, query_range):
-    return [p for p in leaf.childList 
-            if (p.x >= query_range[0] and p.x <= query_range[1] and
-                p.y >= query_range[2] and p.y <= query_range[3])]
+    # one vectorized MBR test per leaf; for points it is the containment test
+    packed = leaf.packed()
+    mask = ((packed[:, 1] >= query_range[0]) & (packed[:, 0] <= query_range[1]) &
+            (packed[:, 3] >= query_range[2]) & (packed[:, 2] <= query_range[3]))
+    candidates = leaf.children(np.flatnonzero(mask))
+    if not leaf.hasEntries():
+        return candidates
+
+    # the exact geometry test runs on the candidate entries only
+    results = [p for p in candidates if not isinstance(p, Rtree.Entry)]
+    entries = [p for p in candidates if isinstance(p, Rtree.Entry)]
+    if entries:
+        queryBox = shapely.box(query_range[0], query_range[2], query_range[1], query_range[3])
+        touches = shapely.intersects([e.geometry for e in entries], queryBox)
+        results.extend(e for e, keep in zip(entries, touches) if keep)
+    return results
 
-def rangeQuery(node, query_range):
+def rangeQuery(node, query_range, stats=None, depth=0):
+    # everything in a node lying inside the query range is a result, entries included
+    # stats is an optional rtreeStats.QueryStats to count the work into
+    if stats is not None:
+        stats.visit(depth)
+    if isInside(node.range, query_range):
+        return allPoints(node)
     results = []
     if isinstance(node, Rtree.Leaf):
+        if stats is not None:
+            stats.points_tested += len(node.childList)
         results.extend(searchLeaf(node, query_range))
     else:
         for child in node.childList:
             if isIntersect(child.range, query_range):
-                results.extend(rangeQuery(child, query_range))
-    return results
\ No newline at end of file
+                results.extend(rangeQuery(child, query_range, stats, depth + 1))
+            elif stats is not None:
+                stats.nodes_pruned += 1
+    return results
+
+def allPoints(node):
+    if isinstance(node, Rtree.Leaf):
+        return list(node.childList)
+    results = []
+    for child in node.childList:
+        results.extend(allPoints(child))
+    return results
+
+def entryIndices(leaf):
+    return [i for i, child in enumerate(leaf.childList) if isinstance(child, Rtree.Entry)]
+
+def nearDis(range1, centre):
+    dx = max(range1[0] - centre[0], 0, centre[0] - range1[1])
+    dy = max(range1[2] - centre[1], 0, centre[1] - range1[3])
+    return dx**2 + dy**2
+
+def farDis(range1, centre):
+    dx = max(centre[0] - range1[0], range1[1] - centre[0])
+    dy = max(centre[1] - range1[2], range1[3] - centre[1])
+    return dx**2 + dy**2
+
+def radiusQuery(node, centre, sqRadius):
+    # nodes entirely inside the circle need no per-point checks
+    # entries are matched by the distance to their geometry, not to their MBR centre
+    if farDis(node.range, centre) <= sqRadius:
+        return allPoints(node)
+    if isinstance(node, Rtree.Leaf):
+        xs, ys = node.centres()
+        dists = (xs - centre[0])**2 + (ys - centre[1])**2
+        if node.hasEntries():
+            entries = entryIndices(node)
+            shapes = [node.childList[i].geometry for i in entries]
+            dists[entries] = shapely.distance(shapely.Point(centre[0], centre[1]), shapes)**2
+        return node.children(np.flatnonzero(dists <= sqRadius))
+    results = []
+    for child in node.childList:
+        if nearDis(child.range, centre) <= sqRadius:
+            results.extend(radiusQuery(child, centre, sqRadius))
+    return results
+
+def polygonQuery(node, polygon):
+    # polygon must be prepared; nodes inside its interior need no per-point checks
+    # entries are matched if their whole geometry lies inside the polygon
+    nodeBox = shapely.box(node.range[0], node.range[2], node.range[1], node.range[3])
+    if not polygon.intersects(nodeBox):
+        return []
+    if polygon.contains_properly(nodeBox):
+        return allPoints(node)
+    if isinstance(node, Rtree.Leaf):
+        xs, ys = node.centres()
+        inside = shapely.contains_xy(polygon, xs, ys)
+        if node.hasEntries():
+            entries = entryIndices(node)
+            inside[entries] = shapely.contains(polygon, [node.childList[i].geometry for i in entries])
+        return node.children(np.flatnonzero(inside))
+    bounds = polygon.bounds
+    queryRange = [bounds[0], bounds[2], bounds[1], bounds[3]]
+    results = []
+    for child in node.childList:
+        if isIntersect(child.range, queryRange):
+            results.extend(polygonQuery(child, polygon))
+    return results
+
+def geometryQuery(node, geometry, geometryRange):
+    # geometry must be prepared; entries and points are matched if they intersect it
+    results = []
+    if isinstance(node, Rtree.Leaf):
+        candidates = [p for p in node.childList if isIntersect(Rtree.childRange(p), geometryRange)]
+        if candidates:
+            shapes = [p.geometry if isinstance(p, Rtree.Entry) else shapely.Point(p.x, p.y) for p in candidates]
+            touches = shapely.intersects(geometry, shapes)
+            results.extend(p for p, keep in zip(candidates, touches) if keep)
+    else:
+        for child in node.childList:
+            if isIntersect(child.range, geometryRange):
+                results.extend(geometryQuery(child, geometry, geometryRange))
+    return results
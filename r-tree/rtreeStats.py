@@ -0,0 +1,119 @@
+import sys
+
+import numpy as np
+import shapely
+
+import Rtree
+
+# counts of the work a query does, for explain=True; the fields match quad_tree.QueryStats
+class QueryStats:
+    FIELDS = ("nodes_visited", "nodes_pruned", "points_tested", "results", "heap_pushes", "depth")
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def __repr__(self):
+        return "<QueryStats: " + ", ".join(f"{field}={getattr(self, field)}" for field in self.FIELDS) + ">"
+
+    # depth counts the levels walked down from the root
+    def visit(self, depth):
+        self.nodes_visited += 1
+        self.depth = max(self.depth, depth)
+
+    # the share of the nodes looked at that were pruned
+    @property
+    def pruning_ratio(self):
+        seen = self.nodes_visited + self.nodes_pruned
+        return self.nodes_pruned / seen if seen else 0.0
+
+    def as_dict(self):
+        stats = {field: getattr(self, field) for field in self.FIELDS}
+        stats["pruning_ratio"] = self.pruning_ratio
+        return stats
+
+
+# the area shared by every pair of ranges [minx, maxx, miny, maxy] in an (n, 4) array
+def pairOverlaps(ranges):
+    i, j = np.triu_indices(len(ranges), 1)
+    dx = np.minimum(ranges[i, 1], ranges[j, 1]) - np.maximum(ranges[i, 0], ranges[j, 0])
+    dy = np.minimum(ranges[i, 3], ranges[j, 3]) - np.maximum(ranges[i, 2], ranges[j, 2])
+    shared = np.clip(dx, 0, None) * np.clip(dy, 0, None)
+    return shared[shared > 0]
+
+def rangeArea(nodeRange):
+    return (nodeRange[1] - nodeRange[0]) * (nodeRange[3] - nodeRange[2])
+
+# an object and its attribute dict, without following what they point to
+def shallowSize(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+# shape and health of a tree, in one iterative pass; the keys match QuadTree.tree_stats
+# depth is counted by traversal (node.level is not kept up to date by the builder)
+# fill factor is children over B, averaged over the nodes at each depth
+# overlap is the area shared by sibling MBRs, summed over every pair
+# dead space is the area of each node MBR covered by none of its children's MBRs (point leaves are skipped)
+def treeStats(root, Bvalue):
+    depthHistogram = {}
+    fillTotals = {}
+    overlapByDepth = {}
+    overlapPairs = 0
+    emptyNodes = 0
+    leaves = 0
+    points = 0
+    deadSpace = 0.0
+    used = 0
+
+    stack = [(root, 0)] if root is not None else []
+    while stack:
+        node, depth = stack.pop()
+        depthHistogram[depth] = depthHistogram.get(depth, 0) + 1
+        fill, count = fillTotals.get(depth, (0.0, 0))
+        fillTotals[depth] = (fill + len(node.childList) / Bvalue, count + 1)
+        if not node.childList:
+            emptyNodes += 1
+
+        used += shallowSize(node) + sys.getsizeof(node.childList)
+        used += sys.getsizeof(node.range) + sys.getsizeof(node.centre)
+        isLeaf = isinstance(node, Rtree.Leaf)
+        if isLeaf:
+            leaves += 1
+            points += len(node.childList)
+            if node._packed is not None:
+                used += node._packed.nbytes
+            used += sum(shallowSize(child) for child in node.childList)
+            if not node.hasEntries():
+                continue
+        else:
+            stack.extend((child, depth + 1) for child in node.childList)
+
+        if len(node.childList) > 1:
+            ranges = np.array([Rtree.childRange(c) for c in node.childList], dtype=np.float64)
+            shared = pairOverlaps(ranges)
+            if len(shared) and not isLeaf:
+                overlapPairs += len(shared)
+                overlapByDepth[depth + 1] = overlapByDepth.get(depth + 1, 0.0) + float(shared.sum())
+            covered = shapely.union_all(shapely.box(ranges[:, 0], ranges[:, 2], ranges[:, 1], ranges[:, 3])).area
+            deadSpace += max(rangeArea(node.range) - covered, 0.0)
+
+    rootArea = rangeArea(root.range) if root is not None and root.range else 0.0
+    return {
+        "nodes": sum(depthHistogram.values()),
+        "leaves": leaves,
+        "empty_nodes": emptyNodes,
+        "points": points,
+        "height": max(depthHistogram, default=0),
+        "depth_histogram": dict(sorted(depthHistogram.items())),
+        "fill_factor": {depth: fill / count for depth, (fill, count) in sorted(fillTotals.items())},
+        "overlap": {
+            "total_area": sum(overlapByDepth.values()),
+            "pairs": overlapPairs,
+            "by_depth": dict(sorted(overlapByDepth.items())),
+        },
+        "dead_space": deadSpace,
+        "dead_space_ratio": deadSpace / rootArea if rootArea else 0.0,
+        "bytes": used,
+    }
@@ -0,0 +1,45 @@
+# third-party libraries
+import numpy as np
+
+# candidate B values tried by B="auto", and the size of its sample and query mix
+CAPACITIES = [8, 16, 32, 64, 128, 256]
+SAMPLE_SIZE = 1000
+QUERY_COUNT = 50
+REPEATS = 3
+
+# the elbow of a (B, time) curve, as in kneed's Kneedle (convex, decreasing):
+# with both axes scaled to [0, 1], the point furthest below the line joining the ends of the curve
+# only the decreasing part (up to the fastest B) counts, as too-large nodes get slow again
+def chooseB(capacities, times):
+    fastest = int(np.argmin(times))
+    xs = np.asarray(capacities[:fastest + 1], dtype=np.float64)
+    ys = np.asarray(times[:fastest + 1], dtype=np.float64)
+
+    if len(xs) >= 3 and ys[0] > ys[-1]:
+        xs = (xs - xs[0]) / (xs[-1] - xs[0])
+        ys = (ys - ys[-1]) / (ys[0] - ys[-1])
+        below = (1 - xs) - ys
+        knee = int(np.argmax(below))
+        if below[knee] > 0:
+            reason = f"elbow of the timings ({times[knee]:.4f}s, fastest was {capacities[fastest]} at {times[fastest]:.4f}s)"
+            return capacities[knee], reason
+
+    return capacities[fastest], "fastest B (the timings have no elbow)"
+
+# a seeded sample of the data and a query mix around it: boxes of a hundredth of the
+# sample's MBR area [minx, maxx, miny, maxy] and (x, y) points for kNN searches
+def queryMix(items, sampleSize=SAMPLE_SIZE, queryCount=QUERY_COUNT, seed=0):
+    rng = np.random.default_rng(seed)
+    if len(items) > sampleSize:
+        sample = [items[i] for i in rng.choice(len(items), sampleSize, replace=False)]
+    else:
+        sample = list(items)
+
+    xs = np.array([p.x for p in sample])
+    ys = np.array([p.y for p in sample])
+    halfWidth = (xs.max() - xs.min()) / 20
+    halfHeight = (ys.max() - ys.min()) / 20
+    picks = rng.choice(len(sample), queryCount)
+    centres = [(float(xs[i]), float(ys[i])) for i in picks]
+    boxes = [[x - halfWidth, x + halfWidth, y - halfHeight, y + halfHeight] for x, y in centres]
+    return sample, boxes, centres
@@ -1,2 +1,3 @@
 python "r-tree/test1.py"
-python "r-tree/test2.py"
\ No newline at end of file
+python "r-tree/test2.py"
+python "r-tree/test3.py"
\ No newline at end of file
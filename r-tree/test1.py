@@ -128,7 +128,7 @@ def test_rt_point_search(sizes, RUN_COUNT=10):
     plt.tight_layout()
     plt.savefig(os.path.join("plots", "rtree_point_search_performance.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
 
-def test_rt_nearest_neighbors(sizes, neighbors_to_find=10, RUN_COUNT=10):
+def test_rt_nearest_neighbors(sizes, neighbors_to_find=10, RUN_COUNT=10, B=51):
     times = []
 
     for size in tqdm(sizes, desc="Testing R-Tree Nearest Neighbors", unit="pts"):
@@ -136,7 +136,7 @@ def test_rt_nearest_neighbors(sizes, neighbors_to_find=10, RUN_COUNT=10):
 
         for _ in range(RUN_COUNT):
             points = helper.generate_random_points(size, (-100, 100), (-100, 100))
-            rtree = RTreeWrapper.RTree(B=51)
+            rtree = RTreeWrapper.RTree(B=B)
             rtree.build_from_points(points)
 
             query_points = points[:size // 2]
@@ -152,12 +152,12 @@ def test_rt_nearest_neighbors(sizes, neighbors_to_find=10, RUN_COUNT=10):
     plt.plot(sizes, times, label="Average Nearest Neighbors Time", color="orange")
     plt.xlabel("Number of Points")
     plt.ylabel("Average Time (seconds)")
-    plt.title("R-Tree Nearest Neighbors Performance")
+    plt.title(f"R-Tree Nearest Neighbors Performance (B={B})")
     plt.grid(True)
     plt.tight_layout()
-    plt.savefig(os.path.join("plots", "rtree_nearest_neighbors_performance.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
+    plt.savefig(os.path.join("plots", f"rtree_nearest_neighbors_performance_B{B}.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
 
-def test_rt_bounding_box(sizes, bb_half_size=15, RUN_COUNT=10):
+def test_rt_bounding_box(sizes, bb_half_size=15, RUN_COUNT=10, B=51):
     times = []
 
     for size in tqdm(sizes, desc="Testing R-Tree Bounding Box Search", unit="pts"):
@@ -165,7 +165,7 @@ def test_rt_bounding_box(sizes, bb_half_size=15, RUN_COUNT=10):
 
         for _ in range(RUN_COUNT):
             points = helper.generate_random_points(size, (-100, 100), (-100, 100))
-            rtree = RTreeWrapper.RTree(B=51)
+            rtree = RTreeWrapper.RTree(B=B)
             rtree.build_from_points(points)
 
             query_points = points[:size // 2]
@@ -183,10 +183,10 @@ def test_rt_bounding_box(sizes, bb_half_size=15, RUN_COUNT=10):
     plt.plot(sizes, times, label="Average Bounding Box Search Time", color="green")
     plt.xlabel("Number of Points")
     plt.ylabel("Average Time (seconds)")
-    plt.title("R-Tree Bounding Box Search Performance")
+    plt.title(f"R-Tree Bounding Box Search Performance (B={B})")
     plt.grid(True)
     plt.tight_layout()
-    plt.savefig(os.path.join("plots", "rtree_bounding_box_performance.png"),
+    plt.savefig(os.path.join("plots", f"rtree_bounding_box_performance_B{B}.png"),
                 bbox_inches='tight', pad_inches=0.1, dpi=500)
     
 def test_rt_vs_brute_nearest_neighbor(sizes, neighbors_to_find=10, RUN_COUNT=5):
@@ -279,12 +279,84 @@ def test_rt_bounding_box_performance(sizes, bb_half_size=15, RUN_COUNT=10):
     plt.tight_layout()
     plt.savefig(os.path.join("plots", "rtree_bounding_box__cmp_performance.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
 
+def test_rt_all_nearest_neighbors(sizes, query_count=50_000, neighbors_to_find=5):
+    loop_times = []
+    join_times = []
+    query_points = [(q.x, q.y) for q in helper.generate_random_points(query_count, (-100, 100), (-100, 100))]
+
+    for size in tqdm(sizes, desc="Testing All-kNN Join (R-Tree)", unit="pts"):
+        points = helper.generate_random_points(size, (-100, 100), (-100, 100))
+        rtree = RTreeWrapper.RTree(B=51)
+        rtree.build_from_points(points)
+
+        start = time.perf_counter()
+        for q in query_points:
+            _ = rtree.nearest_neighbors(q, neighbors_to_find)
+        loop_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        _ = rtree.all_nearest_neighbors(query_points, neighbors_to_find)
+        join_times.append(time.perf_counter() - start)
+
+    plt.figure()
+    plt.plot(sizes, loop_times, label="Per-Query nearest_neighbors")
+    plt.plot(sizes, join_times, label="all_nearest_neighbors")
+    plt.xlabel("Number of Points")
+    plt.ylabel("Total Time (seconds)")
+    plt.title(f"R-Tree All-kNN Join Performance ({query_count} Queries)")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(os.path.join("plots", "rtree_all_nearest_neighbors_performance.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
+
+def test_rt_all_nearest_neighbors_repeated_queries(runs=200, neighbors_to_find=5):
+    # repeated and coincident queries (and data points) against a brute force scan
+    import numpy as np
+    for seed in range(runs):
+        rng = np.random.default_rng(seed)
+        points = helper.generate_random_points(int(rng.integers(20, 300)), (-100, 100), (-100, 100))
+        points += points[:int(rng.integers(0, 10))]
+        queries = [(points[i].x, points[i].y) for i in rng.integers(0, len(points), int(rng.integers(1, 200)))]
+        queries += queries[:20] + [(0, 0)] * 5
+        rtree = RTreeWrapper.RTree(B=4)
+        rtree.build_from_points(points)
+
+        _, distances = rtree.all_nearest_neighbors(queries, neighbors_to_find)
+        xy = np.array([(p.x, p.y) for p in points])
+        expected = np.sort(np.sqrt(((np.array(queries)[:, None] - xy[None])**2).sum(axis=2)), axis=1)
+        assert np.allclose(distances, expected[:, :neighbors_to_find]), f"seed {seed}"
+
+def test_rt_haversine_antimeridian(size=3000, neighbors_to_find=5):
+    # lon/lat queries near +-180 degrees, whose neighbors lie across the antimeridian
+    import random
+    import numpy as np
+    import rtreeGeo
+    rng = random.Random(0)
+    points = [Rtree.Point((i, rng.uniform(-180, 180), rng.uniform(-80, 80))) for i in range(size)]
+    rtree = RTreeWrapper.RTree(B=8)
+    rtree.build_from_points(points)
+
+    queries = [(177.1, 60.9), (-179.9, 0), (179.99, -45), (180, 10)]
+    queries += [(rng.choice((-1, 1)) * rng.uniform(170, 180), rng.uniform(-80, 80)) for _ in range(100)]
+    for query in queries:
+        expected = sorted(rtreeGeo.haversine(query[0], query[1], p.x, p.y) for p in points)
+        found = rtree.nearest_neighbors(query, k=neighbors_to_find, metric="haversine")
+        found = [rtreeGeo.haversine(query[0], query[1], x, y) for _, x, y in found]
+        assert np.allclose(found, expected[:neighbors_to_find]), f"query {query}"
+        radius = (expected[20] + expected[21]) / 2
+        assert len(rtree.within_radius(query, radius, metric="haversine")) == 21, f"query {query}"
+
 
 if __name__ == "__main__":
     test_rt_insertion(list(range(20, 500)))
     test_rt_varying_capacity_with_elbow()
     test_rt_point_search(list(range(20, 500)))
     test_rt_nearest_neighbors(list(range(20, 500)))
+    test_rt_nearest_neighbors(list(range(20, 500)), B=150)
     test_rt_bounding_box(list(range(20, 500)))
+    test_rt_bounding_box(list(range(20, 500)), B=150)
     test_rt_vs_brute_nearest_neighbor(list(range(20, 500)))
     test_rt_bounding_box_performance(list(range(20, 500)))
+    test_rt_all_nearest_neighbors_repeated_queries()
+    test_rt_haversine_antimeridian()
+    test_rt_all_nearest_neighbors([500, 1000, 2000, 5000, 10000])
@@ -69,6 +69,25 @@ def test_fastfoods():
     result = list(map(lambda point: Rtree.Point((point[0].get("name", ""), point[1], point[2])), result))
     print(result[:100])
 
+def test_parks_fastfood_join(distance=0.005):
+    fastfood_file = os.path.join("..", "gis_data", "fastfood.geojson")
+    if not os.path.exists(fastfood_file):
+        print(f"Skipping the (park, fastfood) join: {fastfood_file} not found")
+        return
+
+    parks = helper.load_points_from_geojson(os.path.join("..", "gis_data", "parks_sanantonio.geojson"))
+    fastfoods = helper.load_points_from_geojson(fastfood_file)
+
+    parks_rtree = RTreeWrapper.RTree(B=150)
+    parks_rtree.build_from_points(parks)
+    fastfood_rtree = RTreeWrapper.RTree(B=150)
+    fastfood_rtree.build_from_points(fastfoods)
+
+    start = time.perf_counter()
+    pairs = list(RTreeWrapper.spatial_join(parks_rtree, fastfood_rtree, distance))
+    print(f"{len(pairs)} (park, fastfood) pairs within {distance} in {time.perf_counter() - start:.3f}s")
+
 if __name__ == "__main__":
     test_fastfoods()
-    test_parks()
\ No newline at end of file
+    test_parks()
+    test_parks_fastfood_join()
\ No newline at end of file
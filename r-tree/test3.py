@@ -0,0 +1,61 @@
+import RTreeWrapper
+import helper
+import os
+import time
+import matplotlib.pyplot as plt
+
+# insertion vs STR bulk loading, and bulk loading with 1, 2, 4, ... worker processes
+def test_rt_bulk_load(sizes, B=51):
+    insert_times = []
+    bulk_times = []
+    for size in sizes:
+        points = helper.generate_random_points(size, (-100, 100), (-100, 100))
+
+        start = time.perf_counter()
+        rtree = RTreeWrapper.RTree(B=B)
+        rtree.build_from_points(points)
+        insert_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rtree = RTreeWrapper.RTree(B=B)
+        rtree.bulk_load(points, processes=1)
+        bulk_times.append(time.perf_counter() - start)
+
+    plt.figure()
+    plt.plot(sizes, insert_times, label="build_from_points")
+    plt.plot(sizes, bulk_times, label="bulk_load (STR)")
+    plt.xlabel("Number of Points")
+    plt.ylabel("Build Time (seconds)")
+    plt.title("R-Tree Insertion vs STR Bulk Loading")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(os.path.join("plots", "rtree_bulk_load_performance.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
+
+def test_rt_parallel_bulk_load(size=2_000_000, B=51):
+    points = helper.generate_random_points(size, (-100, 100), (-100, 100))
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+
+    times = []
+    for processes in counts:
+        start = time.perf_counter()
+        rtree = RTreeWrapper.RTree(B=B)
+        rtree.bulk_load(points, processes=processes)
+        times.append(time.perf_counter() - start)
+        print(f"bulk_load({processes} processes): {times[-1]:.2f}s")
+
+    plt.figure()
+    plt.plot(counts, times, marker="o")
+    plt.xlabel("Processes")
+    plt.ylabel("Build Time (seconds)")
+    plt.title(f"R-Tree Parallel STR Bulk Loading, {size} Points")
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(os.path.join("plots", "rtree_parallel_bulk_load.png"), bbox_inches='tight', pad_inches=0.1, dpi=500)
+
+
+if __name__ == "__main__":
+    test_rt_bulk_load([1000, 5000, 10000, 50000])
+    test_rt_parallel_bulk_load()
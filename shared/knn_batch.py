@@ -0,0 +1,239 @@
+"""
+Batched k-nearest-neighbor search, shared by the quadtree & the R-tree.
+
+Queries are sorted along a Morton (Z-order) curve & answered in batches of
+spatially close queries. The exact neighbors of a batch's first query (a
+best-first search, bounded by the previous batch's answer) bound the
+neighbor distance of every query in the batch, so one range query collects
+the candidates of the whole batch & the ranking is done with NumPy.
+
+The trees plug their node layouts in through callbacks. Ties in distance are
+broken by `x`, then `y`, then by an optional `rank` of the items (for items at
+the very same spot), so a query gets the same neighbors in the same order
+whether it is searched alone or in a batch.
+"""
+import heapq
+import math
+
+import numpy as np
+
+# Relative slack on reused bounds & batch radii, so a point lying exactly on
+# one is never lost to rounding.
+SLACK = 1e-9
+
+
+def morton_order(xs, ys, bits=16):
+    """
+    Returns the indices that sort coordinates along a Morton (Z-order) curve.
+
+    Args:
+        xs (array-like): The X coordinates.
+        ys (array-like): The Y coordinates.
+        bits (int): Optional. The grid resolution per axis, in bits. Default
+            is `16`.
+
+    Returns:
+        numpy.ndarray: The indices of the coordinates in Z-order.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    codes = np.zeros(len(xs), dtype=np.uint64)
+
+    if len(xs) == 0:
+        return codes.astype(np.intp)
+
+    scale = (1 << bits) - 1
+    cells = []
+    for coords in (xs, ys):
+        span = coords.max() - coords.min()
+        norm = (coords - coords.min()) / span if span > 0 else coords * 0
+        cells.append((norm * scale).astype(np.uint64))
+
+    for bit in range(bits):
+        mask = np.uint64(1 << bit)
+        codes |= (cells[0] & mask) << np.uint64(bit)
+        codes |= (cells[1] & mask) << np.uint64(bit + 1)
+
+    return np.argsort(codes, kind="stable")
+
+
+def loosen(bound):
+    """Widens a squared distance bound by `SLACK`, & by at least one ulp."""
+    return math.nextafter(bound + bound * SLACK, math.inf)
+
+
+def best_first(root, query, count, node_distance, expand, bound=math.inf, rank=None):
+    """
+    Finds the `count` nearest items of a query with a best-first search,
+    pruning anything further than the squared distance `bound`.
+
+    Args:
+        root (object): The tree's root node.
+        query (object): The query, passed through to the callbacks.
+        count (int): The number of items to find.
+        node_distance (callable): `(node, query)` -> the squared distance
+            from the query to the node's bounds.
+        expand (callable): `(node, query)` -> `(distances, items, children)`,
+            the squared distances to the node's own items (a list, or a
+            NumPy array for large nodes), those items & its child nodes.
+        bound (float): Optional. The squared distance beyond which items &
+            nodes are pruned. Default is `inf`.
+        rank (callable): Optional. `item` -> a number ordering the items at
+            one spot. Default is `None` (the order they are found in).
+
+    Returns:
+        list: `(squared_distance, item)` pairs, closest first (ties by `x`,
+            then `y`, then `rank`). Fewer than `count` if fewer lie within
+            `bound`.
+    """
+    if count <= 0 or root is None:
+        return []
+
+    # Max-heap of the best candidates so far, as (-dist, -x, -y, -rank,
+    # tiebreak, item), so its top is the one to evict.
+    best = []
+    nodes = [(node_distance(root, query), 0, root)]
+    tiebreak = 1
+
+    while nodes:
+        dist, _, node = heapq.heappop(nodes)
+        if dist > bound:
+            break
+
+        distances, items, children = expand(node, query)
+        if isinstance(distances, np.ndarray):
+            # Array distances: drop the far items in one pass.
+            close = np.flatnonzero(distances <= bound).tolist()
+            distances = distances.tolist()
+        else:
+            close = range(len(items))
+
+        for i in close:
+            # `bound` shrinks as the heap fills, so check again.
+            item_dist = distances[i]
+            if item_dist > bound:
+                continue
+            item = items[i]
+            order = rank(item) if rank is not None else tiebreak
+            entry = (-item_dist, -item.x, -item.y, -order, tiebreak, item)
+            if len(best) < count:
+                heapq.heappush(best, entry)
+            elif entry[:4] > best[0][:4]:
+                heapq.heapreplace(best, entry)
+            else:
+                continue
+            tiebreak += 1
+            if len(best) == count:
+                bound = -best[0][0]
+
+        for child in children:
+            child_dist = node_distance(child, query)
+            if child_dist <= bound:
+                heapq.heappush(nodes, (child_dist, tiebreak, child))
+                tiebreak += 1
+
+    best.sort(reverse=True)
+    return [(-entry[0], entry[5]) for entry in best]
+
+
+def all_nearest(query_xy, count, size, nearest, within, batch_size=None, rank=None):
+    """
+    Answers a kNN query for every query point, in Morton-ordered batches.
+
+    Args:
+        query_xy (numpy.ndarray): The `(n, 2)` query coordinates.
+        count (int): The number of neighbors per query.
+        size (int): The number of items in the tree.
+        nearest (callable): `(x, y, count, bound)` -> the exact `count`
+            nearest items within the squared distance `bound`, as
+            `(squared_distance, item)` pairs, closest first (see
+            `best_first`).
+        within (callable): `(min_x, min_y, max_x, max_y)` -> the items inside
+            the box.
+        batch_size (int): Optional. The number of queries answered per tree
+            traversal. Default is `None`, which sizes batches from the ratio
+            of queries to items (dense queries share candidates, sparse
+            queries are searched one by one).
+        rank (callable): Optional. `item` -> a number ordering the items at
+            one spot, as given to `best_first` by `nearest`. Default is
+            `None` (the order `within` returns them in).
+
+    Returns:
+        tuple: `(items, distances)`, two NumPy arrays of shape `(n, count)`,
+            closest first. `items` holds the items (`None` where the tree has
+            fewer than `count`) & `distances` the euclidean distances (`inf`
+            where missing). Items are ranked by the distance to their `x` &
+            `y`.
+    """
+    query_xy = np.asarray(query_xy, dtype=np.float64).reshape(-1, 2)
+    items = np.full((len(query_xy), count), None, dtype=object)
+    distances = np.full((len(query_xy), count), np.inf)
+
+    found = min(count, size)
+    if len(query_xy) == 0 or found <= 0:
+        return items, distances
+
+    if batch_size is None:
+        batch_size = max(1, min(128, round(2 * len(query_xy) / size)))
+
+    order = morton_order(query_xy[:, 0], query_xy[:, 1])
+    bound = math.inf
+    previous = None
+
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        batch_xy = query_xy[batch]
+
+        # Exact neighbors of the first query, reusing the last bound moved by
+        # the distance between the two. Should rounding still cut a neighbor
+        # off, search again without a bound.
+        first = batch_xy[0]
+        if previous is not None:
+            bound = loosen((math.sqrt(bound) + math.dist(first, previous)) ** 2)
+        seeds = nearest(first[0], first[1], found, bound)
+        if len(seeds) < found:
+            seeds = nearest(first[0], first[1], found, math.inf)
+        if not seeds:
+            return items, distances
+        found = len(seeds)
+        previous, bound = first, seeds[-1][0]
+
+        if len(batch) == 1:
+            items[batch[0], :found] = [item for _, item in seeds]
+            distances[batch[0], :found] = [math.sqrt(dist) for dist, _ in seeds]
+            continue
+
+        # Any query's neighbors are no further than the seeds.
+        seed_xy = np.array([(item.x, item.y) for _, item in seeds])
+        seed_dist = ((batch_xy[:, None, :] - seed_xy[None, :, :]) ** 2).sum(axis=2)
+        radius = math.sqrt(loosen(seed_dist.max()))
+
+        candidates = within(
+            batch_xy[:, 0].min() - radius, batch_xy[:, 1].min() - radius,
+            batch_xy[:, 0].max() + radius, batch_xy[:, 1].max() + radius,
+        )
+        cand_xy = np.array([(item.x, item.y) for item in candidates]).reshape(-1, 2)
+        cand_items = np.empty(len(candidates), dtype=object)
+        cand_items[:] = candidates
+
+        cand_dist = (
+            (batch_xy[:, 0, None] - cand_xy[None, :, 0]) ** 2
+            + (batch_xy[:, 1, None] - cand_xy[None, :, 1]) ** 2
+        )
+        # Ranked by distance, then x, then y, then rank, as `best_first` does.
+        shape = cand_dist.shape
+        if rank is not None:
+            cand_rank = np.array([rank(item) for item in candidates], dtype=np.float64)
+        else:
+            cand_rank = np.arange(len(candidates), dtype=np.float64)
+        nearest_idx = np.lexsort((
+            np.broadcast_to(cand_rank, shape),
+            np.broadcast_to(cand_xy[:, 1], shape),
+            np.broadcast_to(cand_xy[:, 0], shape),
+            cand_dist,
+        ))[:, :found]
+
+        items[batch, :found] = cand_items[nearest_idx]
+        distances[batch, :found] = np.sqrt(np.take_along_axis(cand_dist, nearest_idx, axis=1))
+
+    return items, distances
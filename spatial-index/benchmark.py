@@ -0,0 +1,433 @@
+"""
+Reproducible benchmarks for every `SpatialIndex` backend.
+
+Datasets are seeded (uniform & clustered synthetic points, plus the San
+Antonio parks GeoJSON), every measurement has warm-up runs & repeats, and the
+median & p95 of each are written to a JSON results file. Given a baseline
+results file, any measurement whose median got slower by more than the
+threshold is reported & the run exits with status `1`.
+
+Usage:
+    python spatial-index/benchmark.py --output results.json
+    python spatial-index/benchmark.py --baseline baseline.json --threshold 0.2
+    python spatial-index/benchmark.py --output baseline.json  # refresh it
+
+Without `--output`, results go to `benchmark_results.json` in the working
+directory, which git ignores. Timings depend on the machine, so a baseline is
+measured there, with the default warm-up & repeats, rather than shipped.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import shapely
+
+from spatial_index import BACKENDS, ROOT, reference_points
+
+PARKS_FILE = os.path.join(ROOT, "gis_data", "parks_sanantonio.geojson")
+
+
+class STRtreeIndex(object):
+    """
+    A `SpatialIndex` on shapely's `STRtree`, as a reference.
+
+    `STRtree` only finds the single nearest geometry, so k-nearest searches
+    widen a radius search until it holds `k` points.
+    """
+
+    name = "strtree"
+
+    def build(self, points):
+        points = list(points)
+        self.idents = [ident for ident, _, _ in points]
+        self.xs = np.array([x for _, x, _ in points], dtype=np.float64)
+        self.ys = np.array([y for _, _, y in points], dtype=np.float64)
+        self.tree = shapely.STRtree(shapely.points(self.xs, self.ys))
+        area = max(np.ptp(self.xs) * np.ptp(self.ys), 1e-12) if points else 1
+        self.density = len(points) / area
+        return self
+
+    def __len__(self):
+        return len(self.idents)
+
+    def _results(self, indices):
+        return [
+            (self.idents[i], float(self.xs[i]), float(self.ys[i]))
+            for i in indices
+        ]
+
+    def range_search(self, bbox):
+        return self._results(self.tree.query(shapely.box(*bbox)))
+
+    def within_radius(self, point, radius):
+        return self._results(
+            self.tree.query(shapely.Point(point), predicate="dwithin", distance=radius)
+        )
+
+    def nearest_neighbors(self, point, k=1):
+        k = min(k, len(self.idents))
+        if k == 0:
+            return []
+
+        x, y = point
+        radius = np.sqrt(k / (np.pi * self.density))
+        while True:
+            found = self.tree.query(shapely.Point(point), predicate="dwithin", distance=radius)
+            if len(found) >= k:
+                break
+            radius *= 2
+
+        dists = (self.xs[found] - x) ** 2 + (self.ys[found] - y) ** 2
+        return self._results(found[np.argsort(dists, kind="stable")[:k]])
+
+    def point_query(self, point):
+        return self._results(
+            self.tree.query(shapely.Point(point), predicate="intersects")
+        )
+
+
+ENGINES = dict(BACKENDS, **{STRtreeIndex.name: STRtreeIndex})
+
+
+def load_parks():
+    """
+    Loads the parks GeoJSON as `(ident, lon, lat)` points.
+
+    Returns:
+        list: The points, identified by their OpenStreetMap `@id`.
+    """
+    with open(PARKS_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    return [
+        (feature["properties"].get("@id", i), *feature["geometry"]["coordinates"])
+        for i, feature in enumerate(data["features"])
+        if feature["geometry"] and feature["geometry"]["type"] == "Point"
+    ]
+
+
+def load_datasets(sizes, seed):
+    """
+    Builds the seeded benchmark datasets.
+
+    Args:
+        sizes (list): The sizes of the synthetic datasets.
+        seed (int): The random seed.
+
+    Returns:
+        list: `(name, points)` pairs.
+    """
+    datasets = []
+    for kind in ("uniform", "clustered"):
+        for size in sizes:
+            datasets.append(("{}-{}".format(kind, size), reference_points(kind, size, seed)))
+    datasets.append(("parks", load_parks()))
+    return datasets
+
+
+def make_queries(points, count, seed):
+    """
+    Draws a seeded query workload around the data.
+
+    Queries are centered on data points & sized to hold about ten points if
+    the data were uniform over its extent.
+
+    Returns:
+        dict: The arguments of each query operation.
+    """
+    rng = np.random.default_rng(seed)
+    xs = np.array([x for _, x, _ in points])
+    ys = np.array([y for _, _, y in points])
+    area = max(np.ptp(xs) * np.ptp(ys), 1e-12)
+    half = np.sqrt(10 * area / len(points)) / 2
+    radius = np.sqrt(10 * area / (np.pi * len(points)))
+    centers = [(float(xs[i]), float(ys[i])) for i in rng.integers(0, len(points), count)]
+
+    return {
+        "range": [((x - half, y - half, x + half, y + half),) for x, y in centers],
+        "radius": [((x, y), radius) for x, y in centers],
+        "knn": [((x, y), 10) for x, y in centers],
+        "point": [((x, y),) for x, y in centers],
+    }
+
+
+def make_outside_queries(points):
+    """
+    Builds queries centered outside the data's extent (past each corner &
+    side, near & far), which every engine must answer like the scan does.
+
+    Returns:
+        dict: The arguments of each query operation.
+    """
+    xs = np.array([x for _, x, _ in points])
+    ys = np.array([y for _, _, y in points])
+    width = np.ptp(xs) or 1.0
+    height = np.ptp(ys) or 1.0
+    centers = [
+        (float(xs.min() + fx * width), float(ys.min() + fy * height))
+        for fx in (-10, -0.2, 0.5, 1.2, 10)
+        for fy in (-10, -0.2, 0.5, 1.2, 10)
+        if not (fx == 0.5 and fy == 0.5)
+    ]
+    half = max(width, height) / 2
+
+    return {
+        "range": [((x - half, y - half, x + half, y + half),) for x, y in centers],
+        "radius": [((x, y), half) for x, y in centers],
+        "knn": [((x, y), k) for x, y in centers for k in (1, 10)],
+        "point": [((x, y),) for x, y in centers],
+    }
+
+
+def summarize(samples, per=1):
+    # `samples` are whole-batch timings; `per` is the number of operations in
+    # a batch. The batch median is kept to judge if a measurement is noise.
+    samples = np.asarray(samples)
+    return {
+        "median": float(np.median(samples)) / per,
+        "p95": float(np.percentile(samples, 95)) / per,
+        "min": float(samples.min()) / per,
+        "batch_median": float(np.median(samples)),
+        "runs": len(samples),
+    }
+
+
+def time_runs(run, warmup, repeats):
+    for _ in range(warmup):
+        run()
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def check_results(engine, reference, queries):
+    """
+    Checks an engine agrees with the brute force scan on a workload.
+
+    Raises:
+        AssertionError: On the first query answered differently.
+    """
+    methods = {
+        "range": "range_search", "radius": "within_radius",
+        "knn": "nearest_neighbors", "point": "point_query",
+    }
+    for operation, method in methods.items():
+        for args in queries[operation]:
+            got = getattr(engine, method)(*args)
+            expected = getattr(reference, method)(*args)
+            if operation == "knn":
+                # Ties may be broken differently, so compare distances.
+                x, y = args[0]
+                got = [round((px - x) ** 2 + (py - y) ** 2, 9) for _, px, py in got]
+                expected = [round((px - x) ** 2 + (py - y) ** 2, 9) for _, px, py in expected]
+            else:
+                got = sorted(map(repr, got))
+                expected = sorted(map(repr, expected))
+            if got != expected:
+                raise AssertionError(
+                    "{} {} disagrees with the scan for {}".format(engine.name, operation, args)
+                )
+
+
+def check_batches(index, queries):
+    """
+    Checks an index's batch methods answer a workload exactly as its single
+    queries do (same results, same order).
+
+    Raises:
+        AssertionError: On the first operation answered differently.
+    """
+    calls = {
+        "range": (index.range_search, lambda args: index.range_search_batch([a[0] for a in args])),
+        "radius": (index.within_radius, lambda args: index.within_radius_batch(
+            [a[0] for a in args], [a[1] for a in args])),
+        "knn": (index.nearest_neighbors, lambda args: index.nearest_neighbors_batch(
+            [a[0] for a in args], args[0][1])),
+        "point": (index.point_query, lambda args: index.point_query_batch([a[0] for a in args])),
+    }
+    for operation, (single, batch) in calls.items():
+        args = queries[operation]
+        # kNN batches share one `k`.
+        groups = {}
+        for arg in args:
+            groups.setdefault(arg[1] if operation == "knn" else None, []).append(arg)
+        for group in groups.values():
+            if batch(group) != [single(*arg) for arg in group]:
+                raise AssertionError(
+                    "{} {} batches disagree with single queries".format(index.name, operation)
+                )
+
+
+def measure_work(index, queries):
+    """
+    Averages the `explain` stats of an index over a workload.
+
+    Returns:
+        dict: The mean of each stat, per query, for `range` & `knn`.
+    """
+    work = {}
+    for operation, method in (("range", index.range_search), ("knn", index.nearest_neighbors)):
+        totals = {}
+        for args in queries[operation]:
+            _, stats = method(*args, explain=True)
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        work[operation] = {key: value / len(queries[operation]) for key, value in totals.items()}
+    return work
+
+
+def run_benchmarks(sizes=(1000, 10000), engines=None, queries=200, warmup=1, repeats=5, seed=0):
+    """
+    Times every engine on every dataset.
+
+    Builds are timed whole; each query operation is timed over the whole
+    workload & reported per query. For the backends that can `explain`
+    their queries, range & kNN measurements also get the mean `work` done
+    per query (nodes visited & pruned, points tested, ...).
+
+    Args:
+        sizes (tuple): Optional. The sizes of the synthetic datasets.
+            Default is `(1000, 10000)`.
+        engines (list): Optional. The engines to run. Default is `None`
+            (all of `ENGINES`).
+        queries (int): Optional. The number of queries of each kind. Default
+            is `200`.
+        warmup (int): Optional. Untimed runs before each measurement.
+            Default is `1`.
+        repeats (int): Optional. Timed runs of each measurement. Default is
+            `5`.
+        seed (int): Optional. The random seed. Default is `0`.
+
+    Returns:
+        dict: The run's `meta`data & its `results`, keyed by
+            `dataset/engine/operation`, in seconds.
+    """
+    engines = list(engines or ENGINES)
+    results = {}
+
+    for dataset, points in load_datasets(sizes, seed):
+        workload = make_queries(points, queries, seed)
+        reference = BACKENDS["scan"]().build(points)
+
+        for name in engines:
+            engine = ENGINES[name]
+            print("{} / {}".format(dataset, name), file=sys.stderr)
+
+            samples = time_runs(lambda: engine().build(points), warmup, repeats)
+            results["{}/{}/build".format(dataset, name)] = summarize(samples)
+
+            index = engine().build(points)
+            check_results(index, reference, workload)
+            check_results(index, reference, make_outside_queries(points))
+            if name in BACKENDS:
+                check_batches(index, workload)
+                check_batches(index, make_outside_queries(points))
+            work = measure_work(index, workload) if name in BACKENDS else {}
+
+            for operation, method in (
+                ("range", index.range_search), ("radius", index.within_radius),
+                ("knn", index.nearest_neighbors), ("point", index.point_query),
+            ):
+                args = workload[operation]
+
+                def run():
+                    for arg in args:
+                        method(*arg)
+
+                samples = time_runs(run, warmup, repeats)
+                stats = summarize(samples, queries)
+                if operation in work:
+                    stats["work"] = work[operation]
+                results["{}/{}/{}".format(dataset, name, operation)] = stats
+
+    meta = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "shapely": shapely.__version__,
+        "machine": platform.machine(),
+        "sizes": list(sizes),
+        "queries": queries,
+        "warmup": warmup,
+        "repeats": repeats,
+        "seed": seed,
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare(results, baseline, threshold=0.2, min_time=1e-3):
+    """
+    Finds the measurements that regressed against a baseline.
+
+    Args:
+        results (dict): A `run_benchmarks` output.
+        baseline (dict): An earlier `run_benchmarks` output.
+        threshold (float): Optional. The allowed slowdown of a median, as a
+            fraction. Default is `0.2` (20%).
+        min_time (float): Optional. Measurements whose baseline batch took
+            less than this many seconds are too noisy to judge & skipped.
+            Default is `0.001`.
+
+    Returns:
+        list: `(key, baseline median, median, ratio)` for each regression.
+    """
+    regressions = []
+    for key, stats in results["results"].items():
+        before = baseline["results"].get(key)
+        if before is None or before.get("batch_median", before["median"]) < min_time:
+            continue
+        ratio = stats["median"] / before["median"]
+        if ratio > 1 + threshold:
+            regressions.append((key, before["median"], stats["median"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown of a median (0.2 = 20%%)")
+    parser.add_argument("--min-time", type=float, default=1e-3, help="skip measurements whose baseline batch took less (seconds)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="synthetic dataset sizes")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), help="engines to run (default: all)")
+    parser.add_argument("--queries", type=int, default=200, help="queries of each kind")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per measurement")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        sizes=args.sizes, engines=args.engines, queries=args.queries,
+        warmup=args.warmup, repeats=args.repeats, seed=args.seed,
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    for key, stats in sorted(results["results"].items()):
+        line = "{:45} median {:12.6f}s  p95 {:12.6f}s".format(key, stats["median"], stats["p95"])
+        if "work" in stats:
+            line += "  nodes {nodes_visited:8.1f}  points {points_tested:9.1f}".format(**stats["work"])
+        print(line)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_time)
+        for key, before, after, ratio in regressions:
+            print("REGRESSION {}: {:.6f}s -> {:.6f}s ({:+.0%})".format(key, before, after, ratio - 1))
+        if regressions:
+            return 1
+        print("No regressions beyond {:.0%} against {}".format(args.threshold, args.baseline))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""
+An open-loop load generator for the query path.
+
+Queries are sent at a target rate with exponential (Poisson) gaps, whether or
+not earlier ones have come back, & each latency is counted from when its
+query was *due*. A slow server therefore shows up as growing latencies, not
+as a lower send rate. The queries are a seeded mix of bounding boxes of many
+sizes, radius searches, kNN searches with several `k` & exact point lookups,
+around the San Antonio parks.
+
+The target is either an index in this process (queried from a thread pool)
+or a running query service (see `server.py`), over keep-alive connections.
+The report is JSON: throughput, p50/p95/p99/p99.9 latency & errors, overall
+& per operation.
+
+Usage:
+    python spatial-index/loadgen.py --backend quadtree --qps 2000 --duration 10
+    python spatial-index/loadgen.py --url http://127.0.0.1:8080 --qps 2000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+from benchmark import load_parks
+from server import ENDPOINTS, parse_query, run_batch
+from spatial_index import BACKENDS, create_index
+
+# The share of each operation in the default mix.
+DEFAULT_MIX = {"range": 0.4, "knn": 0.3, "radius": 0.2, "point": 0.1}
+# The `k` of kNN queries, drawn uniformly.
+KNN_KS = (1, 5, 10, 50, 100)
+# Box sides & radii, as fractions of the data's extent, drawn log-uniformly.
+SIZE_RANGE = (0.001, 0.1)
+PERCENTILES = {"p50": 50, "p95": 95, "p99": 99, "p99.9": 99.9}
+
+PATHS = {operation: path for path, (operation, _, _) in ENDPOINTS.items()}
+
+
+def make_workload(points, count, mix=None, seed=0):
+    """
+    Draws a seeded query mix around a dataset.
+
+    Queries are centered on data points. Box sides & radii are log-uniform
+    over `SIZE_RANGE` of the data's extent, so most queries are small & a
+    few return large result sets.
+
+    Args:
+        points (list): The `(ident, x, y)` points.
+        count (int): The number of queries.
+        mix (dict): Optional. The weight of each operation. Default is `None`
+            (`DEFAULT_MIX`).
+        seed (int): Optional. The random seed. Default is `0`.
+
+    Returns:
+        list: `(operation, params)` pairs, `params` being the endpoint's
+            parameters.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = np.random.default_rng(seed)
+    xs = np.array([x for _, x, _ in points])
+    ys = np.array([y for _, _, y in points])
+    width = np.ptp(xs) or 1.0
+    height = np.ptp(ys) or 1.0
+
+    operations = list(mix)
+    weights = np.array([mix[op] for op in operations], dtype=np.float64)
+    picks = rng.choice(len(operations), size=count, p=weights / weights.sum())
+    centers = rng.integers(0, len(points), count)
+    low, high = np.log(SIZE_RANGE[0]), np.log(SIZE_RANGE[1])
+    sizes = np.exp(rng.uniform(low, high, count))
+    ks = rng.choice(KNN_KS, count)
+
+    workload = []
+    for op_index, i, size, k in zip(picks, centers, sizes, ks):
+        operation = operations[op_index]
+        x, y = float(xs[i]), float(ys[i])
+        if operation == "range":
+            half_w, half_h = size * width / 2, size * height / 2
+            params = {"min_x": x - half_w, "min_y": y - half_h, "max_x": x + half_w, "max_y": y + half_h}
+        elif operation == "radius":
+            params = {"x": x, "y": y, "r": size * min(width, height) / 2}
+        elif operation == "knn":
+            params = {"x": x, "y": y, "k": int(k)}
+        else:
+            params = {"x": x, "y": y}
+        workload.append((operation, params))
+    return workload
+
+
+def arrival_times(count, qps, seed=0):
+    """
+    Returns the due times of `count` queries at an average of `qps` per
+    second, with exponential gaps (a Poisson process), from `0`.
+    """
+    rng = np.random.default_rng(seed + 1)
+    return np.cumsum(rng.exponential(1.0 / qps, count))
+
+
+class InProcessTarget(object):
+    """Answers queries with an index in this process, on a thread pool."""
+
+    def __init__(self, index, workers=1):
+        self.index = index
+        self.name = "inprocess:{}".format(index.name)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def query(self, operation, params):
+        _, args = parse_query(PATHS[operation], params)
+        loop = asyncio.get_running_loop()
+        result, = await loop.run_in_executor(
+            self._executor, run_batch, self.index, operation, [args],
+        )
+        if isinstance(result, Exception):
+            raise result
+        return len(result)
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class HTTPTarget(object):
+    """
+    Sends queries to a query service, over a pool of keep-alive connections.
+
+    A query waits for a free connection once all `connections` are busy, &
+    that wait counts toward its latency.
+    """
+
+    def __init__(self, url, connections=64, timeout=10.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.name = url
+        self.timeout = timeout
+        self._idle = []
+        self._slots = asyncio.Semaphore(connections)
+
+    async def query(self, operation, params):
+        async with self._slots:
+            if self._idle:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                status, body = await asyncio.wait_for(
+                    self._exchange(reader, writer, operation, params), self.timeout,
+                )
+            except BaseException:
+                writer.close()
+                raise
+            self._idle.append((reader, writer))
+
+        if status != 200:
+            raise HTTPError(status)
+        return json.loads(body)["count"]
+
+    async def _exchange(self, reader, writer, operation, params):
+        request = "GET {}?{} HTTP/1.1\r\nHost: {}\r\n\r\n".format(
+            PATHS[operation], urlencode(params), self.host,
+        )
+        writer.write(request.encode("latin-1"))
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            return status, b"".join(chunks)
+        return status, await reader.readexactly(int(headers.get("content-length") or 0))
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__("HTTP {}".format(status))
+        self.status = status
+
+
+def summarize(latencies):
+    """Returns the count, mean, max & `PERCENTILES` of latencies, in ms."""
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1000
+    summary = {"count": len(values), "mean_ms": float(values.mean()), "max_ms": float(values.max())}
+    for name, q in PERCENTILES.items():
+        summary[name + "_ms"] = float(np.percentile(values, q))
+    return summary
+
+
+async def run_load(target, workload, qps, seed=0):
+    """
+    Sends a workload open-loop & measures it.
+
+    Args:
+        target (InProcessTarget|HTTPTarget): Where to send the queries.
+        workload (list): `(operation, params)` pairs, see `make_workload`.
+        qps (float): The target rate, in queries per second.
+        seed (int): Optional. The seed of the arrival times. Default is `0`.
+
+    Returns:
+        dict: The report.
+    """
+    loop = asyncio.get_running_loop()
+    due = arrival_times(len(workload), qps, seed)
+    latencies = {}
+    errors = {}
+    results = 0
+    lag = 0.0
+
+    async def fire(operation, params, due_at):
+        nonlocal results
+        try:
+            results += await target.query(operation, params)
+        except Exception as e:
+            key = "{}: {}".format(operation, getattr(e, "status", None) or type(e).__name__)
+            errors[key] = errors.get(key, 0) + 1
+        else:
+            latencies.setdefault(operation, []).append(loop.time() - due_at)
+
+    start = loop.time()
+    tasks = []
+    for (operation, params), offset in zip(workload, due):
+        delay = start + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            lag = max(lag, -delay)
+        tasks.append(loop.create_task(fire(operation, params, start + offset)))
+    sent = loop.time() - start
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+    await target.close()
+
+    completed = sum(len(values) for values in latencies.values())
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        "target": target.name,
+        "target_qps": qps,
+        "queries": len(workload),
+        "completed": completed,
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "send_seconds": sent,
+        "elapsed_seconds": elapsed,
+        "offered_qps": len(workload) / sent if sent else 0.0,
+        "throughput_qps": completed / elapsed if elapsed else 0.0,
+        "max_send_lag_ms": lag * 1000,
+        "results_returned": results,
+        "latency": summarize(everything),
+        "by_operation": {op: summarize(values) for op, values in sorted(latencies.items())},
+    }
+
+
+def parse_mix(text):
+    # "range=0.5,knn=0.5" -> {"range": 0.5, "knn": 0.5}
+    mix = {}
+    for part in text.split(","):
+        operation, _, weight = part.partition("=")
+        if operation not in PATHS:
+            raise argparse.ArgumentTypeError("Unknown operation {!r}".format(operation))
+        mix[operation] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="query service to load, e.g. http://127.0.0.1:8080 (default: in-process)")
+    parser.add_argument("--backend", default="auto", choices=["auto"] + list(BACKENDS), help="in-process index")
+    parser.add_argument("--workers", type=int, default=1, help="threads querying the in-process index")
+    parser.add_argument("--connections", type=int, default=64, help="keep-alive connections to the service")
+    parser.add_argument("--qps", type=float, default=1000, help="target queries per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--mix", type=parse_mix, help="operation weights, e.g. range=0.4,knn=0.3,radius=0.2,point=0.1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    points = load_parks()
+    workload = make_workload(points, int(args.qps * args.duration), args.mix, args.seed)
+
+    async def run():
+        if args.url:
+            target = HTTPTarget(args.url, args.connections)
+        else:
+            target = InProcessTarget(create_index(points, backend=args.backend), args.workers)
+        return await run_load(target, workload, args.qps, args.seed)
+
+    report = asyncio.run(run())
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+Process-wide latency histograms & counters for index operations.
+
+`instrument` wraps the insert, find, range, radius & kNN methods of an index
+instance (a `QuadTree`, an `RTreeWrapper.RTree` or any `SpatialIndex`), so
+every call is timed into a fixed-bucket histogram & counted, labelled by
+index & operation. Recording can be switched on & off at runtime with
+`enable` / `disable`; when off, a wrapped call costs one flag check.
+
+Snapshots are exported as Prometheus text (`export_prometheus`) or JSON
+(`export_json`), or served from a local HTTP endpoint (`serve`).
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the latency buckets, in seconds (the last is +Inf).
+BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# The methods `instrument` wraps & the operation each one is recorded as.
+OPERATIONS = {
+    "insert": "insert",
+    "build": "insert",
+    "build_from_points": "insert",
+    "build_from_geometries": "insert",
+    "find": "find",
+    "count": "find",
+    "point_query": "find",
+    "within_bb": "range",
+    "range_search": "range",
+    "within_radius": "radius",
+    "nearest_neighbors": "knn",
+}
+
+_enabled = True
+# How deep each thread is in instrumented calls. Only the outermost call is
+# recorded, so a `point_query` built on `range_search` counts once.
+_active = threading.local()
+
+
+def enable():
+    """Starts recording (the default)."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stops recording. Wrapped calls then only check this flag."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+class Histogram(object):
+    """
+    A fixed-bucket latency histogram.
+
+    Observations are counted in the first bucket whose upper bound holds
+    them, so recording is a binary search & an increment.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimates a quantile, interpolating inside its bucket (as
+        Prometheus' `histogram_quantile` does).
+
+        Args:
+            q (float): The quantile, between `0` & `1`.
+
+        Returns:
+            float|None: The estimate, or `None` with no observations.
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    # Past the last bound, the best guess is that bound.
+                    return self.buckets[-1]
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Registry(object):
+    """
+    The process-wide store of histograms & counters, keyed by
+    `(index, operation)`.
+    """
+
+    def __init__(self):
+        self.latency = {}
+        self.calls = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, key):
+        histogram = self.latency.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault(key, Histogram())
+                self.calls.setdefault(key, 0)
+                self.errors.setdefault(key, 0)
+        return histogram
+
+    def record(self, key, seconds, failed=False):
+        self.histogram(key).observe(seconds)
+        with self._lock:
+            self.calls[key] += 1
+            if failed:
+                self.errors[key] += 1
+
+    def reset(self):
+        with self._lock:
+            self.latency.clear()
+            self.calls.clear()
+            self.errors.clear()
+
+
+REGISTRY = Registry()
+
+
+def instrument(index, name=None, registry=REGISTRY):
+    """
+    Times the operations of an index instance into a registry.
+
+    Only this instance is affected: its methods listed in `OPERATIONS` are
+    replaced by timing wrappers.
+
+    Args:
+        index (object): The index instance.
+        name (str): Optional. The `index` label of its metrics. Default is
+            `None` (the class name & the instance's id).
+        registry (Registry): Optional. Where to record. Default is
+            `REGISTRY`.
+
+    Returns:
+        object: The same index, for chaining.
+    """
+    if name is None:
+        name = "{}-{:x}".format(type(index).__name__, id(index))
+
+    for method_name, operation in OPERATIONS.items():
+        method = getattr(index, method_name, None)
+        if method is None or getattr(method, "_instrumented", False):
+            continue
+        setattr(index, method_name, _timed(method, (name, operation), registry))
+
+    return index
+
+
+def uninstrument(index):
+    """
+    Restores the methods `instrument` replaced on an instance.
+    """
+    for method_name in OPERATIONS:
+        method = index.__dict__.get(method_name)
+        if getattr(method, "_instrumented", False):
+            delattr(index, method_name)
+
+
+def _timed(method, key, registry):
+    registry.histogram(key)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not _enabled or getattr(_active, "depth", 0):
+            return method(*args, **kwargs)
+
+        _active.depth = 1
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            registry.record(key, time.perf_counter() - start, failed=True)
+            raise
+        else:
+            registry.record(key, time.perf_counter() - start)
+        finally:
+            _active.depth = 0
+        return result
+
+    wrapper._instrumented = True
+    return wrapper
+
+
+def _labels(key, **extra):
+    labels = dict(index=key[0], op=key[1], **extra)
+    return ",".join(
+        '{}="{}"'.format(label, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for label, value in labels.items()
+    )
+
+
+def export_prometheus(registry=REGISTRY):
+    """
+    Returns a snapshot in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP spatial_index_operation_seconds Latency of index operations.",
+        "# TYPE spatial_index_operation_seconds histogram",
+    ]
+    for key, histogram in sorted(registry.latency.items()):
+        counts, total, count = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            le = bound if bound == "+Inf" else repr(float(bound))
+            lines.append(
+                "spatial_index_operation_seconds_bucket{{{}}} {}".format(_labels(key, le=le), cumulative)
+            )
+        lines.append("spatial_index_operation_seconds_sum{{{}}} {!r}".format(_labels(key), total))
+        lines.append("spatial_index_operation_seconds_count{{{}}} {}".format(_labels(key), count))
+
+    for metric, values, help_text in (
+        ("spatial_index_operations_total", registry.calls, "Index operations run."),
+        ("spatial_index_errors_total", registry.errors, "Index operations that raised."),
+    ):
+        lines.append("# HELP {} {}".format(metric, help_text))
+        lines.append("# TYPE {} counter".format(metric))
+        for key, value in sorted(values.items()):
+            lines.append("{}{{{}}} {}".format(metric, _labels(key), value))
+
+    return "\n".join(lines) + "\n"
+
+
+def export_json(registry=REGISTRY):
+    """
+    Returns a snapshot as a JSON string, with p50/p95/p99 estimates.
+    """
+    operations = []
+    for key, histogram in sorted(registry.latency.items()):
+        counts, total, count = histogram.snapshot()
+        operations.append({
+            "index": key[0],
+            "op": key[1],
+            "count": count,
+            "errors": registry.errors.get(key, 0),
+            "sum_seconds": total,
+            "p50": histogram.quantile(0.5),
+            "p95": histogram.quantile(0.95),
+            "p99": histogram.quantile(0.99),
+            "buckets": dict(zip([str(b) for b in histogram.buckets] + ["+Inf"], counts)),
+        })
+    return json.dumps({"enabled": _enabled, "operations": operations}, indent=2)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = export_prometheus(self.registry)
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = export_json(self.registry)
+            content_type = "application/json"
+        else:
+            self.send_error(404, "Try /metrics or /metrics.json")
+            return
+
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; keep them out of stderr.
+        pass
+
+
+def serve(host="127.0.0.1", port=9464, registry=REGISTRY):
+    """
+    Serves `/metrics` (Prometheus text) & `/metrics.json` from a background
+    thread.
+
+    Args:
+        host (str): Optional. The address to bind. Default is `127.0.0.1`
+            (local only).
+        port (int): Optional. The port, `0` for any free one. Default is
+            `9464`.
+        registry (Registry): Optional. What to serve. Default is `REGISTRY`.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call `shutdown()` to stop it.
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
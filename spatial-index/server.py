@@ -0,0 +1,533 @@
+"""
+A local HTTP/JSON query service over any `SpatialIndex`, on asyncio.
+
+Endpoints (GET with query parameters, or POST with a JSON object of them):
+
+    /bbox?min_x=..&min_y=..&max_x=..&max_y=..   points inside a box
+    /radius?x=..&y=..&r=..                      points within a distance
+    /knn?x=..&y=..&k=..                         the k nearest points
+    /point?x=..&y=..                            points stored at (x, y)
+    /stats                                      batching & load counters
+
+Answers are `{"count": n, "results": [[ident, x, y], ...]}`.
+
+Queries of one kind arriving within `batch_window` of each other are merged
+into one batch, answered by a single call of the index's batch method (every
+`spatial_index` backend has one per endpoint) on the index's thread, so the
+per-request Python overhead is paid once per batch & nearby queries share
+their tree searches. A query gets the same answer whether it was batched or
+not. Once `max_pending` queries are waiting, new
+ones are turned away with `503` rather than queued without bound, and results
+longer than `stream_threshold` are sent in chunks, each written once the
+client has taken the last.
+
+`serve_threaded` serves the same endpoints with one thread per request, as a
+baseline to compare against.
+
+Usage:
+    python spatial-index/server.py --backend quadtree --port 8080
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from spatial_index import BACKENDS, create_index
+
+# Each endpoint's operation, its parameters & the index method answering it.
+ENDPOINTS = {
+    "/bbox": ("range", ("min_x", "min_y", "max_x", "max_y"), "range_search"),
+    "/radius": ("radius", ("x", "y", "r"), "within_radius"),
+    "/knn": ("knn", ("x", "y", "k"), "nearest_neighbors"),
+    "/point": ("point", ("x", "y"), "point_query"),
+}
+
+# The index method answering a batch of each operation, if it has one.
+BATCH_METHODS = {
+    "range": "range_search_batch",
+    "radius": "within_radius_batch",
+    "knn": "nearest_neighbors_batch",
+    "point": "point_query_batch",
+}
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 503: "Service Unavailable",
+}
+
+
+class QueryError(ValueError):
+    """A request that can't be answered, with the HTTP status to send."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_query(path, params):
+    """
+    Turns an endpoint & its parameters into an index call.
+
+    Args:
+        path (str): The endpoint, like `"/knn"`.
+        params (dict): The parameters, as strings or numbers.
+
+    Returns:
+        tuple: The operation & the arguments of its index method.
+
+    Raises:
+        QueryError: For unknown endpoints & missing or malformed parameters.
+    """
+    if path not in ENDPOINTS:
+        raise QueryError(404, "Unknown endpoint {}, try one of {}".format(path, sorted(ENDPOINTS)))
+
+    operation, names, _ = ENDPOINTS[path]
+    try:
+        values = [float(params[name]) for name in names]
+    except KeyError as e:
+        raise QueryError(400, "Missing parameter {}".format(e.args[0]))
+    except (TypeError, ValueError):
+        raise QueryError(400, "Parameters {} must be numbers".format(", ".join(names)))
+
+    if operation == "range":
+        return operation, (tuple(values),)
+    if operation == "radius":
+        return operation, ((values[0], values[1]), values[2])
+    if operation == "knn":
+        if values[2] < 1 or values[2] != int(values[2]):
+            raise QueryError(400, "k must be a positive integer")
+        return operation, ((values[0], values[1]), int(values[2]))
+    return operation, ((values[0], values[1]),)
+
+
+def run_batch(index, operation, batch):
+    """
+    Answers a batch of queries of one kind.
+
+    Batches of more than one query go to the index's batch method
+    (`BATCH_METHODS`), which answers them as the single queries would; kNN
+    queries are grouped by `k`. An index without one answers query by query.
+
+    Returns:
+        list: Each query's results, or the exception it raised. When a batch
+            call raises, each of its queries gets that exception.
+    """
+    batch_method = getattr(index, BATCH_METHODS[operation], None)
+    if len(batch) == 1 or batch_method is None:
+        method = getattr(index, next(m for op, _, m in ENDPOINTS.values() if op == operation))
+        results = []
+        for args in batch:
+            try:
+                results.append(method(*args))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    # (query indices, batch method arguments) of each call.
+    if operation == "radius":
+        calls = [(range(len(batch)), ([point for point, _ in batch], [r for _, r in batch]))]
+    elif operation == "knn":
+        by_k = {}
+        for i, (_, k) in enumerate(batch):
+            by_k.setdefault(k, []).append(i)
+        calls = [(indices, ([batch[i][0] for i in indices], k)) for k, indices in by_k.items()]
+    else:
+        calls = [(range(len(batch)), ([args[0] for args in batch],))]
+
+    results = [None] * len(batch)
+    for indices, args in calls:
+        try:
+            answers = batch_method(*args)
+        except Exception as e:
+            answers = [e] * len(indices)
+        for i, answer in zip(indices, answers):
+            results[i] = answer
+    return results
+
+
+def _encode(results):
+    return json.dumps([list(result) for result in results], default=str)
+
+
+class QueryServer(object):
+    """
+    The asyncio query service over one index.
+
+    All index calls run on a single thread, one batch at a time, so the
+    index needs no locking & the event loop never waits on a query.
+    """
+
+    def __init__(self, index, host="127.0.0.1", port=8080, batch_window=0.0005,
+                 max_batch=256, max_pending=4096, stream_threshold=5000,
+                 stream_chunk=1000):
+        """
+        Args:
+            index (SpatialIndex): The built index to query.
+            host (str): Optional. The address to bind. Default is
+                `127.0.0.1` (local only).
+            port (int): Optional. The port, `0` for any free one. Default is
+                `8080`.
+            batch_window (float): Optional. How long a batch waits for more
+                queries once its first arrives, in seconds. `0` only merges
+                the queries that queued up while the last batch ran. Default
+                is `0.0005`.
+            max_batch (int): Optional. The most queries in one batch. Default
+                is `256`.
+            max_pending (int): Optional. The most queries waiting or running
+                before new ones get `503`. Default is `4096`.
+            stream_threshold (int): Optional. Results longer than this are
+                streamed in chunks. Default is `5000`.
+            stream_chunk (int): Optional. Results per streamed chunk. Default
+                is `1000`.
+        """
+        self.index = index
+        self.host = host
+        self.port = port
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.stream_threshold = stream_threshold
+        self.stream_chunk = stream_chunk
+
+        self.pending = 0
+        self.stats = {"requests": 0, "rejected": 0, "errors": 0, "batches": 0, "batched_queries": 0}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index")
+        self._queues = {}
+        self._workers = []
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    async def start(self):
+        """Binds the port & starts the batchers. `port` is then the bound one."""
+        self._loop = asyncio.get_running_loop()
+        for operation, _, _ in ENDPOINTS.values():
+            self._queues[operation] = asyncio.Queue()
+            self._workers.append(self._loop.create_task(self._batcher(operation)))
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+    def shutdown(self):
+        """Stops a server started with `serve`, from any other thread."""
+        asyncio.run_coroutine_threadsafe(self.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def query(self, operation, args):
+        """
+        Queues one query for the next batch of its kind & waits for it.
+
+        Raises:
+            QueryError: `503` if `max_pending` queries are already waiting.
+        """
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise QueryError(503, "Too many queries pending, retry later")
+
+        self.pending += 1
+        try:
+            future = self._loop.create_future()
+            self._queues[operation].put_nowait((args, future))
+            return await future
+        finally:
+            self.pending -= 1
+
+    async def _batcher(self, operation):
+        queue = self._queues[operation]
+        while True:
+            batch = [await queue.get()]
+            if self.batch_window and queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            # Skip queries whose clients went away while they waited.
+            batch = [(args, future) for args, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["batched_queries"] += len(batch)
+            try:
+                results = await self._loop.run_in_executor(
+                    self._executor, run_batch, self.index, operation,
+                    [args for args, _ in batch],
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, method, target, body)
+                if not keep_alive:
+                    break
+        except QueryError as e:
+            # A malformed request: answer it, then drop the connection, as
+            # where the next request starts is unknown.
+            try:
+                await self._send_error(writer, e.status, str(e))
+            except ConnectionError:
+                pass
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        # Raises `QueryError` (400) for a malformed request line or headers.
+        line = await reader.readline()
+        if not line.strip():
+            return None
+
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise QueryError(400, "Malformed request line")
+        method, target, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, colon, value = line.decode("latin-1").partition(":")
+            if not colon:
+                raise QueryError(400, "Malformed header line")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise QueryError(400, "Content-Length must be a non-negative integer")
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+
+    async def _respond(self, writer, method, target, body):
+        self.stats["requests"] += 1
+        url = urlsplit(target)
+        try:
+            if url.path == "/stats":
+                await self._send(writer, 200, json.dumps(self.snapshot()).encode("utf-8"))
+                return
+            if method == "POST":
+                params = json.loads(body or b"{}")
+                if not isinstance(params, dict):
+                    raise QueryError(400, "The body must be a JSON object")
+            elif method == "GET":
+                params = dict(parse_qsl(url.query))
+            else:
+                raise QueryError(405, "Use GET or POST")
+
+            operation, args = parse_query(url.path, params)
+            results = await self.query(operation, args)
+        except QueryError as e:
+            await self._send_error(writer, e.status, str(e))
+            return
+        except Exception as e:
+            await self._send_error(writer, 400 if isinstance(e, ValueError) else 500, str(e))
+            return
+
+        if len(results) <= self.stream_threshold:
+            payload = '{{"count": {}, "results": {}}}'.format(len(results), _encode(results))
+            await self._send(writer, 200, payload.encode("utf-8"))
+            return
+
+        # Streamed: the JSON is written a chunk at a time, waiting for the
+        # client to take each before encoding the next.
+        await self._send(writer, 200, None)
+        opening = '{{"count": {}, "results": ['.format(len(results))
+        await self._write_chunk(writer, opening.encode("utf-8"))
+        for start in range(0, len(results), self.stream_chunk):
+            chunk = _encode(results[start:start + self.stream_chunk])[1:-1]
+            prefix = "," if start else ""
+            await self._write_chunk(writer, (prefix + chunk).encode("utf-8"))
+        await self._write_chunk(writer, b"]}")
+        await self._write_chunk(writer, b"")
+
+    async def _send_error(self, writer, status, message):
+        self.stats["errors"] += 1
+        await self._send(writer, status, json.dumps({"error": message}).encode("utf-8"))
+
+    async def _send(self, writer, status, data):
+        # `data` is `None` to start a chunked response.
+        head = ["HTTP/1.1 {} {}".format(status, STATUS_TEXT.get(status, "Error")),
+                "Content-Type: application/json"]
+        if data is None:
+            head.append("Transfer-Encoding: chunked")
+        else:
+            head.append("Content-Length: {}".format(len(data)))
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + (data or b""))
+        await writer.drain()
+
+    async def _write_chunk(self, writer, data):
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await writer.drain()
+
+    def snapshot(self):
+        stats = dict(self.stats, pending=self.pending)
+        stats["mean_batch"] = (
+            stats["batched_queries"] / stats["batches"] if stats["batches"] else 0.0
+        )
+        return stats
+
+
+def serve(index, host="127.0.0.1", port=8080, **options):
+    """
+    Runs a `QueryServer` on its own event loop, in a background thread.
+
+    Args:
+        index (SpatialIndex): The built index to query.
+        host (str): Optional. The address to bind. Default is `127.0.0.1`.
+        port (int): Optional. The port, `0` for any free one. Default is
+            `8080`.
+        **options: The other `QueryServer` options.
+
+    Returns:
+        QueryServer: The running server (`port` is the bound one); call
+            `shutdown()` to stop it.
+    """
+    server = QueryServer(index, host, port, **options)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+        loop.close()
+
+    server._thread = threading.Thread(target=run, daemon=True)
+    server._thread.start()
+    started.wait()
+    return server
+
+
+class _ThreadedHandler(BaseHTTPRequestHandler):
+    index = None
+    protocol_version = "HTTP/1.1"
+
+    def _answer(self, params):
+        url = urlsplit(self.path)
+        try:
+            operation, args = parse_query(url.path, params)
+            method = getattr(self.index, ENDPOINTS[url.path][2])
+            results = method(*args)
+            status = 200
+            data = '{{"count": {}, "results": {}}}'.format(len(results), _encode(results))
+        except QueryError as e:
+            status, data = e.status, json.dumps({"error": str(e)})
+        except Exception as e:
+            status, data = 400, json.dumps({"error": str(e)})
+
+        data = data.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._answer(dict(parse_qsl(urlsplit(self.path).query)))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            params = {}
+        self._answer(params if isinstance(params, dict) else {})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_threaded(index, host="127.0.0.1", port=8080):
+    """
+    Serves the same endpoints with a thread per request & no batching, as
+    the baseline `QueryServer` is measured against.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call `shutdown()` to stop it.
+    """
+    handler = type("ThreadedHandler", (_ThreadedHandler,), {"index": index})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    from benchmark import load_parks
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", default="auto", choices=["auto"] + list(BACKENDS))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--batch-window", type=float, default=0.0005, help="seconds a batch waits for more queries")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-pending", type=int, default=4096, help="queries waiting before 503s")
+    parser.add_argument("--threaded", action="store_true", help="serve with a thread per request instead")
+    args = parser.parse_args(argv)
+
+    index = create_index(load_parks(), backend=args.backend)
+    print("{} points in a {} index".format(len(index), index.name), file=sys.stderr)
+
+    if args.threaded:
+        server = serve_threaded(index, args.host, args.port)
+        print("Serving on http://{}:{}/ (threaded)".format(args.host, server.server_address[1]), file=sys.stderr)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+
+    async def run():
+        server = await QueryServer(
+            index, args.host, args.port, batch_window=args.batch_window,
+            max_batch=args.max_batch, max_pending=args.max_pending,
+        ).start()
+        print("Serving on http://{}:{}/".format(args.host, server.port), file=sys.stderr)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,922 @@
+"""
+One interface over the quadtree, the R-tree & a plain NumPy scan.
+
+Every backend is built from `(ident, x, y)` points & answers queries with
+`(ident, x, y)` tuples, so callers can switch engines without code changes.
+`create_index` picks the engine from the data & the expected query mix.
+
+Every backend also answers many queries of one kind in one call (the `*_batch`
+methods), with the same results as asking them one by one.
+"""
+import os
+import sys
+import time
+from typing import Protocol, runtime_checkable
+
+import numpy as np
+
+# The trees live in sibling directories, which are run as plain scripts.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("quad-tree", "r-tree", "shared"):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.append(path)
+
+import knn_batch  # noqa: E402
+import quad_tree  # noqa: E402
+import Rtree  # noqa: E402
+import rtreeNN  # noqa: E402
+import RTreeWrapper  # noqa: E402
+
+
+@runtime_checkable
+class SpatialIndex(Protocol):
+    """
+    The queries every backend answers.
+
+    Points go in as `(ident, x, y)` & come back as `(ident, x, y)` tuples.
+    Boxes are `(min_x, min_y, max_x, max_y)`, edges included.
+
+    `range_search` & `nearest_neighbors` also take `explain=True`, returning
+    `(results, stats)` where `stats` is a `QueryStats.as_dict()` of the work
+    done, so backends can be compared by work as well as by time.
+    """
+
+    name: str
+
+    def build(self, points):
+        """Indexes an iterable of `(ident, x, y)` points."""
+
+    def __len__(self):
+        """Returns how many points are indexed."""
+
+    def range_search(self, bbox, explain=False):
+        """Returns the points inside a box (unsorted)."""
+
+    def within_radius(self, point, radius):
+        """Returns the points within `radius` of `(x, y)` (unsorted)."""
+
+    def nearest_neighbors(self, point, k=1, explain=False):
+        """
+        Returns the `k` nearest points of `(x, y)`, closest first (ties by
+        `x`, then `y`, then the order the points were built from).
+        """
+
+    def point_query(self, point):
+        """Returns the points stored at exactly `(x, y)`."""
+
+
+def box_groups(boxes, max_group=64, max_growth=4.0):
+    """
+    Splits box-bounded queries into groups of nearby ones, each answered
+    from one tree search over the group's bounding box.
+
+    Boxes are taken in Morton order of their centers & a group grows while
+    its bounding box covers at most `max_growth` times the boxes' summed
+    area, so a search reads little that none of its queries needs.
+
+    Args:
+        boxes (numpy.ndarray): The `(n, 4)` `(min_x, min_y, max_x, max_y)`
+            boxes.
+        max_group (int): Optional. The most queries in a group. Default is
+            `64`.
+        max_growth (float): Optional. How much larger than its boxes a
+            group's bounding box may get. Default is `4.0`.
+
+    Returns:
+        list: The query indices of each group.
+    """
+    order = knn_batch.morton_order(
+        (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+    )
+    groups = []
+    group, area = [], 0.0
+    for i in order.tolist():
+        min_x, min_y, max_x, max_y = boxes[i].tolist()
+        box_area = (max_x - min_x) * (max_y - min_y)
+        if group and len(group) < max_group:
+            grown = (
+                min(bounds[0], min_x), min(bounds[1], min_y),
+                max(bounds[2], max_x), max(bounds[3], max_y),
+            )
+            grown_area = (grown[2] - grown[0]) * (grown[3] - grown[1])
+            if grown_area <= max_growth * (area + box_area):
+                group.append(i)
+                bounds, area = grown, area + box_area
+                continue
+        if group:
+            groups.append(group)
+        group, bounds, area = [i], (min_x, min_y, max_x, max_y), box_area
+    if group:
+        groups.append(group)
+    return groups
+
+
+def answer_grouped(boxes, search, keep, single):
+    """
+    Answers box-bounded queries in groups (see `box_groups`): one search per
+    group collects the candidates & each query keeps its own with NumPy.
+    Queries left in a group of their own are answered by `single`.
+
+    Results come in the order `search` returns them, which for the trees is
+    the order a single query's search returns them in.
+
+    Args:
+        boxes (numpy.ndarray): The `(n, 4)` bounding box of each query.
+        search (callable): `(min_x, min_y, max_x, max_y)` -> the
+            `(ident, x, y)` results inside the box, edges included.
+        keep (callable): `(indices, xs, ys)` -> a boolean array of shape
+            `(len(indices), len(xs))`, the candidates each query keeps.
+        single (callable): `index` -> the results of that query alone.
+
+    Returns:
+        list: The results of each query.
+    """
+    results = [[] for _ in range(len(boxes))]
+    for group in box_groups(boxes):
+        if len(group) == 1:
+            results[group[0]] = single(group[0])
+            continue
+        candidates = search(
+            float(boxes[group, 0].min()), float(boxes[group, 1].min()),
+            float(boxes[group, 2].max()), float(boxes[group, 3].max()),
+        )
+        if not candidates:
+            continue
+        xs = np.array([x for _, x, _ in candidates], dtype=np.float64)
+        ys = np.array([y for _, _, y in candidates], dtype=np.float64)
+        for i, row in zip(group, keep(group, xs, ys)):
+            results[i] = [candidates[j] for j in np.flatnonzero(row).tolist()]
+    return results
+
+
+def in_boxes(boxes):
+    """Returns an `answer_grouped` `keep` for box queries, edges included."""
+    def keep(indices, xs, ys):
+        q = boxes[indices]
+        return (
+            (xs >= q[:, 0, None]) & (xs <= q[:, 2, None])
+            & (ys >= q[:, 1, None]) & (ys <= q[:, 3, None])
+        )
+    return keep
+
+
+def in_circles(centers, radii):
+    """
+    Returns an `answer_grouped` `keep` for radius queries, with the same
+    test as the single queries, & the bounding boxes to search.
+    """
+    def keep(indices, xs, ys):
+        cx, cy, r = centers[indices, 0], centers[indices, 1], radii[indices]
+        return (xs - cx[:, None]) ** 2 + (ys - cy[:, None]) ** 2 <= (r ** 2)[:, None]
+
+    # Padded, so rounding can't leave a point on the circle outside its box.
+    pad = np.nextafter(radii * (1 + knn_batch.SLACK), np.inf)
+    boxes = np.column_stack([
+        centers[:, 0] - pad, centers[:, 1] - pad, centers[:, 0] + pad, centers[:, 1] + pad,
+    ])
+    return boxes, keep
+
+
+def batch_arrays(points, radii=None):
+    # `(n, 2)` query points, & `(n,)` radii if given.
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if radii is None:
+        return points
+    return points, np.broadcast_to(np.asarray(radii, dtype=np.float64), (len(points),))
+
+
+class QuadTreeIndex(object):
+    """
+    A `SpatialIndex` on `quad_tree.QuadTree`.
+
+    The tree is sized to the data's bounds, as `helper.calculate_boundary`
+    does.
+    """
+
+    name = "quadtree"
+
+    def __init__(self, capacity=None):
+        """
+        Args:
+            capacity (int|str): Optional. The node capacity, or `"auto"`.
+                Default is `None` (`QuadNode.POINT_CAPACITY`).
+        """
+        self.capacity = capacity
+        self.tree = None
+
+    def build(self, points):
+        points = [
+            quad_tree.Point(x, y, {"ident": ident, "seq": seq})
+            for seq, (ident, x, y) in enumerate(points)
+        ]
+        if not points:
+            raise ValueError("Cannot build from empty point list")
+
+        xs = [pnt.x for pnt in points]
+        ys = [pnt.y for pnt in points]
+        # Pad the bounds, so points on the edge aren't on the root's boundary.
+        width = (max(xs) - min(xs)) * 1.1 or 1
+        height = (max(ys) - min(ys)) * 1.1 or 1
+        center = ((max(xs) + min(xs)) / 2, (max(ys) + min(ys)) / 2)
+
+        self.tree = quad_tree.QuadTree(
+            center, width, height, capacity=self.capacity,
+        )
+        for pnt in points:
+            self.tree.insert(pnt)
+        return self
+
+    def __len__(self):
+        return len(self.tree) if self.tree is not None else 0
+
+    @staticmethod
+    def _result(pnt):
+        return (pnt.data["ident"], pnt.x, pnt.y)
+
+    @staticmethod
+    def _rank(pnt):
+        # Points at the same spot rank in build order.
+        return pnt.data["seq"]
+
+    def range_search(self, bbox, explain=False):
+        bb = quad_tree.BoundingBox(*bbox)
+        if explain:
+            points, stats = self.tree.within_bb(bb, explain=True)
+            return [self._result(pnt) for pnt in points], stats.as_dict()
+        return [self._result(pnt) for pnt in self.tree.within_bb(bb)]
+
+    def _search_box(self, min_x, min_y, max_x, max_y):
+        return self.range_search((min_x, min_y, max_x, max_y))
+
+    def range_search_batch(self, bboxes):
+        """
+        Answers many box queries in one call, one tree search per group of
+        nearby boxes (see `answer_grouped`).
+
+        Returns:
+            list: The results of each query, as `range_search` would.
+        """
+        boxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        return answer_grouped(
+            boxes, self._search_box, in_boxes(boxes),
+            lambda i: self._search_box(*boxes[i].tolist()),
+        )
+
+    def within_radius(self, point, radius):
+        return [
+            self._result(pnt) for pnt in self.tree.within_radius(point, radius)
+        ]
+
+    def within_radius_batch(self, points, radii):
+        """
+        Answers many radius queries in one call (see `range_search_batch`).
+
+        Args:
+            points (list): The `(x, y)` centers.
+            radii (float|list): The radius of every query, or of each.
+
+        Returns:
+            list: The results of each query, as `within_radius` would.
+        """
+        centers, radii = batch_arrays(points, radii)
+        boxes, keep = in_circles(centers, radii)
+        return answer_grouped(
+            boxes, self._search_box, keep,
+            lambda i: self.within_radius(tuple(centers[i].tolist()), float(radii[i])),
+        )
+
+    def nearest_neighbors(self, point, k=1, explain=False):
+        # Best-first from the root: unlike `QuadTree.nearest_neighbors`, it
+        # answers queries outside the root too, & ranks ties as
+        # `nearest_neighbors_batch` does.
+        stats = quad_tree.QueryStats(self.tree._root.depth) if explain else None
+        query = self.tree.convert_to_point(point)
+        results = [
+            self._result(pnt)
+            for _, pnt in self.tree._best_first_neighbors(query, k, stats=stats, rank=self._rank)
+        ]
+        if explain:
+            stats.results = len(results)
+            return results, stats.as_dict()
+        return results
+
+    def nearest_neighbors_batch(self, points, k=1):
+        """
+        Answers many kNN queries in one call (see
+        `QuadTree.all_nearest_neighbors`).
+
+        Returns:
+            list: The results of each query, as `nearest_neighbors` would.
+        """
+        neighbors, _ = self.tree.all_nearest_neighbors(points, count=k, rank=self._rank)
+        return [
+            [self._result(pnt) for pnt in row if pnt is not None]
+            for row in neighbors
+        ]
+
+    def point_query(self, point):
+        x, y = point
+        return self.range_search((x, y, x, y))
+
+    def point_query_batch(self, points):
+        """
+        Answers many exact point lookups in one call (see
+        `range_search_batch`).
+        """
+        points = batch_arrays(points)
+        return self.range_search_batch(np.column_stack([points, points]))
+
+
+class RTreeIndex(object):
+    """
+    A `SpatialIndex` on `RTreeWrapper.RTree`.
+    """
+
+    name = "rtree"
+
+    def __init__(self, B=51):
+        """
+        Args:
+            B (int|str): Optional. The node capacity, or `"auto"`. Default is
+                `51`.
+        """
+        self.B = B
+        self.tree = None
+        self._seq = {}
+
+    def build(self, points):
+        points = [Rtree.Point(point) for point in points]
+        # Points at the same spot rank in build order.
+        self._seq = {id(point): seq for seq, point in enumerate(points)}
+        self.tree = RTreeWrapper.RTree(B=self.B)
+        self.tree.build_from_points(points)
+        return self
+
+    def _rank(self, point):
+        return self._seq[id(point)]
+
+    def __len__(self):
+        return self.tree.size if self.tree is not None else 0
+
+    def range_search(self, bbox, explain=False):
+        min_x, min_y, max_x, max_y = bbox
+        if explain:
+            results, stats = self.tree.range_search(
+                [min_x, max_x, min_y, max_y], explain=True,
+            )
+            return results, stats.as_dict()
+        return self.tree.range_search([min_x, max_x, min_y, max_y])
+
+    def _search_box(self, min_x, min_y, max_x, max_y):
+        return self.tree.range_search([min_x, max_x, min_y, max_y])
+
+    def range_search_batch(self, bboxes):
+        """
+        Answers many box queries in one call, one tree search per group of
+        nearby boxes (see `answer_grouped`).
+
+        Returns:
+            list: The results of each query, as `range_search` would.
+        """
+        boxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        return answer_grouped(
+            boxes, self._search_box, in_boxes(boxes),
+            lambda i: self._search_box(*boxes[i].tolist()),
+        )
+
+    def within_radius(self, point, radius):
+        return self.tree.within_radius(point, radius)
+
+    def within_radius_batch(self, points, radii):
+        """
+        Answers many radius queries in one call (see `range_search_batch`).
+
+        Args:
+            points (list): The `(x, y)` centers.
+            radii (float|list): The radius of every query, or of each.
+
+        Returns:
+            list: The results of each query, as `within_radius` would.
+        """
+        centers, radii = batch_arrays(points, radii)
+        boxes, keep = in_circles(centers, radii)
+        return answer_grouped(
+            boxes, self._search_box, keep,
+            lambda i: self.within_radius(tuple(centers[i].tolist()), float(radii[i])),
+        )
+
+    def nearest_neighbors(self, point, k=1, explain=False):
+        if explain:
+            results, stats = self.tree.nearest_neighbors(point, k=k, explain=True)
+            return results, stats.as_dict()
+        # The search batches start from, so ties rank as in
+        # `nearest_neighbors_batch`.
+        return [
+            RTreeWrapper.as_result(pnt)
+            for _, pnt in rtreeNN.bestFirstKNN(self.tree.root, point, k, rank=self._rank)
+        ]
+
+    def nearest_neighbors_batch(self, points, k=1):
+        """
+        Answers many kNN queries in one call (see
+        `RTree.nearest_neighbors_batch`).
+
+        Returns:
+            list: The results of each query, as `nearest_neighbors` would.
+        """
+        return self.tree.nearest_neighbors_batch(points, k, rank=self._rank)
+
+    def point_query(self, point):
+        x, y = point
+        return self.range_search((x, y, x, y))
+
+    def point_query_batch(self, points):
+        """
+        Answers many exact point lookups in one call (see
+        `range_search_batch`).
+        """
+        points = batch_arrays(points)
+        return self.range_search_batch(np.column_stack([points, points]))
+
+
+class ScanIndex(object):
+    """
+    A `SpatialIndex` that tests every point, with NumPy.
+
+    No tree to build or walk, which wins for small datasets & for very few
+    queries.
+    """
+
+    name = "scan"
+
+    def __init__(self):
+        self.idents = np.empty(0, dtype=object)
+        self.xs = np.empty(0)
+        self.ys = np.empty(0)
+
+    def build(self, points):
+        points = list(points)
+        self.idents = np.empty(len(points), dtype=object)
+        self.idents[:] = [ident for ident, _, _ in points]
+        self.xs = np.array([x for _, x, _ in points], dtype=np.float64)
+        self.ys = np.array([y for _, _, y in points], dtype=np.float64)
+        return self
+
+    def __len__(self):
+        return len(self.xs)
+
+    def _results(self, indices):
+        return [
+            (self.idents[i], float(self.xs[i]), float(self.ys[i]))
+            for i in indices
+        ]
+
+    def _explained(self, results):
+        # Every point is tested; there are no nodes.
+        stats = dict.fromkeys(quad_tree.QueryStats.FIELDS, 0)
+        stats.update(points_tested=len(self), results=len(results), pruning_ratio=0.0)
+        return results, stats
+
+    def _blocks(self, count, max_cells):
+        # Query blocks whose masks against every point hold `max_cells`.
+        step = max(1, max_cells // max(1, len(self)))
+        return [slice(start, start + step) for start in range(0, count, step)]
+
+    def range_search(self, bbox, explain=False):
+        min_x, min_y, max_x, max_y = bbox
+        mask = (
+            (self.xs >= min_x) & (self.xs <= max_x)
+            & (self.ys >= min_y) & (self.ys <= max_y)
+        )
+        results = self._results(np.flatnonzero(mask))
+        return self._explained(results) if explain else results
+
+    def range_search_batch(self, bboxes, max_cells=2 ** 16):
+        """
+        Answers many box queries in one call, testing blocks of queries
+        against every point at once.
+
+        Args:
+            bboxes (list): The `(min_x, min_y, max_x, max_y)` boxes.
+            max_cells (int): Optional. The size of the mask computed at
+                once. Default is `2 ** 16`.
+
+        Returns:
+            list: The results of each query, as `range_search` would.
+        """
+        boxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        results = []
+        for block in self._blocks(len(boxes), max_cells):
+            q = boxes[block]
+            mask = (
+                (self.xs[None, :] >= q[:, 0, None]) & (self.xs[None, :] <= q[:, 2, None])
+                & (self.ys[None, :] >= q[:, 1, None]) & (self.ys[None, :] <= q[:, 3, None])
+            )
+            results.extend(self._results(np.flatnonzero(row)) for row in mask)
+        return results
+
+    def _sq_distances(self, point):
+        x, y = point
+        return (self.xs - x) ** 2 + (self.ys - y) ** 2
+
+    def _block_sq_distances(self, block):
+        return (
+            (self.xs[None, :] - block[:, 0, None]) ** 2
+            + (self.ys[None, :] - block[:, 1, None]) ** 2
+        )
+
+    def within_radius(self, point, radius):
+        return self._results(
+            np.flatnonzero(self._sq_distances(point) <= radius ** 2)
+        )
+
+    def within_radius_batch(self, points, radii, max_cells=2 ** 16):
+        """
+        Answers many radius queries in one call (see `range_search_batch`).
+
+        Args:
+            points (list): The `(x, y)` centers.
+            radii (float|list): The radius of every query, or of each.
+            max_cells (int): Optional. The size of the distance matrix
+                computed at once. Default is `2 ** 16`.
+
+        Returns:
+            list: The results of each query, as `within_radius` would.
+        """
+        centers, radii = batch_arrays(points, radii)
+        results = []
+        for block in self._blocks(len(centers), max_cells):
+            mask = self._block_sq_distances(centers[block]) <= (radii[block] ** 2)[:, None]
+            results.extend(self._results(np.flatnonzero(row)) for row in mask)
+        return results
+
+    def _nearest(self, dists, k):
+        # The `k` smallest of `dists`, ties broken by x then y, as the trees
+        # do: everything up to the k-th distance is ranked.
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        if k < len(dists):
+            candidates = np.flatnonzero(dists <= np.partition(dists, k - 1)[k - 1])
+        else:
+            candidates = np.arange(len(dists))
+        ranked = np.lexsort((self.ys[candidates], self.xs[candidates], dists[candidates]))
+        return candidates[ranked[:k]]
+
+    def nearest_neighbors(self, point, k=1, explain=False):
+        results = self._results(self._nearest(self._sq_distances(point), k))
+        return self._explained(results) if explain else results
+
+    def nearest_neighbors_batch(self, points, k=1, max_cells=2 ** 16):
+        """
+        Answers many kNN queries in one call, ranking blocks of queries
+        against every point at once.
+
+        Args:
+            points (list): The `(x, y)` query points.
+            k (int): Optional. The number of neighbors. Default is `1`.
+            max_cells (int): Optional. The size of the distance matrix
+                computed at once. Default is `2 ** 16`.
+
+        Returns:
+            list: The results of each query, as `nearest_neighbors` would.
+        """
+        queries = batch_arrays(points)
+        results = []
+        for block in self._blocks(len(queries), max_cells):
+            for dists in self._block_sq_distances(queries[block]):
+                results.append(self._results(self._nearest(dists, k)))
+        return results
+
+    def point_query(self, point):
+        x, y = point
+        return self._results(np.flatnonzero((self.xs == x) & (self.ys == y)))
+
+    def point_query_batch(self, points):
+        """Answers many exact point lookups in one call."""
+        points = batch_arrays(points)
+        return self.range_search_batch(np.column_stack([points, points]))
+
+
+BACKENDS = {
+    QuadTreeIndex.name: QuadTreeIndex,
+    RTreeIndex.name: RTreeIndex,
+    ScanIndex.name: ScanIndex,
+}
+
+QUERY_TYPES = ("range", "radius", "knn", "point")
+REFERENCE_SIZES = (100, 1000, 10000, 100000)
+
+
+def skewness(xs, ys):
+    """
+    Scores how clustered points are, from `0` (uniform) to `1`.
+
+    The points are binned into a grid of about four points per cell; the
+    score is the share of cells uniform data would fill that are empty.
+
+    Args:
+        xs (array-like): The X coordinates.
+        ys (array-like): The Y coordinates.
+
+    Returns:
+        float: The skew score.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    n = len(xs)
+    if n < 2:
+        return 0.0
+
+    side = max(1, int(np.sqrt(n / 4)))
+    cells = []
+    for coords in (xs, ys):
+        span = coords.max() - coords.min()
+        norm = (coords - coords.min()) / span if span > 0 else coords * 0
+        cells.append(np.minimum((norm * side).astype(np.int64), side - 1))
+
+    occupied = len(np.unique(cells[0] * side + cells[1]))
+    expected = side * side * (1 - np.exp(-n / (side * side)))
+    return float(np.clip(1 - occupied / expected, 0, 1))
+
+
+def reference_points(kind, size, seed=0):
+    """
+    Generates the seeded datasets the cost table is measured on.
+
+    Args:
+        kind (str): `"uniform"` or `"clustered"` (ten tight clusters).
+        size (int): The number of points.
+        seed (int): Optional. The random seed. Default is `0`.
+
+    Returns:
+        list: The `(ident, x, y)` points, in a 100x100 extent.
+    """
+    rng = np.random.default_rng(seed)
+    if kind == "uniform":
+        xs = rng.uniform(0, 100, size)
+        ys = rng.uniform(0, 100, size)
+    else:
+        centers = rng.uniform(0, 100, (10, 2))
+        picks = rng.integers(0, 10, size)
+        xs = np.clip(rng.normal(centers[picks, 0], 0.5), 0, 100)
+        ys = np.clip(rng.normal(centers[picks, 1], 0.5), 0, 100)
+    return [(i, float(x), float(y)) for i, (x, y) in enumerate(zip(xs, ys))]
+
+
+def measure_costs(sizes=REFERENCE_SIZES, queries=200, seed=0):
+    """
+    Times every backend on the reference datasets.
+
+    This is what `COSTS` was generated from. Queries are centered on data
+    points & sized to hold about ten uniform points whatever the dataset
+    size: boxes, radius searches, 10-nearest-neighbor & exact point lookups.
+
+    Args:
+        sizes (tuple): Optional. The dataset sizes. Default is
+            `REFERENCE_SIZES`.
+        queries (int): Optional. The number of each query to time. Default
+            is `200`.
+        seed (int): Optional. The random seed. Default is `0`.
+
+    Returns:
+        dict: `{kind: {backend: {"build": [...], query_type: [...]}}}`, in
+            microseconds (per point for builds, per query otherwise), one
+            value per size.
+    """
+    rng = np.random.default_rng(seed)
+
+    costs = {}
+    for kind in ("uniform", "clustered"):
+        costs[kind] = {
+            name: {key: [] for key in ("build",) + QUERY_TYPES}
+            for name in BACKENDS
+        }
+        for size in sizes:
+            half = 50 * np.sqrt(10 / size)
+            radius = 100 * np.sqrt(10 / (np.pi * size))
+            runs = {
+                "range": lambda index, x, y: index.range_search(
+                    (x - half, y - half, x + half, y + half)
+                ),
+                "radius": lambda index, x, y: index.within_radius((x, y), radius),
+                "knn": lambda index, x, y: index.nearest_neighbors((x, y), k=10),
+                "point": lambda index, x, y: index.point_query((x, y)),
+            }
+            points = reference_points(kind, size, seed)
+            centers = [points[i][1:] for i in rng.integers(0, size, queries)]
+            for name, backend in BACKENDS.items():
+                start = time.perf_counter()
+                index = backend().build(points)
+                elapsed = time.perf_counter() - start
+                costs[kind][name]["build"].append(elapsed / size * 1e6)
+
+                for query_type, run in runs.items():
+                    start = time.perf_counter()
+                    for x, y in centers:
+                        run(index, x, y)
+                    elapsed = time.perf_counter() - start
+                    costs[kind][name][query_type].append(elapsed / queries * 1e6)
+
+    return costs
+
+# Microseconds per point (builds) & per query, at each of `REFERENCE_SIZES`, as
+# measured by `measure_costs()`.
+COSTS = {
+    "uniform": {
+        "quadtree": {
+            "build": [7.3, 9.3, 9.3, 17.6],
+            "range": [18.2, 38.1, 42.9, 83.9],
+            "radius": [81.3, 130.2, 125.5, 174.5],
+            "knn": [184.6, 254.9, 297.9, 301.6],
+            "point": [6.6, 9.9, 19.1, 21.7],
+        },
+        "rtree": {
+            "build": [27.5, 49.0, 69.3, 87.8],
+            "range": [26.8, 42.8, 92.5, 147.1],
+            "radius": [37.5, 62.3, 82.0, 80.8],
+            "knn": [74.8, 93.0, 93.9, 123.8],
+            "point": [15.0, 11.7, 15.2, 23.3],
+        },
+        "scan": {
+            "build": [2.2, 0.2, 0.3, 0.5],
+            "range": [16.3, 16.2, 22.3, 111.7],
+            "radius": [15.4, 18.1, 35.4, 248.3],
+            "knn": [21.7, 19.2, 69.3, 449.0],
+            "point": [8.1, 5.4, 14.1, 61.2],
+        },
+    },
+    "clustered": {
+        "quadtree": {
+            "build": [29.3, 7.9, 11.2, 21.0],
+            "range": [25.8, 80.8, 1374.6, 9416.4],
+            "radius": [37.1, 133.5, 1174.3, 8587.9],
+            "knn": [118.5, 233.2, 389.8, 410.6],
+            "point": [5.0, 9.1, 23.5, 40.5],
+        },
+        "rtree": {
+            "build": [17.2, 36.9, 57.9, 119.5],
+            "range": [17.0, 26.4, 355.1, 3820.6],
+            "radius": [20.3, 26.2, 311.1, 3358.7],
+            "knn": [37.4, 68.2, 140.8, 225.6],
+            "point": [10.3, 18.8, 35.8, 48.3],
+        },
+        "scan": {
+            "build": [0.5, 0.4, 0.5, 0.7],
+            "range": [14.5, 60.2, 603.8, 2866.9],
+            "radius": [13.2, 60.4, 578.4, 3089.3],
+            "knn": [13.8, 18.2, 63.7, 710.8],
+            "point": [4.6, 5.3, 13.8, 96.3],
+        },
+    },
+}
+# The skew score of the clustered reference data.
+CLUSTERED_SKEW = 0.98
+
+
+def _interpolate(values, size):
+    # Log-log interpolation between the reference sizes, extending the end
+    # segments beyond them.
+    log_sizes = np.log(REFERENCE_SIZES)
+    log_values = np.log(values)
+    log_size = np.log(max(size, 1))
+    if log_size <= log_sizes[0]:
+        i = 0
+    elif log_size >= log_sizes[-1]:
+        i = len(log_sizes) - 2
+    else:
+        i = int(np.searchsorted(log_sizes, log_size)) - 1
+
+    slope = (log_values[i + 1] - log_values[i]) / (log_sizes[i + 1] - log_sizes[i])
+    return float(np.exp(log_values[i] + slope * (log_size - log_sizes[i])))
+
+
+def estimate_costs(size, skew=0.0, query_mix=None, query_count=None):
+    """
+    Estimates the time each backend takes to build & answer a workload.
+
+    Costs are read off `COSTS` at the dataset size & blended between the
+    uniform & clustered measurements by skew.
+
+    Args:
+        size (int): The number of points.
+        skew (float): Optional. The data's `skewness` score. Default is `0`.
+        query_mix (dict): Optional. The relative frequency of each of
+            `QUERY_TYPES`. Default is `None` (an even mix).
+        query_count (int): Optional. The number of queries expected over the
+            index's life. Default is `None` (as many as points).
+
+    Returns:
+        dict: The estimated total time of each backend, in seconds.
+    """
+    if query_mix is None:
+        query_mix = dict.fromkeys(QUERY_TYPES, 1)
+    unknown = set(query_mix) - set(QUERY_TYPES)
+    if unknown:
+        raise ValueError(
+            "Unknown query types {}. Please use: {}".format(
+                sorted(unknown), " | ".join(QUERY_TYPES)
+            )
+        )
+    total = sum(query_mix.values())
+    if total <= 0:
+        raise ValueError("The query mix needs at least one positive weight")
+    if query_count is None:
+        query_count = size
+
+    weight = min(max(skew / CLUSTERED_SKEW, 0), 1)
+
+    def cost(name, key):
+        uniform = _interpolate(COSTS["uniform"][name][key], size)
+        clustered = _interpolate(COSTS["clustered"][name][key], size)
+        return (1 - weight) * uniform + weight * clustered
+
+    estimates = {}
+    for name in BACKENDS:
+        micros = cost(name, "build") * size
+        for query_type, share in query_mix.items():
+            micros += query_count * share / total * cost(name, query_type)
+        estimates[name] = micros / 1e6
+
+    return estimates
+
+
+def choose_backend(points, query_mix=None, query_count=None):
+    """
+    Picks the cheapest backend for a dataset & a query workload.
+
+    Args:
+        points (list): The `(ident, x, y)` points to index.
+        query_mix (dict): Optional. The relative frequency of each of
+            `QUERY_TYPES`. Default is `None` (an even mix).
+        query_count (int): Optional. The number of queries expected. Default
+            is `None` (as many as points).
+
+    Returns:
+        dict: The chosen `backend` name, the `reason`, the data's `size` &
+            `skew` and the `estimates` (in seconds) of every backend.
+    """
+    if not points:
+        return {
+            "backend": ScanIndex.name, "reason": "no points to index",
+            "size": 0, "skew": 0.0, "estimates": {},
+        }
+
+    skew = skewness([x for _, x, _ in points], [y for _, _, y in points])
+    estimates = estimate_costs(len(points), skew, query_mix, query_count)
+    backend = min(estimates, key=estimates.get)
+    others = ", ".join(
+        "{} {:.3f}s".format(name, estimate)
+        for name, estimate in sorted(estimates.items(), key=lambda item: item[1])
+        if name != backend
+    )
+    reason = "lowest estimated cost for {} points at skew {:.2f}: {:.3f}s vs {}".format(
+        len(points), skew, estimates[backend], others,
+    )
+    return {
+        "backend": backend, "reason": reason, "size": len(points),
+        "skew": skew, "estimates": estimates,
+    }
+
+
+def create_index(points, backend="auto", query_mix=None, query_count=None):
+    """
+    Builds a `SpatialIndex` over points.
+
+    Args:
+        points (iterable): The `(ident, x, y)` points to index.
+        backend (str): Optional. `"auto"` to pick by `choose_backend`, or one
+            of `BACKENDS`. Default is `"auto"`.
+        query_mix (dict): Optional. For `"auto"`, the relative frequency of
+            each of `QUERY_TYPES`. Default is `None` (an even mix).
+        query_count (int): Optional. For `"auto"`, the number of queries
+            expected. Default is `None` (as many as points).
+
+    Returns:
+        SpatialIndex: The built index. With `"auto"`, the outcome of
+            `choose_backend` is kept on it as `selection`.
+    """
+    points = list(points)
+    selection = None
+
+    if backend == "auto":
+        selection = choose_backend(points, query_mix, query_count)
+        backend = selection["backend"]
+    elif backend not in BACKENDS:
+        raise ValueError(
+            "Unknown backend {!r}. Please use one of: auto | {}".format(
+                backend, " | ".join(BACKENDS)
+            )
+        )
+
+    index = BACKENDS[backend]()
+    index.build(points)
+    index.selection = selection
+    return index
+
+
+if __name__ == "__main__":
+    # Regenerates the `COSTS` table.
+    import json
+
+    print(json.dumps(measure_costs(), indent=4))